@@ -0,0 +1,223 @@
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import ExtractYear
+from .features import feature_store, FEATURE_COLUMNS
+from .loaders import CHUNK_SIZE, PRICE_HISTORY_DTYPE, _as_float
+from .models import HistoricalPrice
+
+# On-disk encoding of each archived column
+ARCHIVE_COLUMNS = {
+    'date': np.int32,  # Days since 1970-01-01
+    'location': np.int32,  # Index into the location dictionary
+    'market_price': np.float32,
+    'volume_traded': np.float32,
+}
+
+
+class PriceArchive:
+    """Columnar copy of HistoricalPrice partitioned by product and year
+
+    Every partition directory holds one ``.npy`` file per column, sorted by
+    location and date, plus the fingerprint of the rows it was written from.
+    Locations are stored as codes into an append-only dictionary shared by
+    all partitions. Readers memory-map the columns, so training and
+    backtests run from local files instead of the database.
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+        self._locations = None
+
+    @property
+    def root(self):
+        return Path(self._root or settings.ANALYTICS_PRICE_ARCHIVE_DIR)
+
+    def partition_dir(self, product_id, year):
+        return self.root / f'product={int(product_id)}' / f'year={int(year)}'
+
+    def locations(self):
+        """Location dictionary, position in the list is the stored code"""
+        # Reload when another process appended locations since we read it
+        path = self.root / 'locations.json'
+        try:
+            modified = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            modified = None
+        if self._locations is None or self._locations[0] != modified:
+            locations = json.loads(path.read_text()) if modified is not None else []
+            self._locations = (modified, locations)
+        return self._locations[1]
+
+    def _location_codes(self):
+        return {location: code for code, location in enumerate(self.locations())}
+
+    def _save_locations(self, locations):
+        self.root.mkdir(parents=True, exist_ok=True)
+        staging = self.root / f'.locations.{uuid.uuid4().hex}'
+        staging.write_text(json.dumps(locations))
+        os.replace(staging, self.root / 'locations.json')
+        self._locations = None
+
+    @staticmethod
+    def source_fingerprints():
+        """Cheap per-partition fingerprint of the rows in the database"""
+        stats = HistoricalPrice.objects.annotate(
+            year=ExtractYear('date')
+        ).values('product_id', 'year').annotate(
+            rows=Count('id'),
+            price_total=Sum('market_price'),
+            volume_total=Sum('volume_traded'),
+            last_created=Max('created_at')
+        ).order_by()
+        return {
+            (row['product_id'], row['year']):
+                f"{row['rows']}:{row['price_total']}:{row['volume_total']}:{row['last_created'].isoformat()}"
+            for row in stats
+        }
+
+    def stored_fingerprint(self, product_id, year):
+        try:
+            meta = json.loads((self.partition_dir(product_id, year) / 'meta.json').read_text())
+        except FileNotFoundError:
+            return None
+        return meta['fingerprint']
+
+    def partitions(self):
+        """Every archived (product_id, year)"""
+        if not self.root.exists():
+            return []
+        return sorted(
+            (int(product.name.split('=')[1]), int(year.name.split('=')[1]))
+            for product in self.root.glob('product=*')
+            for year in product.glob('year=*')
+        )
+
+    def refresh(self, full=False):
+        """Rewrite the partitions whose rows changed and drop deleted ones
+
+        Returns the number of partitions written and removed.
+        """
+        fingerprints = self.source_fingerprints()
+        written = 0
+        for (product_id, year), fingerprint in sorted(fingerprints.items()):
+            if full or self.stored_fingerprint(product_id, year) != fingerprint:
+                self.write_partition(product_id, year, fingerprint)
+                written += 1
+
+        removed = 0
+        for product_id, year in self.partitions():
+            if (product_id, year) not in fingerprints:
+                shutil.rmtree(self.partition_dir(product_id, year), ignore_errors=True)
+                removed += 1
+        return written, removed
+
+    def write_partition(self, product_id, year, fingerprint):
+        """Export one product/year from the database into column files"""
+        locations = self.locations()
+        codes = {location: code for code, location in enumerate(locations)}
+        known = len(codes)
+
+        def encoded_rows():
+            rows = HistoricalPrice.objects.filter(
+                product_id=product_id,
+                date__year=year
+            ).values_list(
+                'date', 'location', _as_float('market_price'), _as_float('volume_traded')
+            ).iterator(chunk_size=CHUNK_SIZE)
+            for day, location, market_price, volume_traded in rows:
+                if location not in codes:
+                    codes[location] = len(codes)
+                    locations.append(location)
+                yield np.datetime64(day, 'D').astype(np.int64), codes[location], market_price, volume_traded
+
+        records = np.fromiter(encoded_rows(), dtype=np.dtype([
+            (name, dtype) for name, dtype in ARCHIVE_COLUMNS.items()
+        ]))
+        # Sort by location code so each pair is a contiguous run of dates
+        records = records[np.lexsort((records['date'], records['location']))]
+        # New codes must be durable before any partition refers to them
+        if len(codes) > known:
+            self._save_locations(locations)
+
+        target = self.partition_dir(product_id, year)
+        staging = target.with_name(f'.{target.name}.{uuid.uuid4().hex}')
+        staging.mkdir(parents=True)
+        for name in ARCHIVE_COLUMNS:
+            np.save(staging / f'{name}.npy', np.ascontiguousarray(records[name]))
+        (staging / 'meta.json').write_text(json.dumps({
+            'fingerprint': fingerprint,
+            'rows': len(records),
+        }))
+
+        # Swap the finished directory in, readers see the old or the new one
+        if target.exists():
+            retired = target.with_name(f'.{target.name}.retired.{uuid.uuid4().hex}')
+            os.replace(target, retired)
+            os.replace(staging, target)
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            os.replace(staging, target)
+
+    def read_partition(self, product_id, year):
+        """Memory-mapped columns of one partition"""
+        path = self.partition_dir(product_id, year)
+        return {name: np.load(path / f'{name}.npy', mmap_mode='r') for name in ARCHIVE_COLUMNS}
+
+    def pairs(self, product_id=None):
+        """Every archived (product_id, location)"""
+        locations = self.locations()
+        pairs = set()
+        for archived_product, year in self.partitions():
+            if product_id is not None and archived_product != int(product_id):
+                continue
+            codes = np.unique(self.read_partition(archived_product, year)['location'])
+            pairs.update((archived_product, locations[code]) for code in codes)
+        return sorted(pairs)
+
+    def load_history(self, product_id, location):
+        """Raw price rows for a pair, ordered by date, like load_price_history"""
+        code = self._location_codes().get(location)
+        chunks = []
+        for archived_product, year in self.partitions():
+            if archived_product != int(product_id) or code is None:
+                continue
+            columns = self.read_partition(product_id, year)
+
+            # Rows are sorted by location, so the pair is one contiguous slice
+            start, stop = np.searchsorted(columns['location'], [code, code + 1])
+            chunk = np.empty(stop - start, dtype=PRICE_HISTORY_DTYPE)
+            chunk['date'] = columns['date'][start:stop].astype('datetime64[D]')
+            chunk['market_price'] = columns['market_price'][start:stop]
+            chunk['volume_traded'] = columns['volume_traded'][start:stop]
+            chunks.append(chunk)
+        if not chunks:
+            return np.empty(0, dtype=PRICE_HISTORY_DTYPE)
+        return np.concatenate(chunks)
+
+    def load_frame(self, product_id, location):
+        """Price features computed from the archive, like PriceFeatureStore.load_frame"""
+        history = self.load_history(product_id, location)
+
+        # One row per day, averaging across sources
+        days, first, counts = np.unique(history['date'], return_index=True, return_counts=True)
+        if len(days) == 0:
+            return pd.DataFrame(columns=FEATURE_COLUMNS)
+        daily = pd.DataFrame({
+            'date': days,
+            'market_price': np.add.reduceat(history['market_price'], first) / counts,
+            'volume_traded': np.add.reduceat(history['volume_traded'], first),
+        })
+
+        df = feature_store.compute_features(daily)[FEATURE_COLUMNS]
+        # Skip the warm-up days, as the database loader does
+        return df.dropna(subset=['price_ma7', 'price_ma30', 'volume_ma7']).reset_index(drop=True)
+
+
+price_archive = PriceArchive()
@@ -0,0 +1,131 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from marketplace.models import Listing
+from .models import HistoricalPrice, PricePrediction, DemandForecast
+from .services import MarketAnalyticsService
+
+# Pairs without a price in this many days are not considered active
+ACTIVE_WINDOW_DAYS = 90
+
+# Longest horizon one item of a batch price forecast may ask for
+MAX_FORECAST_DAYS = 90
+
+
+def active_pairs(since=None):
+    """Every (product_id, location) with recent prices or an active listing"""
+    since = since or timezone.now().date() - timedelta(days=ACTIVE_WINDOW_DAYS)
+    pairs = set(
+        HistoricalPrice.objects.filter(date__gte=since)
+        .values_list('product_id', 'location').distinct()
+    )
+    pairs.update(
+        Listing.objects.filter(status='ACTIVE')
+        .values_list('product_id', 'location').distinct()
+    )
+    return sorted(pairs)
+
+
+def completed_pairs(start_date, price_days, demand_days):
+    """Pairs whose stored forecasts already cover the full horizon"""
+    price_done = set(
+        PricePrediction.objects.filter(
+            predicted_for=start_date + timedelta(days=price_days - 1),
+            created_at__date=timezone.now().date()
+        ).values_list('product_id', 'location')
+    )
+    demand_done = set(
+        DemandForecast.objects.filter(
+            forecast_for=start_date + timedelta(days=demand_days - 1),
+            created_at__date=timezone.now().date()
+        ).values_list('product_id', 'location')
+    )
+    return price_done & demand_done
+
+
+def forecast_pair(product_id, location, start_date, price_days, demand_days):
+    """Train and forecast a single pair, timing each stage
+
+    Runs inside a worker process, so failures are reported in the result
+    rather than raised.
+    """
+    service = MarketAnalyticsService()
+    result = {'product_id': product_id, 'location': location, 'errors': {}}
+    
+    started = time.monotonic()
+    try:
+        service.forecast_price_range(product_id, location, start_date, price_days)
+    except Exception as e:
+        result['errors']['price'] = str(e)
+    result['price_seconds'] = time.monotonic() - started
+    
+    started = time.monotonic()
+    try:
+        service.predict_demand_range(product_id, location, start_date, demand_days)
+    except Exception as e:
+        result['errors']['demand'] = str(e)
+    result['demand_seconds'] = time.monotonic() - started
+    
+    # Drop the fitted models, the worker moves on to a different pair
+    service.registry.invalidate(product_id, location)
+    return result
+
+
+def _forecast_group(product_id, location, items, start_date, engine):
+    """Forecast the longest horizon of a pair once and slice it per item"""
+    try:
+        service = MarketAnalyticsService(engine=engine)
+        predictions = service.forecast_price_range(
+            product_id, location, start_date, max(item['days'] for item in items)
+        )
+        return [
+            {**item, 'predictions': predictions[:item['days']]}
+            for item in items
+        ]
+    except Exception as e:
+        return [{**item, 'error': str(e)} for item in items]
+    finally:
+        # Worker threads open their own connection, release it with the task
+        connection.close()
+
+
+def forecast_price_batch(items, start_date, engine=None, max_workers=None):
+    """Yield price forecasts for many (product, location, days) items
+
+    Items sharing a product and location share one model and one forecast,
+    groups run concurrently on a bounded thread pool and results are yielded
+    as each group completes. Per-item failures are yielded with an ``error``
+    key instead of raising.
+    """
+    max_workers = max_workers or getattr(settings, 'ANALYTICS_BATCH_WORKERS', 4)
+    groups = defaultdict(list)
+    for index, item in enumerate(items):
+        try:
+            entry = {
+                'index': index,
+                'product_id': int(item['product_id']),
+                'location': str(item['location']),
+                'days': int(item.get('days', 7)),
+            }
+            if not 1 <= entry['days'] <= MAX_FORECAST_DAYS:
+                raise ValueError(f'days must be between 1 and {MAX_FORECAST_DAYS}')
+        except (KeyError, TypeError, ValueError) as e:
+            yield {'index': index, 'error': f'Invalid item: {e}'}
+            continue
+        groups[(entry['product_id'], entry['location'])].append(entry)
+    
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [
+            executor.submit(_forecast_group, product_id, location, group, start_date, engine)
+            for (product_id, location), group in groups.items()
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        # Stop pending work if the client goes away mid-stream
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,355 @@
+import platform
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIRequestFactory, force_authenticate
+from marketplace.models import Product, Listing, Order
+from .archive import price_archive
+from .engines import ENGINES, get_engine
+from .features import feature_store
+from .loaders import load_daily_demand
+from .model_store import model_store
+from .models import HistoricalPrice, PricePrediction, DemandForecast
+from .registry import model_registry
+from .rollups import rollup_store
+from .services import (
+    MarketAnalyticsService, PRICE_FEATURES, DEMAND_FEATURES,
+    price_horizon_frame, demand_history_frame
+)
+
+User = get_user_model()
+
+BATCH_SIZE = 10000
+# Rows per CASE expression when rewriting generated timestamps
+UPDATE_BATCH_SIZE = 1000
+
+
+class MarketDataGenerator:
+    """Seeded synthetic products, mandi prices and orders
+
+    Prices follow a yearly seasonal curve with noise per (product, location)
+    and demand follows a weekly pattern, so the generated data exercises the
+    same code paths as real market data.
+    """
+
+    def __init__(self, products=10, locations=5, years=2, orders_per_day=5, seed=42,
+                 end_date=None):
+        self.products = products
+        self.locations = locations
+        self.years = years
+        self.orders_per_day = orders_per_day
+        self.rng = np.random.default_rng(seed)
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(days=365 * years - 1)
+        self.pairs = []
+        self.counts = {'products': 0, 'prices': 0, 'orders': 0}
+
+    def generate(self):
+        farmer = User.objects.create_user(username='benchmark-farmer', password=None)
+        buyer = User.objects.create_user(username='benchmark-buyer', password=None)
+        location_names = [f'Benchmark Mandi {i}' for i in range(self.locations)]
+        days = (self.end_date - self.start_date).days + 1
+        day_offsets = np.arange(days)
+        
+        for p in range(self.products):
+            product = Product.objects.create(
+                name=f'Benchmark Product {p}',
+                category=Product.CATEGORY_CHOICES[p % len(Product.CATEGORY_CHOICES)][0],
+                description='Synthetic benchmark product'
+            )
+            self.counts['products'] += 1
+            
+            for location in location_names:
+                self._generate_prices(product, location, day_offsets)
+                listing = Listing.objects.create(
+                    farmer=farmer,
+                    product=product,
+                    quantity=100000,
+                    price_per_unit=20,
+                    unit='kg',
+                    location=location,
+                    harvest_date=self.start_date,
+                    available_from=self.start_date
+                )
+                self._generate_orders(listing, buyer, day_offsets)
+                self.pairs.append((product.id, location))
+        return self.pairs
+
+    def _generate_prices(self, product, location, day_offsets):
+        base = self.rng.uniform(10, 80)
+        seasonal = 1 + 0.2 * np.sin(2 * np.pi * day_offsets / 365 + self.rng.uniform(0, 2 * np.pi))
+        prices = np.round(base * seasonal * self.rng.normal(1, 0.05, len(day_offsets)), 2)
+        volumes = np.round(self.rng.gamma(2.0, 50.0, len(day_offsets)), 2)
+        
+        rows = [
+            HistoricalPrice(
+                product=product,
+                date=self.start_date + timedelta(days=int(offset)),
+                market_price=Decimal(str(price)),
+                volume_traded=Decimal(str(volume)),
+                source='Mandi',
+                location=location
+            )
+            for offset, price, volume in zip(day_offsets, prices, volumes)
+        ]
+        HistoricalPrice.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        self.counts['prices'] += len(rows)
+        
+        # Bulk writes skip the signal handlers
+        feature_store.refresh(product.id, location)
+        rollup_store.refresh(product.id, location)
+
+    def _generate_orders(self, listing, buyer, day_offsets):
+        weekly = np.array([1.0, 0.9, 0.9, 1.0, 1.1, 1.3, 1.4])
+        counts = self.rng.poisson(
+            self.orders_per_day * weekly[(day_offsets + self.start_date.weekday()) % 7]
+        )
+        
+        rows = []
+        for offset, count in zip(day_offsets, counts):
+            day = self.start_date + timedelta(days=int(offset))
+            for minute in self.rng.integers(0, 24 * 60, count):
+                quantity = round(float(self.rng.uniform(1, 50)), 2)
+                rows.append(Order(
+                    buyer=buyer,
+                    listing=listing,
+                    quantity=Decimal(str(quantity)),
+                    total_price=Decimal(str(round(quantity * 20, 2))),
+                    delivery_address=listing.location,
+                    status='DELIVERED',
+                    created_at=datetime.combine(day, dt_time(), tzinfo=timezone.utc)
+                    + timedelta(minutes=int(minute))
+                ))
+        
+        # auto_now_add stamps every insert with the current time, so write
+        # the generated timestamps back in a second pass
+        created_at = [row.created_at for row in rows]
+        Order.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        for row, timestamp in zip(rows, created_at):
+            row.created_at = timestamp
+        Order.objects.bulk_update(rows, ['created_at'], batch_size=UPDATE_BATCH_SIZE)
+        self.counts['orders'] += len(rows)
+
+
+def summarize(samples):
+    """Millisecond statistics for a list of durations in seconds"""
+    millis = [sample * 1000 for sample in samples]
+    return {
+        'runs': len(millis),
+        'mean_ms': round(statistics.mean(millis), 3),
+        'median_ms': round(statistics.median(millis), 3),
+        'min_ms': round(min(millis), 3),
+        'max_ms': round(max(millis), 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class AnalyticsBenchmark:
+    """Times the analytics service methods and views over generated pairs"""
+
+    def __init__(self, pairs, forecast_start, price_days=7, demand_days=30):
+        self.pairs = pairs
+        self.forecast_start = forecast_start
+        self.price_days = price_days
+        self.demand_days = demand_days
+        self.samples = {}
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def drop_models(self, product_id, location):
+        # Both the in-process registry and the on-disk store, so cold runs train
+        model_registry.invalidate(product_id, location)
+        model_store.invalidate(product_id, location)
+
+    def reset_caches(self, product_id, location):
+        self.drop_models(product_id, location)
+        PricePrediction.objects.filter(product_id=product_id, location=location).delete()
+        DemandForecast.objects.filter(product_id=product_id, location=location).delete()
+
+    def run_service(self):
+        for product_id, location in self.pairs:
+            self.reset_caches(product_id, location)
+            service = MarketAnalyticsService()
+            
+            self.record('prepare_price_features', timed(
+                service.prepare_price_features, product_id, location
+            ))
+            self.record('train_price_model', timed(
+                service.train_price_model, product_id, location
+            ))
+            self.record('predict_price_warm', timed(
+                service.predict_price, product_id, location, self.forecast_start
+            ))
+            
+            self.drop_models(product_id, location)
+            self.record('predict_price_cold', timed(
+                service.predict_price, product_id, location, self.forecast_start
+            ))
+            
+            self.record('predict_demand_cold', timed(
+                service.predict_demand, product_id, location, self.forecast_start
+            ))
+            self.record('predict_demand_warm', timed(
+                service.predict_demand, product_id, location,
+                self.forecast_start + timedelta(days=1)
+            ))
+
+    def run_views(self):
+        from .views import PricePredictionView, DemandForecastView
+        
+        factory = APIRequestFactory()
+        user = User.objects.get(username='benchmark-buyer')
+        endpoints = [
+            ('price_view', PricePredictionView.as_view(), self.price_days),
+            ('demand_view', DemandForecastView.as_view(), self.demand_days),
+        ]
+        
+        for product_id, location in self.pairs:
+            self.reset_caches(product_id, location)
+            for name, view, days in endpoints:
+                for phase in ('cold', 'warm'):
+                    request = factory.get('/', {
+                        'product_id': product_id, 'location': location, 'days': days
+                    })
+                    force_authenticate(request, user=user)
+                    started = time.perf_counter()
+                    response = view(request)
+                    self.record(f'{name}_{phase}', time.perf_counter() - started)
+                    if response.status_code != 200:
+                        raise RuntimeError(f'{name} failed: {response.data}')
+
+    def results(self, metadata):
+        return {
+            'meta': {
+                **metadata,
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'recorded_at': datetime.now(timezone.utc).isoformat(),
+            },
+            'timings': {name: summarize(samples) for name, samples in self.samples.items()},
+        }
+
+
+def compare(current, baseline):
+    """Per-timing ratio of the current median to the baseline median"""
+    ratios = {}
+    for name, stats in current['timings'].items():
+        previous = baseline.get('timings', {}).get(name)
+        if previous and previous['median_ms']:
+            ratios[name] = round(stats['median_ms'] / previous['median_ms'], 3)
+    return ratios
+
+
+def backtest_engine(name, history, features, target, horizon, future=None):
+    """Fit on all but the last `horizon` rows and score the held-out rows
+
+    Returns accuracy (MAE and MAPE) next to fit and predict latency.
+    """
+    train, test = history.iloc[:-horizon], history.iloc[-horizon:]
+    if future is None:
+        future = test
+    
+    started = time.perf_counter()
+    engine = get_engine(name).fit(train, features, target)
+    fit_seconds = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    predicted, _, _ = engine.predict(future)
+    predict_seconds = time.perf_counter() - started
+    
+    actual = test[target].to_numpy(dtype=float)
+    errors = np.abs(actual - predicted)
+    nonzero = actual != 0
+    return {
+        'fit_ms': fit_seconds * 1000,
+        'predict_ms': predict_seconds * 1000,
+        'mae': float(errors.mean()),
+        'mape': float((errors[nonzero] / np.abs(actual[nonzero])).mean()) if nonzero.any() else None,
+    }
+
+
+def compare_engines(pairs, horizon=7):
+    """Accuracy vs latency of every engine, averaged over the given pairs"""
+    samples = {}
+    for product_id, location in pairs:
+        prices = feature_store.load_frame(product_id, location)
+        prices['date'] = pd.to_datetime(prices['date'])
+        demand = demand_history_frame(load_daily_demand(product_id, location))
+        
+        for kind, history, features, target in (
+            ('price', prices, PRICE_FEATURES, 'market_price'),
+            ('demand', demand, DEMAND_FEATURES, 'quantity'),
+        ):
+            if len(history) <= horizon * 2:
+                continue
+            
+            future = None
+            if kind == 'price':
+                # Forecast the way production does, from the last known averages
+                future = price_horizon_frame(
+                    history.iloc[:-horizon], pd.DatetimeIndex(history['date'].iloc[-horizon:])
+                )
+            for name in ENGINES:
+                result = backtest_engine(name, history, features, target, horizon, future)
+                samples.setdefault((kind, name), []).append(result)
+    
+    report = {}
+    for (kind, name), results in samples.items():
+        report.setdefault(kind, {})[name] = average_backtests(results)
+    return report
+
+
+def average_backtests(results):
+    """Mean of backtest_engine results, MAPE only over the defined ones"""
+    average = {
+        metric: round(statistics.mean(r[metric] for r in results), 4)
+        for metric in ('fit_ms', 'predict_ms', 'mae')
+    }
+    mapes = [r['mape'] for r in results if r['mape'] is not None]
+    average['mape'] = round(statistics.mean(mapes), 4) if mapes else None
+    average['pairs'] = len(results)
+    return average
+
+
+def backtest_archived_prices(product_id, location, engines, horizon=7, folds=4, archive=None):
+    """Rolling-origin price backtest of one pair, read from the columnar archive
+
+    Each fold holds out the `horizon` days before the previous fold's cutoff,
+    so no database query is made. Returns the backtest_engine results per engine.
+    """
+    prices = (archive or price_archive).load_frame(product_id, location)
+    prices['date'] = pd.to_datetime(prices['date'])
+    
+    results = {}
+    for fold in range(folds):
+        history = prices.iloc[:len(prices) - fold * horizon]
+        if len(history) <= horizon * 2:
+            break
+        future = price_horizon_frame(
+            history.iloc[:-horizon], pd.DatetimeIndex(history['date'].iloc[-horizon:])
+        )
+        for name in engines:
+            results.setdefault(name, []).append(
+                backtest_engine(name, history, PRICE_FEATURES, 'market_price', horizon, future)
+            )
+    return results
@@ -0,0 +1,311 @@
+import pickle
+import numpy as np
+from scipy.signal import lfilter
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import RidgeCV
+from sklearn.preprocessing import StandardScaler
+
+# Share of the predictive distribution covered by the reported min/max range
+INTERVAL_COVERAGE = 0.8
+
+# Calendar features that are one-hot encoded by the linear engines
+CALENDAR_LEVELS = {'day_of_week': 7, 'month': 12}
+
+
+def _tail_percentiles():
+    tail = (1 - INTERVAL_COVERAGE) / 2 * 100
+    return tail, 100 - tail
+
+
+def _r2(y, fitted):
+    """Coefficient of determination clipped to [0, 1]"""
+    total = np.sum((y - y.mean()) ** 2)
+    if total == 0:
+        return 0.0
+    return float(np.clip(1 - np.sum((y - fitted) ** 2) / total, 0.0, 1.0))
+
+
+class ForecastEngine:
+    """Common interface of the forecasting engines
+
+    ``fit`` receives a date-ordered history frame holding a ``date`` column,
+    the feature columns and the target column. ``predict`` receives a frame
+    with ``date`` and the same features and returns the point forecasts with
+    the lower and upper interval bounds.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.features = None
+        self.confidence_score = 0.0
+
+    def fit(self, history, features, target):
+        raise NotImplementedError
+
+    def predict(self, future):
+        raise NotImplementedError
+
+    def estimate_bytes(self):
+        return len(pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class ResidualIntervalMixin:
+    """Intervals from the quantiles of the in-sample residuals"""
+
+    def _fit_residuals(self, y, fitted):
+        residuals = np.asarray(y - fitted)
+        residuals = residuals[~np.isnan(residuals)]
+        if len(residuals) == 0:
+            self.residual_bounds = (0.0, 0.0)
+        else:
+            self.residual_bounds = tuple(np.percentile(residuals, _tail_percentiles()))
+
+    def _with_interval(self, mean):
+        low, high = self.residual_bounds
+        return mean, mean + low, mean + high
+
+
+class FlatForest:
+    """The trees of a fitted forest packed into a handful of flat arrays
+
+    Node ids are global across trees, ``roots`` holds the first node of each
+    tree and leaves have ``children_left == -1``. Plain arrays can be saved as
+    ``.npy`` files and loaded memory-mapped, so processes reading the same
+    model share its pages instead of each unpickling a private copy.
+    """
+
+    ARRAYS = ('roots', 'children_left', 'children_right', 'feature', 'threshold', 'value')
+
+    def __init__(self, roots, children_left, children_right, feature, threshold, value):
+        self.roots = roots
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+
+    @classmethod
+    def from_estimators(cls, estimators):
+        trees = [estimator.tree_ for estimator in estimators]
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        def children(attr):
+            # Shift child ids into the global numbering, leaves stay at -1
+            return np.concatenate([
+                np.where(getattr(tree, attr) == -1, -1, getattr(tree, attr) + offset)
+                for tree, offset in zip(trees, offsets)
+            ]).astype(np.int32)
+
+        return cls(
+            roots=offsets.astype(np.int32),
+            children_left=children('children_left'),
+            children_right=children('children_right'),
+            feature=np.concatenate([tree.feature for tree in trees]).astype(np.int32),
+            threshold=np.concatenate([tree.threshold for tree in trees]),
+            value=np.concatenate([tree.value[:, 0, 0] for tree in trees]),
+        )
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def predict_trees(self, X):
+        """Per-tree predictions, shape (n_trees, n_samples)"""
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])
+        nodes = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+
+        # Walk every tree for every sample at once, one level per step
+        while True:
+            left = self.children_left[nodes]
+            inner = left != -1
+            if not inner.any():
+                break
+            feature = np.where(inner, self.feature[nodes], 0)
+            go_left = X[rows, feature] <= self.threshold[nodes]
+            nodes = np.where(inner, np.where(go_left, left, self.children_right[nodes]), nodes)
+        return self.value[nodes]
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays().values())
+
+
+class RandomForestEngine(ForecastEngine):
+    """Scaled features fed to a 100-tree forest, scored out-of-bag at fit time"""
+
+    name = 'random_forest'
+
+    def fit(self, history, features, target):
+        self.features = features
+        self.scaler = StandardScaler()
+        X = self.scaler.fit_transform(history[features])
+        forest = RandomForestRegressor(
+            n_estimators=100, random_state=42, oob_score=True
+        )
+        forest.fit(X, history[target].to_numpy())
+
+        score = getattr(forest, 'oob_score_', float('nan'))
+        self.confidence_score = 0.0 if np.isnan(score) else float(np.clip(score, 0.0, 1.0))
+
+        # Keep only the tree arrays, they are all prediction needs
+        self.forest = FlatForest.from_estimators(forest.estimators_)
+        return self
+
+    def predict(self, future):
+        # One pass over the trees gives both the mean and the spread
+        X = self.scaler.transform(future[self.features])
+        per_tree = self.forest.predict_trees(X)
+        low, high = np.percentile(per_tree, _tail_percentiles(), axis=0)
+        return per_tree.mean(axis=0), low, high
+
+    def estimate_bytes(self):
+        return self.forest.nbytes
+
+
+class SeasonalNaiveEngine(ResidualIntervalMixin, ForecastEngine):
+    """Repeats the latest observation for the same weekday"""
+
+    name = 'seasonal_naive'
+    season = 7
+
+    def fit(self, history, features, target):
+        self.features = features
+        y = history[target].to_numpy(dtype=float)
+        day_of_week = history['date'].dt.dayofweek.to_numpy()
+
+        # Latest value seen for each weekday, falling back to the last value
+        self.last_by_weekday = np.full(self.season, y[-1] if len(y) else 0.0)
+        for weekday, value in zip(day_of_week, y):
+            self.last_by_weekday[weekday] = value
+
+        fitted = np.full(len(y), np.nan)
+        fitted[self.season:] = y[:-self.season]
+        self._fit_residuals(y, fitted)
+        mask = ~np.isnan(fitted)
+        self.confidence_score = _r2(y[mask], fitted[mask]) if mask.any() else 0.0
+        return self
+
+    def predict(self, future):
+        mean = self.last_by_weekday[future['date'].dt.dayofweek.to_numpy()]
+        return self._with_interval(mean)
+
+
+class ExponentialSmoothingEngine(ResidualIntervalMixin, ForecastEngine):
+    """Simple exponential smoothing of the level plus a weekday profile
+
+    The smoothing factor is picked from a small grid by one-step-ahead error,
+    using a linear filter so the whole grid is evaluated without a Python
+    loop over the history.
+    """
+
+    name = 'exp_smoothing'
+    alphas = (0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9)
+
+    @staticmethod
+    def _levels(y, alpha):
+        # l_t = alpha * y_t + (1 - alpha) * l_{t-1}, seeded with the first value
+        levels, _ = lfilter([alpha], [1, alpha - 1], y[1:], zi=[(1 - alpha) * y[0]])
+        return np.concatenate([[y[0]], levels])
+
+    def fit(self, history, features, target):
+        self.features = features
+        y = history[target].to_numpy(dtype=float)
+        day_of_week = history['date'].dt.dayofweek.to_numpy()
+
+        best = None
+        for alpha in self.alphas:
+            levels = self._levels(y, alpha)
+            one_step = np.concatenate([[y[0]], levels[:-1]])
+            error = np.sum((y - one_step) ** 2)
+            if best is None or error < best[0]:
+                best = (error, alpha, levels, one_step)
+        _, self.alpha, levels, one_step = best
+
+        # Average deviation from the level on each weekday
+        deviations = y - one_step
+        counts = np.bincount(day_of_week, minlength=7)
+        sums = np.bincount(day_of_week, weights=deviations, minlength=7)
+        self.weekday_profile = np.divide(sums, counts, out=np.zeros(7), where=counts > 0)
+        self.level = levels[-1]
+
+        fitted = one_step + self.weekday_profile[day_of_week]
+        self._fit_residuals(y, fitted)
+        self.confidence_score = _r2(y, fitted)
+        return self
+
+    def predict(self, future):
+        mean = self.level + self.weekday_profile[future['date'].dt.dayofweek.to_numpy()]
+        return self._with_interval(mean)
+
+
+class RidgeEngine(ResidualIntervalMixin, ForecastEngine):
+    """Ridge regression on one-hot calendar features and scaled numeric features
+
+    Confidence comes from the closed-form leave-one-out error of RidgeCV.
+    """
+
+    name = 'ridge'
+    alphas = (0.1, 1.0, 10.0, 100.0)
+
+    def _raw_design(self, frame):
+        columns = []
+        for feature in self.features:
+            values = frame[feature].to_numpy()
+            if feature in CALENDAR_LEVELS:
+                offset = 1 if feature == 'month' else 0
+                columns.append(np.eye(CALENDAR_LEVELS[feature])[values.astype(int) - offset])
+            else:
+                columns.append(values.astype(float).reshape(-1, 1))
+        return np.hstack(columns)
+
+    def _design(self, frame):
+        X = self._raw_design(frame)
+        X[:, self.numeric] = (X[:, self.numeric] - self.means) / self.scales
+        return X
+
+    def fit(self, history, features, target):
+        self.features = features
+        X = self._raw_design(history)
+        y = history[target].to_numpy(dtype=float)
+
+        # Standardize only the numeric columns, one-hot columns stay 0/1
+        self.numeric = []
+        width = 0
+        for feature in features:
+            if feature in CALENDAR_LEVELS:
+                width += CALENDAR_LEVELS[feature]
+            else:
+                self.numeric.append(width)
+                width += 1
+        self.means = X[:, self.numeric].mean(axis=0)
+        self.scales = X[:, self.numeric].std(axis=0)
+        self.scales[self.scales == 0] = 1.0
+        X[:, self.numeric] = (X[:, self.numeric] - self.means) / self.scales
+
+        self.model = RidgeCV(alphas=self.alphas).fit(X, y)
+        loo_mse = -self.model.best_score_
+        self.confidence_score = float(np.clip(1 - loo_mse / y.var(), 0.0, 1.0)) if y.var() else 0.0
+        self._fit_residuals(y, self.model.predict(X))
+        return self
+
+    def predict(self, future):
+        return self._with_interval(self.model.predict(self._design(future)))
+
+
+ENGINES = {
+    engine.name: engine
+    for engine in (RandomForestEngine, SeasonalNaiveEngine, ExponentialSmoothingEngine, RidgeEngine)
+}
+
+DEFAULT_ENGINE = RandomForestEngine.name
+
+
+def get_engine(name=None):
+    """Instantiate a forecasting engine by name"""
+    name = name or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f'Unknown forecasting engine: {name}')
+    return ENGINES[name]()
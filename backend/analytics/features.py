@@ -0,0 +1,126 @@
+import pandas as pd
+from django.db import transaction
+from django.db.models import Avg, Sum, FloatField
+from django.db.models.functions import Cast
+from .loaders import load_price_features
+from .models import HistoricalPrice, PriceFeature
+
+# Longest rolling window, i.e. how much history a refresh has to look back on
+LONGEST_WINDOW = 30
+
+FEATURE_COLUMNS = [
+    'date', 'market_price', 'volume_traded', 'day_of_week', 'month', 'year',
+    'price_ma7', 'price_ma30', 'volume_ma7',
+]
+
+
+class PriceFeatureStore:
+    """Incrementally maintained daily price features
+
+    Features for a (product, location) are recomputed only from the first
+    changed date onwards, reading just the trailing window of history needed
+    by the longest moving average before it.
+    """
+
+    def _window_start(self, product_id, location, since):
+        """Earliest date whose prices still feed the rolling windows at `since`"""
+        previous_dates = HistoricalPrice.objects.filter(
+            product_id=product_id,
+            location=location,
+            date__lt=since
+        ).values_list('date', flat=True).distinct().order_by('-date')
+        
+        trailing = list(previous_dates[:LONGEST_WINDOW - 1])
+        return trailing[-1] if trailing else since
+
+    def refresh(self, product_id, location, since=None):
+        """Recompute and upsert features for dates on or after `since`
+
+        Passing ``since=None`` rebuilds the whole history for the pair.
+        Returns the number of feature rows written.
+        """
+        # A pair that was never materialized needs its full history
+        if since is not None and not PriceFeature.objects.filter(
+            product_id=product_id, location=location
+        ).exists():
+            since = None
+        
+        prices = HistoricalPrice.objects.filter(
+            product_id=product_id,
+            location=location
+        )
+        if since is not None:
+            prices = prices.filter(date__gte=self._window_start(product_id, location, since))
+        
+        # One row per day, averaging across sources
+        daily = pd.DataFrame(list(
+            prices.values('date').annotate(
+                market_price=Cast(Avg('market_price'), FloatField()),
+                volume_traded=Cast(Sum('volume_traded'), FloatField())
+            ).order_by('date').values_list('date', 'market_price', 'volume_traded')
+        ), columns=['date', 'market_price', 'volume_traded'])
+        
+        stale = PriceFeature.objects.filter(product_id=product_id, location=location)
+        if since is not None:
+            stale = stale.filter(date__gte=since)
+        
+        if daily.empty:
+            stale.delete()
+            return 0
+        
+        df = self.compute_features(daily)
+        if since is not None:
+            df = df[df['date'] >= since]
+        
+        rows = [
+            PriceFeature(
+                product_id=product_id,
+                location=location,
+                **{
+                    column: (None if pd.isna(value) else value)
+                    for column, value in zip(FEATURE_COLUMNS, record)
+                }
+            )
+            for record in df[FEATURE_COLUMNS].itertuples(index=False)
+        ]
+        
+        with transaction.atomic():
+            # Drop days whose prices have all been deleted
+            stale.exclude(date__in=list(df['date'])).delete()
+            PriceFeature.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['product', 'location', 'date'],
+                update_fields=FEATURE_COLUMNS[1:] + ['updated_at']
+            )
+        return len(rows)
+
+    @staticmethod
+    def compute_features(daily):
+        """Add calendar and rolling features to a date-ordered daily price frame"""
+        df = daily.copy()
+        
+        # Add time-based features
+        dates = pd.to_datetime(df['date'])
+        df['day_of_week'] = dates.dt.dayofweek
+        df['month'] = dates.dt.month
+        df['year'] = dates.dt.year
+        
+        # Add moving averages
+        df['price_ma7'] = df['market_price'].rolling(window=7).mean()
+        df['price_ma30'] = df['market_price'].rolling(window=LONGEST_WINDOW).mean()
+        
+        # Add volume features
+        df['volume_ma7'] = df['volume_traded'].rolling(window=7).mean()
+        return df
+
+    def load_frame(self, product_id, location):
+        """Read ready-made feature rows, backfilling the pair on first use"""
+        features = PriceFeature.objects.filter(product_id=product_id, location=location)
+        if not features.exists():
+            self.refresh(product_id, location)
+        
+        return pd.DataFrame(load_price_features(product_id, location))
+
+
+feature_store = PriceFeatureStore()
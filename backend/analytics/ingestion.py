@@ -0,0 +1,189 @@
+import csv
+import io
+import json
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from marketplace.models import Product
+from .features import feature_store
+from .models import HistoricalPrice
+from .model_store import model_store
+from .registry import model_registry
+from .rollups import rollup_store
+
+# Cap on the rejected rows kept for the report, the rest are only counted
+MAX_REJECTED_SAMPLES = 100
+
+
+class IngestionReport:
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self.rejected_samples = []
+        self.pairs_refreshed = 0
+        self.started_at = time.monotonic()
+        self.elapsed = 0.0
+
+    def reject(self, line_number, reason):
+        self.rows_rejected += 1
+        if len(self.rejected_samples) < MAX_REJECTED_SAMPLES:
+            self.rejected_samples.append({'line': line_number, 'error': reason})
+
+    @property
+    def rows_per_sec(self):
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows_read': self.rows_read,
+            'rows_written': self.rows_written,
+            'rows_rejected': self.rows_rejected,
+            'rejected_samples': self.rejected_samples,
+            'pairs_refreshed': self.pairs_refreshed,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+class PriceIngestionService:
+    """Streams CSV or NDJSON price feeds into HistoricalPrice
+
+    Rows are read lazily and written in chunks with an upsert on the
+    (product, date, source, location) constraint, so memory stays bounded by
+    the chunk size regardless of the size of the feed.
+    """
+
+    FORMATS = ('csv', 'ndjson')
+
+    def __init__(self, chunk_size=5000, default_source='Mandi'):
+        self.chunk_size = chunk_size
+        self.default_source = default_source
+        # Resolve product names without a query per row
+        self.product_ids = {
+            name.strip().lower(): product_id
+            for product_id, name in Product.objects.values_list('id', 'name')
+        }
+        self.known_product_ids = set(self.product_ids.values())
+
+    @classmethod
+    def detect_format(cls, filename):
+        if filename.endswith(('.ndjson', '.jsonl')):
+            return 'ndjson'
+        return 'csv'
+
+    def read_records(self, stream, fmt):
+        """Yield (line_number, record) pairs from a text stream"""
+        if fmt == 'csv':
+            for line_number, record in enumerate(csv.DictReader(stream), start=2):
+                yield line_number, record
+        elif fmt == 'ndjson':
+            for line_number, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    yield line_number, e
+        else:
+            raise ValueError(f'Unsupported format: {fmt}')
+
+    def parse_record(self, record):
+        """Convert a raw feed record into a HistoricalPrice instance"""
+        if isinstance(record, Exception):
+            raise ValueError(f'Malformed JSON: {record}')
+        if not isinstance(record, dict):
+            raise ValueError('Record is not an object')
+        
+        product_id = record.get('product_id')
+        if product_id not in (None, ''):
+            product_id = int(product_id)
+            if product_id not in self.known_product_ids:
+                raise ValueError(f'Unknown product id: {product_id}')
+        else:
+            name = (record.get('product') or '').strip().lower()
+            product_id = self.product_ids.get(name)
+            if product_id is None:
+                raise ValueError(f"Unknown product: {record.get('product')!r}")
+        
+        location = (record.get('location') or '').strip()
+        if not location:
+            raise ValueError('Missing location')
+        
+        try:
+            market_price = Decimal(str(record.get('market_price', record.get('price'))))
+            volume_traded = Decimal(str(record.get('volume_traded', record.get('volume', 0)) or 0))
+            if not (market_price.is_finite() and volume_traded.is_finite()):
+                raise InvalidOperation
+        except InvalidOperation:
+            raise ValueError('Invalid price or volume')
+        if market_price < 0 or volume_traded < 0:
+            raise ValueError('Invalid price or volume')
+        
+        return HistoricalPrice(
+            product_id=product_id,
+            date=date.fromisoformat(str(record.get('date', '')).strip()[:10]),
+            market_price=round(market_price, 2),
+            volume_traded=round(volume_traded, 2),
+            source=(record.get('source') or self.default_source).strip(),
+            location=location
+        )
+
+    def ingest(self, stream, fmt='csv'):
+        """Ingest a text stream and return an IngestionReport"""
+        report = IngestionReport()
+        touched = {}  # (product_id, location) -> earliest ingested date
+        chunk = {}
+        
+        for line_number, record in self.read_records(stream, fmt):
+            report.rows_read += 1
+            try:
+                price = self.parse_record(record)
+            except (ValueError, TypeError, InvalidOperation) as e:
+                report.reject(line_number, str(e))
+                continue
+            
+            # Later rows win when a feed repeats a key inside one chunk
+            chunk[(price.product_id, price.date, price.source, price.location)] = price
+            pair = (price.product_id, price.location)
+            if pair not in touched or price.date < touched[pair]:
+                touched[pair] = price.date
+            
+            if len(chunk) >= self.chunk_size:
+                report.rows_written += self._write_chunk(chunk)
+                chunk = {}
+        
+        if chunk:
+            report.rows_written += self._write_chunk(chunk)
+        
+        # Bulk writes bypass signals, so refresh derived data once per pair
+        for (product_id, location), since in touched.items():
+            model_registry.invalidate(product_id, location, 'price')
+            model_store.invalidate(product_id, location, 'price')
+            feature_store.refresh(product_id, location, since=since)
+            rollup_store.refresh(product_id, location, since=since)
+        report.pairs_refreshed = len(touched)
+        
+        report.elapsed = time.monotonic() - report.started_at
+        return report
+
+    def ingest_file(self, path, fmt=None):
+        fmt = fmt or self.detect_format(path)
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            return self.ingest(stream, fmt)
+
+    def ingest_upload(self, uploaded_file, fmt=None):
+        fmt = fmt or self.detect_format(uploaded_file.name)
+        stream = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+        return self.ingest(stream, fmt)
+
+    def _write_chunk(self, chunk):
+        with transaction.atomic():
+            HistoricalPrice.objects.bulk_create(
+                list(chunk.values()),
+                update_conflicts=True,
+                unique_fields=['product', 'date', 'source', 'location'],
+                update_fields=['market_price', 'volume_traded']
+            )
+        return len(chunk)
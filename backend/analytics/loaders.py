@@ -0,0 +1,90 @@
+import numpy as np
+from django.db.models import FloatField, Sum
+from django.db.models.functions import Cast, TruncDate
+from marketplace.models import Order
+from .models import HistoricalPrice, PriceFeature
+
+# Rows fetched per round trip from the server-side cursor
+CHUNK_SIZE = 20000
+
+PRICE_HISTORY_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'),
+    ('market_price', 'f8'),
+    ('volume_traded', 'f8'),
+])
+
+PRICE_FEATURE_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'),
+    ('market_price', 'f8'),
+    ('volume_traded', 'f8'),
+    ('day_of_week', 'i8'),
+    ('month', 'i8'),
+    ('year', 'i8'),
+    ('price_ma7', 'f8'),
+    ('price_ma30', 'f8'),
+    ('volume_ma7', 'f8'),
+])
+
+DAILY_DEMAND_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'),
+    ('quantity', 'f8'),
+])
+
+
+def _as_float(field_name):
+    # Cast in SQL so the driver hands back floats instead of Decimal objects
+    return Cast(field_name, FloatField())
+
+
+def _to_records(queryset, dtype):
+    """Stream a values_list queryset through a server-side cursor into a record array"""
+    rows = queryset.iterator(chunk_size=CHUNK_SIZE)
+    return np.fromiter(rows, dtype=dtype)
+
+
+def load_price_history(product_id, location):
+    """Raw price rows for a pair, ordered by date"""
+    queryset = HistoricalPrice.objects.filter(
+        product_id=product_id,
+        location=location
+    ).order_by('date').values_list(
+        'date',
+        _as_float('market_price'),
+        _as_float('volume_traded')
+    )
+    return _to_records(queryset, PRICE_HISTORY_DTYPE)
+
+
+def load_price_features(product_id, location, complete_only=True):
+    """Materialized feature rows for a pair, ordered by date
+
+    With ``complete_only`` the warm-up days whose moving averages are not
+    yet defined are skipped.
+    """
+    queryset = PriceFeature.objects.filter(
+        product_id=product_id,
+        location=location
+    )
+    if complete_only:
+        queryset = queryset.filter(
+            price_ma7__isnull=False,
+            price_ma30__isnull=False,
+            volume_ma7__isnull=False
+        )
+    queryset = queryset.order_by('date').values_list(*PRICE_FEATURE_DTYPE.names)
+    return _to_records(queryset, PRICE_FEATURE_DTYPE)
+
+
+def load_daily_demand(product_id, location):
+    """Total ordered quantity per day for a pair, aggregated in the database"""
+    queryset = Order.objects.filter(
+        listing__product_id=product_id,
+        listing__location=location
+    ).annotate(
+        day=TruncDate('created_at')
+    ).values(
+        'listing__product_id', 'listing__location', 'day'
+    ).annotate(
+        total_quantity=_as_float(Sum('quantity'))
+    ).order_by('day').values_list('day', 'total_quantity')
+    return _to_records(queryset, DAILY_DEMAND_DTYPE)
@@ -0,0 +1,83 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from analytics.archive import PriceArchive
+from analytics.benchmarks import average_backtests, backtest_archived_prices
+from analytics.engines import ENGINES
+
+
+def _close_inherited_connections():
+    # Workers only read archive files, they never need the parent's sockets
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Rolling-origin price backtest of the forecasting engines over the columnar archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=7,
+                            help='Held-out days per fold')
+        parser.add_argument('--folds', type=int, default=4,
+                            help='Rolling origins per pair')
+        parser.add_argument('--engines', default=','.join(ENGINES),
+                            help='Comma separated engine names')
+        parser.add_argument('--product', type=int, help='Only backtest this product')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes')
+        parser.add_argument('--path', help='Archive directory (defaults to ANALYTICS_PRICE_ARCHIVE_DIR)')
+        parser.add_argument('--refresh', action='store_true',
+                            help='Bring the archive up to date with the database first')
+        parser.add_argument('--output', help='Optional path for the JSON report')
+
+    def handle(self, *args, **options):
+        engines = [name for name in options['engines'].split(',') if name]
+        unknown = set(engines) - set(ENGINES)
+        if unknown:
+            raise CommandError(f'Unknown engines: {", ".join(sorted(unknown))}')
+        
+        archive = PriceArchive(root=options['path'])
+        if options['refresh']:
+            written, removed = archive.refresh()
+            self.stdout.write(f'Archive refreshed, {written} partitions written, {removed} removed')
+        
+        pairs = archive.pairs(options['product'])
+        if not pairs:
+            raise CommandError(f'No archived prices under {archive.root}, run export_price_archive first')
+        self.stdout.write(f'Backtesting {len(pairs)} pairs with {options["workers"]} workers')
+        
+        started = time.monotonic()
+        samples = {}
+        _close_inherited_connections()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            initializer=_close_inherited_connections
+        ) as executor:
+            futures = [
+                executor.submit(
+                    backtest_archived_prices, product_id, location, engines,
+                    options['horizon'], options['folds'], archive
+                )
+                for product_id, location in pairs
+            ]
+            for future in as_completed(futures):
+                for name, results in future.result().items():
+                    samples.setdefault(name, []).extend(results)
+        
+        report = {name: average_backtests(results) for name, results in samples.items()}
+        for name, stats in sorted(report.items(), key=lambda item: item[1]['mae']):
+            mape = f"{stats['mape'] * 100:6.1f}%" if stats['mape'] is not None else '    n/a'
+            self.stdout.write(
+                f"  {name:>15}: MAE {stats['mae']:10.3f}  MAPE {mape}  "
+                f"fit {stats['fit_ms']:8.2f} ms  predict {stats['predict_ms']:6.2f} ms  "
+                f"folds {stats['pairs']}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Finished {len(pairs)} pairs in {time.monotonic() - started:.1f}s'
+        ))
+        
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,84 @@
+import json
+import tempfile
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from analytics.benchmarks import MarketDataGenerator, AnalyticsBenchmark, compare
+
+
+class Command(BaseCommand):
+    help = 'Benchmark MarketAnalyticsService and the analytics views on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10)
+        parser.add_argument('--locations', type=int, default=5)
+        parser.add_argument('--years', type=int, default=2)
+        parser.add_argument('--orders-per-day', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--sample-pairs', type=int, default=5,
+                            help='Number of generated pairs to time')
+        parser.add_argument('--output', default='analytics-benchmark.json',
+                            help='Where to write the JSON results')
+        parser.add_argument('--compare', dest='baseline',
+                            help='Previous results file to compare against')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Commit the generated data instead of rolling it back')
+
+    def handle(self, *args, **options):
+        # Models of the synthetic pairs go to a throwaway store, not the shared one
+        with (
+            tempfile.TemporaryDirectory() as store_dir,
+            override_settings(ANALYTICS_MODEL_STORE_DIR=store_dir),
+            transaction.atomic(),
+        ):
+            generator = MarketDataGenerator(
+                products=options['products'],
+                locations=options['locations'],
+                years=options['years'],
+                orders_per_day=options['orders_per_day'],
+                seed=options['seed']
+            )
+            
+            started = time.perf_counter()
+            pairs = generator.generate()
+            generation_seconds = time.perf_counter() - started
+            self.stdout.write(
+                f"Generated {generator.counts['prices']} prices and "
+                f"{generator.counts['orders']} orders in {generation_seconds:.1f}s"
+            )
+            
+            benchmark = AnalyticsBenchmark(
+                pairs[:options['sample_pairs']],
+                forecast_start=generator.end_date + timedelta(days=1)
+            )
+            benchmark.run_service()
+            benchmark.run_views()
+            
+            results = benchmark.results({
+                'seed': options['seed'],
+                'products': options['products'],
+                'locations': options['locations'],
+                'years': options['years'],
+                'rows': generator.counts,
+                'generation_seconds': round(generation_seconds, 3),
+            })
+            
+            if not options['keep_data']:
+                transaction.set_rollback(True)
+        
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        
+        for name, stats in results['timings'].items():
+            self.stdout.write(f"{name:>24}: median {stats['median_ms']:10.2f} ms")
+        
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                ratios = compare(results, json.load(f))
+            self.stdout.write('Median ratio against baseline:')
+            for name, ratio in ratios.items():
+                self.stdout.write(f'{name:>24}: {ratio:.2f}x')
+        
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,90 @@
+import gc
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from analytics.loaders import load_price_history
+from analytics.models import HistoricalPrice
+from marketplace.models import Product
+
+BENCHMARK_LOCATION = 'benchmark-location'
+DAYS_PER_SOURCE = 3650
+
+
+class Command(BaseCommand):
+    help = 'Compare memory and wall time of the ORM and columnar price loaders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000,
+                            help='Synthetic HistoricalPrice rows to load')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Everything is rolled back so the benchmark leaves no data behind
+        with transaction.atomic():
+            product = self._generate(options['rows'], options['seed'])
+            
+            results = {
+                'orm_values': self._measure(lambda: self._load_with_values(product.id)),
+                'columnar': self._measure(lambda: load_price_history(product.id, BENCHMARK_LOCATION)),
+            }
+            transaction.set_rollback(True)
+        
+        for name, (seconds, peak_bytes) in results.items():
+            self.stdout.write(
+                f'{name:>12}: {seconds:8.2f}s  peak {peak_bytes / 1024 / 1024:8.1f} MiB'
+            )
+
+    def _generate(self, rows, seed):
+        self.stdout.write(f'Generating {rows} price rows...')
+        rng = np.random.default_rng(seed)
+        product = Product.objects.create(
+            name='Benchmark Product', category='VEGETABLES', description=''
+        )
+        start = date(2000, 1, 1)
+        prices = rng.uniform(10, 100, rows).round(2)
+        volumes = rng.uniform(0, 1000, rows).round(2)
+        
+        batch = []
+        for i in range(rows):
+            batch.append(HistoricalPrice(
+                product=product,
+                date=start + timedelta(days=i % DAYS_PER_SOURCE),
+                market_price=Decimal(str(prices[i])),
+                volume_traded=Decimal(str(volumes[i])),
+                source=f'source-{i // DAYS_PER_SOURCE}',
+                location=BENCHMARK_LOCATION
+            ))
+            if len(batch) == 10000:
+                HistoricalPrice.objects.bulk_create(batch)
+                batch = []
+        HistoricalPrice.objects.bulk_create(batch)
+        return product
+
+    @staticmethod
+    def _load_with_values(product_id):
+        # The previous loading path used by prepare_price_features
+        prices = HistoricalPrice.objects.filter(
+            product_id=product_id,
+            location=BENCHMARK_LOCATION
+        ).order_by('date')
+        df = pd.DataFrame(list(prices.values()))
+        df['market_price'] = df['market_price'].astype(float)
+        df['volume_traded'] = df['volume_traded'].astype(float)
+        return df
+
+    @staticmethod
+    def _measure(loader):
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = loader()
+        seconds = time.perf_counter() - started
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        return seconds, peak_bytes
@@ -0,0 +1,43 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from analytics.batch import active_pairs
+from analytics.benchmarks import MarketDataGenerator, compare_engines
+
+
+class Command(BaseCommand):
+    help = 'Compare accuracy and latency of the forecasting engines with a holdout backtest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', type=int, default=7,
+                            help='Held-out days per pair')
+        parser.add_argument('--max-pairs', type=int, default=20)
+        parser.add_argument('--synthetic', action='store_true',
+                            help='Backtest on generated data instead of the active pairs')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Optional path for the JSON report')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['synthetic']:
+                pairs = MarketDataGenerator(
+                    products=4, locations=5, years=2, seed=options['seed']
+                ).generate()
+            else:
+                pairs = active_pairs()
+            
+            report = compare_engines(pairs[:options['max_pairs']], options['horizon'])
+            transaction.set_rollback(True)
+        
+        for kind, engines in report.items():
+            self.stdout.write(f'{kind}:')
+            for name, stats in sorted(engines.items(), key=lambda item: item[1]['mae']):
+                mape = f"{stats['mape'] * 100:6.1f}%" if stats['mape'] is not None else '    n/a'
+                self.stdout.write(
+                    f"  {name:>15}: MAE {stats['mae']:10.3f}  MAPE {mape}  "
+                    f"fit {stats['fit_ms']:8.2f} ms  predict {stats['predict_ms']:6.2f} ms"
+                )
+        
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from analytics.archive import PriceArchive
+
+
+class Command(BaseCommand):
+    help = 'Export HistoricalPrice into the columnar archive, rewriting only changed partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rewrite every partition instead of only the changed ones')
+        parser.add_argument('--path', help='Archive directory (defaults to ANALYTICS_PRICE_ARCHIVE_DIR)')
+
+    def handle(self, *args, **options):
+        archive = PriceArchive(root=options['path'])
+        started = time.monotonic()
+        written, removed = archive.refresh(full=options['full'])
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} and removed {removed} partitions in '
+            f'{time.monotonic() - started:.1f}s under {archive.root}'
+        ))
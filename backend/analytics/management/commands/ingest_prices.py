@@ -0,0 +1,34 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from analytics.ingestion import PriceIngestionService
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or NDJSON market price feed into HistoricalPrice'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the price feed')
+        parser.add_argument('--format', choices=PriceIngestionService.FORMATS,
+                            help='Feed format, inferred from the file extension by default')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rows per bulk upsert')
+        parser.add_argument('--source', default='Mandi',
+                            help='Source recorded for rows that do not name one')
+
+    def handle(self, *args, **options):
+        service = PriceIngestionService(
+            chunk_size=options['chunk_size'],
+            default_source=options['source']
+        )
+        
+        try:
+            report = service.ingest_file(options['path'], options['format'])
+        except OSError as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingested {report.rows_written} rows in {report.elapsed:.1f}s '
+            f'({report.rows_per_sec:.0f} rows/sec), rejected {report.rows_rejected}'
+        ))
+        for sample in report.rejected_samples:
+            self.stdout.write(json.dumps(sample))
@@ -0,0 +1,70 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from django.core.management.base import BaseCommand
+from django.db import connections
+from analytics.batch import active_pairs, completed_pairs, forecast_pair
+
+
+def _close_inherited_connections():
+    # Forked workers must not share the parent's database sockets
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Train and forecast prices and demand for every active product/location pair'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes')
+        parser.add_argument('--price-days', type=int, default=7)
+        parser.add_argument('--demand-days', type=int, default=30)
+        parser.add_argument('--start-date', type=date.fromisoformat, default=None,
+                            help='First forecast date (defaults to today)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip pairs already forecast today for the full horizon')
+
+    def handle(self, *args, **options):
+        start_date = options['start_date'] or date.today()
+        price_days = options['price_days']
+        demand_days = options['demand_days']
+        
+        pairs = active_pairs()
+        if options['resume']:
+            done = completed_pairs(start_date, price_days, demand_days)
+            pairs = [pair for pair in pairs if pair not in done]
+            self.stdout.write(f'Resuming, {len(done)} pairs already forecast')
+        
+        total = len(pairs)
+        self.stdout.write(f'Forecasting {total} pairs with {options["workers"]} workers')
+        started = time.monotonic()
+        failures = 0
+        
+        _close_inherited_connections()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            initializer=_close_inherited_connections
+        ) as executor:
+            futures = [
+                executor.submit(
+                    forecast_pair, product_id, location,
+                    start_date, price_days, demand_days
+                )
+                for product_id, location in pairs
+            ]
+            
+            for completed, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                if result['errors']:
+                    failures += 1
+                self.stdout.write(
+                    f"[{completed}/{total}] product {result['product_id']} @ {result['location']}: "
+                    f"price {result['price_seconds']:.2f}s, demand {result['demand_seconds']:.2f}s"
+                    + (f" errors={result['errors']}" if result['errors'] else '')
+                )
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Finished {total} pairs in {elapsed:.1f}s, {failures} with errors'
+        ))
@@ -0,0 +1,136 @@
+import copy
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.utils.text import slugify
+from .engines import FlatForest
+from .registry import ModelEntry
+
+# Versions kept next to the current one, for workers still reading them
+KEEP_PREVIOUS_VERSIONS = 2
+
+
+class ModelStore:
+    """Versioned on-disk store of fitted models shared by worker processes
+
+    Each (product, location, kind) directory holds one sub-directory per saved
+    version and a ``CURRENT`` stamp naming the live one. Tree arrays are saved
+    as ``.npy`` files and loaded memory-mapped, so every worker reading a model
+    shares the same page-cache pages. Workers compare the stamp with the
+    version they hold and only reload when it moved.
+    """
+
+    def __init__(self, root=None):
+        self._root = root
+
+    @property
+    def root(self):
+        root = self._root
+        if root is None:
+            root = getattr(settings, 'ANALYTICS_MODEL_STORE_DIR', None)
+        return Path(root) if root else None
+
+    def pair_dir(self, product_id, location):
+        # The digest keeps locations that slugify alike apart
+        digest = hashlib.sha1(location.encode()).hexdigest()[:8]
+        return self.root / str(int(product_id)) / f'{slugify(location)}-{digest}'
+
+    def model_dir(self, product_id, location, kind):
+        # Kinds look like price/ridge, which maps onto nested directories
+        return self.pair_dir(product_id, location) / kind
+
+    def current_version(self, product_id, location, kind):
+        """Version named by the stamp, or None when nothing is stored"""
+        if self.root is None:
+            return None
+        try:
+            return (self.model_dir(product_id, location, kind) / 'CURRENT').read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def save(self, product_id, location, kind, model, metadata):
+        """Write a new version and point the stamp at it, returning the version"""
+        if self.root is None:
+            return None
+        base = self.model_dir(product_id, location, kind)
+        version = f'{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}'
+        staging = base / f'.{version}'
+        staging.mkdir(parents=True)
+
+        # Forest arrays go to their own files, the rest of the engine is small
+        forest = getattr(model, 'forest', None)
+        arrays = forest.arrays() if isinstance(forest, FlatForest) else {}
+        for name, array in arrays.items():
+            np.save(staging / f'{name}.npy', np.ascontiguousarray(array))
+        if arrays:
+            # Detach on a copy, other threads may be predicting with the model
+            model = copy.copy(model)
+            model.forest = None
+        with open(staging / 'engine.pkl', 'wb') as fh:
+            pickle.dump(model, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        (staging / 'metadata.json').write_text(json.dumps({
+            'metadata': metadata,
+            'arrays': sorted(arrays),
+        }, default=str))
+
+        # Publish the complete directory, then flip the stamp atomically
+        os.replace(staging, base / version)
+        stamp = base / f'.CURRENT.{version}'
+        stamp.write_text(version)
+        os.replace(stamp, base / 'CURRENT')
+        self._prune(base, version)
+        return version
+
+    def load(self, product_id, location, kind, version=None):
+        """Load a stored version as a registry entry, or None if it is gone"""
+        version = version or self.current_version(product_id, location, kind)
+        if version is None:
+            return None
+        path = self.model_dir(product_id, location, kind) / version
+        try:
+            stored = json.loads((path / 'metadata.json').read_text())
+            with open(path / 'engine.pkl', 'rb') as fh:
+                model = pickle.load(fh)
+            if stored['arrays']:
+                model.forest = FlatForest(**{
+                    name: np.load(path / f'{name}.npy', mmap_mode='r')
+                    for name in stored['arrays']
+                })
+        except FileNotFoundError:
+            # Pruned by another process after we read the stamp
+            return None
+
+        metadata = dict(stored['metadata'], store_version=version)
+        return ModelEntry(model, metadata=metadata)
+
+    def invalidate(self, product_id, location, kind=None):
+        """Remove the stamps so every worker retrains on its next request"""
+        if self.root is None:
+            return
+        base = self.pair_dir(product_id, location)
+        if kind is not None:
+            base = base / kind
+        if not base.exists():
+            return
+        for stamp in base.rglob('CURRENT'):
+            stamp.unlink(missing_ok=True)
+
+    def _prune(self, base, current):
+        versions = sorted(
+            (path for path in base.iterdir() if path.is_dir() and not path.name.startswith('.')),
+            key=lambda path: path.name,
+        )
+        # Mapped files stay readable after unlinking, so pruning is safe
+        for path in versions[:-(KEEP_PREVIOUS_VERSIONS + 1)]:
+            if path.name != current:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+model_store = ModelStore()
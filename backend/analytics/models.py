@@ -18,18 +18,77 @@ class HistoricalPrice(models.Model):
 
 class PricePrediction(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    location = models.CharField(max_length=200, default='')
     predicted_for = models.DateField()
+    predicted_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
     min_price = models.DecimalField(max_digits=10, decimal_places=2)
     max_price = models.DecimalField(max_digits=10, decimal_places=2)
     confidence_score = models.FloatField()  # 0 to 1
     factors = models.JSONField()  # Store factors affecting prediction
+    data_version = models.CharField(max_length=64, blank=True, default='')  # Price feature fingerprint
+    engine = models.CharField(max_length=30, default='random_forest')  # Forecasting engine used
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'location', 'predicted_for']),
+        ]
+
 class DemandForecast(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     location = models.CharField(max_length=200)
     forecast_for = models.DateField()
     predicted_demand = models.DecimalField(max_digits=10, decimal_places=2)
+    min_demand = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    max_demand = models.DecimalField(max_digits=10, decimal_places=2, null=True)
     confidence_score = models.FloatField()
     seasonal_factors = models.JSONField()  # Store seasonal influences
-    created_at = models.DateTimeField(auto_now_add=True) 
\ No newline at end of file
+    data_version = models.CharField(max_length=64, blank=True, default='')  # Order history fingerprint
+    engine = models.CharField(max_length=30, default='random_forest')  # Forecasting engine used
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'location', 'forecast_for']),
+        ]
+
+class PriceFeature(models.Model):
+    """Materialized daily price features per product and location"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    location = models.CharField(max_length=200)
+    date = models.DateField()
+    market_price = models.FloatField()  # Average across sources for the day
+    volume_traded = models.FloatField()  # Total across sources for the day
+    day_of_week = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    year = models.PositiveSmallIntegerField()
+    price_ma7 = models.FloatField(null=True)
+    price_ma30 = models.FloatField(null=True)
+    volume_ma7 = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['product', 'location', 'date']
+
+class MarketRollup(models.Model):
+    """Pre-aggregated price statistics per product, location and period"""
+    PERIOD_CHOICES = [
+        ('DAY', 'Daily'),
+        ('WEEK', 'Weekly'),
+        ('MONTH', 'Monthly'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    location = models.CharField(max_length=200)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    avg_price = models.DecimalField(max_digits=10, decimal_places=2)
+    vwap = models.DecimalField(max_digits=10, decimal_places=2)  # Volume-weighted average price
+    total_volume = models.DecimalField(max_digits=14, decimal_places=2)
+    record_count = models.PositiveIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['product', 'location', 'period', 'period_start']
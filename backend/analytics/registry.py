@@ -0,0 +1,119 @@
+import pickle
+import threading
+from collections import OrderedDict
+from django.conf import settings
+
+# sklearn stores each tree node as a 64 byte struct
+_TREE_NODE_BYTES = 64
+
+
+def estimate_model_bytes(model):
+    """Approximate the in-memory footprint of a fitted model"""
+    if hasattr(model, 'estimate_bytes'):
+        return model.estimate_bytes()
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is not None:
+        return sum(
+            est.tree_.node_count * _TREE_NODE_BYTES + est.tree_.value.nbytes
+            for est in estimators
+        )
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class ModelEntry:
+    """A fitted model together with the scaler it was trained with"""
+
+    def __init__(self, model, scaler=None, metadata=None):
+        self.model = model
+        self.scaler = scaler
+        self.metadata = metadata or {}
+        self.size_bytes = estimate_model_bytes(model)
+
+
+class ModelRegistry:
+    """Process-wide LRU cache of fitted models keyed by (product, location, kind)
+
+    Entries are evicted least-recently-used first whenever the registry holds
+    more than ``max_entries`` models or more than ``max_bytes`` of estimated
+    model memory. Kinds may carry a suffix after a slash (``price/ridge``),
+    and invalidating ``price`` drops every variant of it.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(product_id, location, kind):
+        return (int(product_id), location, kind)
+
+    def _limits(self):
+        max_entries = self.max_entries
+        if max_entries is None:
+            max_entries = getattr(settings, 'ANALYTICS_MODEL_CACHE_MAX_ENTRIES', 256)
+        max_bytes = self.max_bytes
+        if max_bytes is None:
+            max_bytes = getattr(settings, 'ANALYTICS_MODEL_CACHE_MAX_MB', 512) * 1024 * 1024
+        return max_entries, max_bytes
+
+    def get(self, product_id, location, kind):
+        """Return the cached entry for the key, or None on a miss"""
+        key = self.make_key(product_id, location, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, product_id, location, kind, entry):
+        """Store an entry and evict old ones until the limits are respected"""
+        key = self.make_key(product_id, location, kind)
+        max_entries, max_bytes = self._limits()
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.size_bytes
+            self._entries[key] = entry
+            self._total_bytes += entry.size_bytes
+
+            # Never evict the entry that was just added
+            while len(self._entries) > 1 and (
+                len(self._entries) > max_entries or self._total_bytes > max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size_bytes
+        return entry
+
+    def invalidate(self, product_id, location, kind=None):
+        """Drop cached models for a product/location, optionally only one kind"""
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == int(product_id) and key[1] == location and (
+                    kind is None or key[2] == kind or key[2].startswith(f'{kind}/')
+                ):
+                    self._total_bytes -= self._entries.pop(key).size_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'total_bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,105 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from .models import HistoricalPrice, MarketRollup
+
+CENT = Decimal('0.01')
+
+
+def period_start(period, day):
+    """First day of the period containing `day`"""
+    if period == 'WEEK':
+        return day - timedelta(days=day.weekday())
+    if period == 'MONTH':
+        return day.replace(day=1)
+    return day
+
+
+class MarketRollupStore:
+    """Daily, weekly and monthly price rollups maintained incrementally
+
+    A refresh only re-aggregates the periods that contain the changed dates,
+    so a new day of prices touches one row per period granularity.
+    """
+
+    PERIODS = [period for period, _ in MarketRollup.PERIOD_CHOICES]
+
+    def _bucket(self, period):
+        if period == 'WEEK':
+            return TruncWeek('date')
+        if period == 'MONTH':
+            return TruncMonth('date')
+        return F('date')
+
+    def refresh(self, product_id, location, since=None):
+        """Re-aggregate every period from the one containing `since` onwards"""
+        written = 0
+        for period in self.PERIODS:
+            prices = HistoricalPrice.objects.filter(
+                product_id=product_id,
+                location=location
+            )
+            stale = MarketRollup.objects.filter(
+                product_id=product_id,
+                location=location,
+                period=period
+            )
+            if since is not None:
+                first = period_start(period, since)
+                prices = prices.filter(date__gte=first)
+                stale = stale.filter(period_start__gte=first)
+            
+            buckets = prices.annotate(bucket=self._bucket(period)).values('bucket').annotate(
+                min_price=Min('market_price'),
+                max_price=Max('market_price'),
+                avg_price=Avg('market_price'),
+                price_volume=Sum(F('market_price') * F('volume_traded')),
+                total_volume=Sum('volume_traded'),
+                record_count=Count('id')
+            ).order_by('bucket')
+            
+            rows = [self._to_rollup(product_id, location, period, bucket) for bucket in buckets]
+            with transaction.atomic():
+                stale.exclude(period_start__in=[row.period_start for row in rows]).delete()
+                MarketRollup.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=['product', 'location', 'period', 'period_start'],
+                    update_fields=[
+                        'min_price', 'max_price', 'avg_price', 'vwap',
+                        'total_volume', 'record_count', 'updated_at'
+                    ]
+                )
+            written += len(rows)
+        return written
+
+    @staticmethod
+    def _to_rollup(product_id, location, period, bucket):
+        start = bucket['bucket']
+        if hasattr(start, 'date'):
+            start = start.date()
+        avg_price = Decimal(bucket['avg_price']).quantize(CENT)
+        total_volume = Decimal(bucket['total_volume'])
+        
+        # Fall back to the plain average when nothing was traded
+        vwap = avg_price
+        if total_volume:
+            vwap = (Decimal(bucket['price_volume']) / total_volume).quantize(CENT)
+        
+        return MarketRollup(
+            product_id=product_id,
+            location=location,
+            period=period,
+            period_start=start,
+            min_price=bucket['min_price'],
+            max_price=bucket['max_price'],
+            avg_price=avg_price,
+            vwap=vwap,
+            total_volume=total_volume,
+            record_count=bucket['record_count']
+        )
+
+
+rollup_store = MarketRollupStore()
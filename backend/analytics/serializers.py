@@ -0,0 +1,27 @@
+from rest_framework import serializers
+from .models import PricePrediction, DemandForecast, MarketRollup
+
+class PricePredictionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PricePrediction
+        fields = [
+            'id', 'product', 'location', 'predicted_for', 'predicted_price',
+            'min_price', 'max_price', 'confidence_score', 'factors', 'created_at'
+        ]
+
+class DemandForecastSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DemandForecast
+        fields = [
+            'id', 'product', 'location', 'forecast_for', 'predicted_demand',
+            'min_demand', 'max_demand', 'confidence_score', 'seasonal_factors',
+            'created_at'
+        ]
+
+class MarketRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MarketRollup
+        fields = [
+            'product', 'location', 'period', 'period_start', 'min_price',
+            'max_price', 'avg_price', 'vwap', 'total_volume', 'record_count'
+        ]
@@ -1,115 +1,334 @@
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
 from datetime import datetime, timedelta
-from django.db.models import Avg, Count
-from .models import HistoricalPrice, PricePrediction, DemandForecast
+from django.db import transaction
+from django.db.models import Avg, Count, Max
+from .models import HistoricalPrice, PricePrediction, DemandForecast, PriceFeature
+from .engines import get_engine, DEFAULT_ENGINE
+from .features import feature_store
+from .loaders import load_daily_demand
+from .model_store import model_store
+from .registry import model_registry, ModelEntry
 from marketplace.models import Product, Order
 
+PRICE_FEATURES = ['day_of_week', 'month', 'price_ma7', 'price_ma30', 'volume_ma7']
+DEMAND_FEATURES = ['day_of_week', 'month']
+
+# Upper bound on the reported confidence of each forecast kind
+PRICE_CONFIDENCE_CAP = 0.95
+DEMAND_CONFIDENCE_CAP = 0.90
+
+def price_horizon_frame(df, dates):
+    """Feature rows for future dates, carrying the latest moving averages"""
+    latest = df.iloc[-1]
+    return pd.DataFrame({
+        'date': dates,
+        'day_of_week': dates.dayofweek,
+        'month': dates.month,
+        'price_ma7': latest['price_ma7'],
+        'price_ma30': latest['price_ma30'],
+        'volume_ma7': latest['volume_ma7'],
+    })
+
+def demand_history_frame(daily_demand):
+    """Add calendar features to the daily demand records"""
+    df = pd.DataFrame(daily_demand)
+    df['date'] = pd.to_datetime(df['date'])
+    df['day_of_week'] = df['date'].dt.dayofweek
+    df['month'] = df['date'].dt.month
+    return df
+
 class MarketAnalyticsService:
-    def __init__(self):
+    def __init__(self, registry=None, engine=None):
+        self.registry = registry or model_registry
+        self.engine = engine or DEFAULT_ENGINE
+        get_engine(self.engine)  # Fail early on unknown engine names
         self.price_model = None
         self.demand_model = None
-        self.scaler = StandardScaler()
+    
+    def model_kind(self, kind):
+        """Registry kind for this service's engine, e.g. price/ridge"""
+        return f'{kind}/{self.engine}'
     
     def prepare_price_features(self, product_id, location):
         """Prepare features for price prediction"""
-        # Get historical prices
-        prices = HistoricalPrice.objects.filter(
-            product_id=product_id,
-            location=location
-        ).order_by('date')
+        # Read materialized rows, kept current incrementally on price ingest
+        return feature_store.load_frame(product_id, location)
+    
+    def train_price_model(self, product_id, location, df=None):
+        """Train price prediction model"""
+        if df is None:
+            df = self.prepare_price_features(product_id, location)
         
-        df = pd.DataFrame(list(prices.values()))
+        history = df.assign(date=pd.to_datetime(df['date']))
+        self.price_model = get_engine(self.engine).fit(
+            history, PRICE_FEATURES, 'market_price'
+        )
+        
+        # Share the fitted model with other requests in this process
+        return self.registry.put(
+            product_id, location, self.model_kind('price'),
+            ModelEntry(self.price_model, metadata={
+                'confidence_score': min(PRICE_CONFIDENCE_CAP, self.price_model.confidence_score),
+            })
+        )
+    
+    def load_model(self, product_id, location, kind, train, is_current=None):
+        """Serve a model from the registry, then the model store, then training
         
-        # Add time-based features
-        df['day_of_week'] = pd.to_datetime(df['date']).dt.dayofweek
-        df['month'] = pd.to_datetime(df['date']).dt.month
-        df['year'] = pd.to_datetime(df['date']).dt.year
+        The store's version stamp is checked on every call, so a model saved by
+        another worker replaces the one held here without retraining.
+        """
+        kind = self.model_kind(kind)
+        is_current = is_current or (lambda entry: True)
+        version = model_store.current_version(product_id, location, kind)
         
-        # Add moving averages
-        df['price_ma7'] = df['market_price'].rolling(window=7).mean()
-        df['price_ma30'] = df['market_price'].rolling(window=30).mean()
+        entry = self.registry.get(product_id, location, kind)
+        if entry is not None and entry.metadata.get('store_version') == version and is_current(entry):
+            return entry
         
-        # Add volume features
-        df['volume_ma7'] = df['volume_traded'].rolling(window=7).mean()
+        # Memory-mapped load of the version another worker already trained
+        if version is not None:
+            entry = model_store.load(product_id, location, kind, version)
+            if entry is not None and is_current(entry):
+                return self.registry.put(product_id, location, kind, entry)
         
-        return df.dropna()
+        entry = train()
+        entry.metadata['store_version'] = model_store.save(
+            product_id, location, kind, entry.model, entry.metadata
+        )
+        return entry
     
-    def train_price_model(self, product_id, location):
-        """Train price prediction model"""
+    def get_price_model(self, product_id, location, df=None):
+        """Return the cached price model entry, training it on a miss"""
+        entry = self.load_model(
+            product_id, location, 'price',
+            lambda: self.train_price_model(product_id, location, df)
+        )
+        self.price_model = entry.model
+        return entry
+    
+    def predict_price(self, product_id, location, prediction_date):
+        """Predict price for a specific date"""
+        prediction = self.predict_price_range(product_id, location, prediction_date, 1)[0]
+        return prediction['predicted_price'], prediction['confidence_score']
+    
+    def predict_price_range(self, product_id, location, start_date, days):
+        """Predict prices for `days` consecutive dates starting at start_date"""
+        # Load and featurize the history once for the whole horizon
         df = self.prepare_price_features(product_id, location)
+        entry = self.get_price_model(product_id, location, df)
         
-        # Prepare features and target
-        features = ['day_of_week', 'month', 'price_ma7', 'price_ma30', 'volume_ma7']
-        X = df[features]
-        y = df['market_price']
+        # Every horizon row carries the latest moving averages, only the
+        # calendar features change from one day to the next
+        dates = pd.date_range(start=pd.to_datetime(start_date), periods=days, freq='D')
         
-        # Scale features
-        X_scaled = self.scaler.fit_transform(X)
+        # Single model evaluation for all horizons
+        predicted_prices, min_prices, max_prices = self.price_model.predict(
+            price_horizon_frame(df, dates)
+        )
         
-        # Train model
-        self.price_model = RandomForestRegressor(n_estimators=100, random_state=42)
-        self.price_model.fit(X_scaled, y)
-    
-    def predict_price(self, product_id, location, prediction_date):
-        """Predict price for a specific date"""
-        if not self.price_model:
-            self.train_price_model(product_id, location)
+        # Confidence was measured when the model was trained
+        confidence_score = entry.metadata['confidence_score']
         
-        # Prepare features for prediction
-        df = self.prepare_price_features(product_id, location)
-        latest_data = df.iloc[-1:].copy()
-        latest_data['date'] = prediction_date
-        latest_data['day_of_week'] = pd.to_datetime(prediction_date).dayofweek
-        latest_data['month'] = pd.to_datetime(prediction_date).month
-        
-        # Make prediction
-        features = ['day_of_week', 'month', 'price_ma7', 'price_ma30', 'volume_ma7']
-        X_pred = self.scaler.transform(latest_data[features])
-        predicted_price = self.price_model.predict(X_pred)[0]
-        
-        # Calculate confidence score based on feature importance
-        confidence_score = min(0.95, self.price_model.score(
-            self.scaler.transform(df[features]), df['market_price']
-        ))
-        
-        return predicted_price, confidence_score
+        return [
+            {
+                'date': date.date(),
+                'predicted_price': float(predicted_price),
+                'min_price': float(min_price),
+                'max_price': float(max_price),
+                'confidence_score': confidence_score
+            }
+            for date, predicted_price, min_price, max_price
+            in zip(dates, predicted_prices, min_prices, max_prices)
+        ]
 
-    def predict_demand(self, product_id, location, forecast_date):
-        """Predict demand based on historical orders"""
-        # Get historical orders
-        orders = Order.objects.filter(
+    def get_price_data_version(self, product_id, location):
+        """Cheap fingerprint of the price features behind a price model"""
+        stats = PriceFeature.objects.filter(
+            product_id=product_id,
+            location=location
+        ).aggregate(count=Count('id'), last_update=Max('updated_at'))
+        
+        if not stats['count']:
+            return '0'
+        return f"{stats['count']}:{stats['last_update'].isoformat()}"
+    
+    def forecast_price_range(self, product_id, location, start_date, days):
+        """Serve stored price forecasts, computing and persisting them when stale"""
+        dates = pd.date_range(start=pd.to_datetime(start_date), periods=days, freq='D')
+        data_version = self.get_price_data_version(product_id, location)
+        
+        stored = list(PricePrediction.objects.filter(
+            product_id=product_id,
+            location=location,
+            predicted_for__range=(dates[0].date(), dates[-1].date()),
+            data_version=data_version,
+            engine=self.engine
+        ).order_by('predicted_for'))
+        
+        if len(stored) == days:
+            return [
+                {
+                    'date': prediction.predicted_for,
+                    'predicted_price': float(prediction.predicted_price),
+                    'min_price': float(prediction.min_price),
+                    'max_price': float(prediction.max_price),
+                    'confidence_score': prediction.confidence_score
+                }
+                for prediction in stored
+            ]
+        
+        predictions = self.predict_price_range(product_id, location, start_date, days)
+        rows = [
+            PricePrediction(
+                product_id=product_id,
+                location=location,
+                predicted_for=prediction['date'],
+                predicted_price=round(prediction['predicted_price'], 2),
+                min_price=round(prediction['min_price'], 2),
+                max_price=round(prediction['max_price'], 2),
+                confidence_score=prediction['confidence_score'],
+                factors={
+                    'day_of_week': prediction['date'].weekday(),
+                    'month': prediction['date'].month
+                },
+                data_version=data_version,
+                engine=self.engine
+            )
+            for prediction in predictions
+        ]
+        
+        # Replace this engine's stale predictions for the same dates
+        with transaction.atomic():
+            PricePrediction.objects.filter(
+                product_id=product_id,
+                location=location,
+                predicted_for__range=(dates[0].date(), dates[-1].date()),
+                engine=self.engine
+            ).delete()
+            PricePrediction.objects.bulk_create(rows)
+        
+        return predictions
+    
+    def get_demand_data_version(self, product_id, location):
+        """Cheap fingerprint of the order history behind a demand model"""
+        stats = Order.objects.filter(
             listing__product_id=product_id,
             listing__location=location
-        ).values('created_at', 'quantity')
+        ).aggregate(count=Count('id'), last_update=Max('updated_at'))
+        
+        if not stats['count']:
+            return '0'
+        return f"{stats['count']}:{stats['last_update'].isoformat()}"
+    
+    def train_demand_model(self, product_id, location, data_version):
+        """Train demand model on historical orders"""
+        # Daily demand is summed in the database, one row per day
+        daily_demand = demand_history_frame(load_daily_demand(product_id, location))
         
-        df = pd.DataFrame(list(orders))
-        df['date'] = pd.to_datetime(df['created_at']).dt.date
+        self.demand_model = get_engine(self.engine).fit(
+            daily_demand, DEMAND_FEATURES, 'quantity'
+        )
         
-        # Calculate daily demand
-        daily_demand = df.groupby('date')['quantity'].sum().reset_index()
+        return self.registry.put(
+            product_id, location, self.model_kind('demand'),
+            ModelEntry(self.demand_model, metadata={
+                'data_version': data_version,
+                'confidence_score': min(DEMAND_CONFIDENCE_CAP, self.demand_model.confidence_score),
+            })
+        )
+    
+    def get_demand_model(self, product_id, location, data_version):
+        """Return the cached demand model entry, refitting when the orders changed"""
+        entry = self.load_model(
+            product_id, location, 'demand',
+            lambda: self.train_demand_model(product_id, location, data_version),
+            lambda entry: entry.metadata.get('data_version') == data_version
+        )
+        self.demand_model = entry.model
+        return entry
+
+    def predict_demand(self, product_id, location, forecast_date):
+        """Predict demand based on historical orders"""
+        forecast = self.predict_demand_range(product_id, location, forecast_date, 1)[0]
+        return forecast['predicted_demand'], forecast['confidence_score']
+    
+    def predict_demand_range(self, product_id, location, start_date, days):
+        """Forecast demand for `days` consecutive dates starting at start_date"""
+        dates = pd.date_range(start=pd.to_datetime(start_date), periods=days, freq='D')
+        data_version = self.get_demand_data_version(product_id, location)
         
-        # Add seasonal features
-        daily_demand['day_of_week'] = pd.to_datetime(daily_demand['date']).dt.dayofweek
-        daily_demand['month'] = pd.to_datetime(daily_demand['date']).dt.month
+        # Serve stored forecasts when they were produced from the same orders
+        stored = list(DemandForecast.objects.filter(
+            product_id=product_id,
+            location=location,
+            forecast_for__range=(dates[0].date(), dates[-1].date()),
+            data_version=data_version,
+            engine=self.engine
+        ).order_by('forecast_for'))
         
-        # Train demand model
-        features = ['day_of_week', 'month']
-        X = daily_demand[features]
-        y = daily_demand['quantity']
+        if len(stored) == days:
+            return [
+                {
+                    'date': forecast.forecast_for,
+                    'predicted_demand': float(forecast.predicted_demand),
+                    'min_demand': float(forecast.min_demand),
+                    'max_demand': float(forecast.max_demand),
+                    'confidence_score': forecast.confidence_score
+                }
+                for forecast in stored
+            ]
         
-        self.demand_model = RandomForestRegressor(n_estimators=100, random_state=42)
-        self.demand_model.fit(X, y)
+        entry = self.get_demand_model(product_id, location, data_version)
+        confidence_score = entry.metadata['confidence_score']
         
-        # Prepare prediction features
+        # Score every requested date in one call
         pred_features = pd.DataFrame({
-            'day_of_week': [pd.to_datetime(forecast_date).dayofweek],
-            'month': [pd.to_datetime(forecast_date).month]
+            'date': dates,
+            'day_of_week': dates.dayofweek,
+            'month': dates.month
         })
+        predicted_demands, min_demands, max_demands = self.demand_model.predict(pred_features)
+        
+        forecasts = [
+            {
+                'date': date.date(),
+                'predicted_demand': float(predicted_demand),
+                'min_demand': float(min_demand),
+                'max_demand': float(max_demand),
+                'confidence_score': confidence_score
+            }
+            for date, predicted_demand, min_demand, max_demand
+            in zip(dates, predicted_demands, min_demands, max_demands)
+        ]
+        rows = [
+            DemandForecast(
+                product_id=product_id,
+                location=location,
+                forecast_for=forecast['date'],
+                predicted_demand=round(forecast['predicted_demand'], 2),
+                min_demand=round(forecast['min_demand'], 2),
+                max_demand=round(forecast['max_demand'], 2),
+                confidence_score=confidence_score,
+                seasonal_factors={
+                    'day_of_week': forecast['date'].weekday(),
+                    'month': forecast['date'].month
+                },
+                data_version=data_version,
+                engine=self.engine
+            )
+            for forecast in forecasts
+        ]
         
-        predicted_demand = self.demand_model.predict(pred_features)[0]
-        confidence_score = min(0.90, self.demand_model.score(X, y))
+        # Replace this engine's stale forecasts for the same dates
+        with transaction.atomic():
+            DemandForecast.objects.filter(
+                product_id=product_id,
+                location=location,
+                forecast_for__range=(dates[0].date(), dates[-1].date()),
+                engine=self.engine
+            ).delete()
+            DemandForecast.objects.bulk_create(rows)
         
-        return predicted_demand, confidence_score 
\ No newline at end of file
+        return forecasts
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import HistoricalPrice
+from .features import feature_store
+from .model_store import model_store
+from .registry import model_registry
+from .rollups import rollup_store
+
+
+@receiver([post_save, post_delete], sender=HistoricalPrice)
+def invalidate_price_models(sender, instance, **kwargs):
+    """Drop cached models trained on the product/location that just changed"""
+    model_registry.invalidate(instance.product_id, instance.location, 'price')
+    model_store.invalidate(instance.product_id, instance.location, 'price')
+
+
+@receiver([post_save, post_delete], sender=HistoricalPrice)
+def refresh_price_features(sender, instance, **kwargs):
+    """Recompute the trailing feature window touched by the changed price"""
+    feature_store.refresh(instance.product_id, instance.location, since=instance.date)
+
+
+
+@receiver([post_save, post_delete], sender=HistoricalPrice)
+def refresh_market_rollups(sender, instance, **kwargs):
+    """Re-aggregate the day, week and month containing the changed price"""
+    rollup_store.refresh(instance.product_id, instance.location, since=instance.date)
@@ -0,0 +1,670 @@
+import io
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
+import numpy as np
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from marketplace.models import Product, Listing, Order
+from .archive import PriceArchive
+from .batch import (
+    MAX_FORECAST_DAYS, active_pairs, completed_pairs, forecast_pair, forecast_price_batch
+)
+from .engines import ENGINES, RandomForestEngine, RidgeEngine, get_engine
+from .features import feature_store
+from .ingestion import PriceIngestionService
+from .loaders import load_daily_demand, load_price_features, load_price_history
+from .model_store import ModelStore
+from .models import HistoricalPrice, MarketRollup, PriceFeature, PricePrediction, DemandForecast
+from .registry import ModelRegistry, ModelEntry
+from .rollups import rollup_store
+from .services import MarketAnalyticsService
+from .views import BatchPricePredictionView
+
+User = get_user_model()
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def make_entry(self, size_bytes=100):
+        entry = ModelEntry(model={'coef': [1.0]})
+        entry.size_bytes = size_bytes
+        return entry
+
+    def test_get_returns_cached_entry(self):
+        registry = ModelRegistry(max_entries=10, max_bytes=10000)
+        entry = registry.put(1, 'Pune', 'price', self.make_entry())
+
+        self.assertIs(registry.get(1, 'Pune', 'price'), entry)
+        self.assertIsNone(registry.get(1, 'Pune', 'demand'))
+        self.assertEqual(registry.stats()['hits'], 1)
+        self.assertEqual(registry.stats()['misses'], 1)
+
+    def test_evicts_least_recently_used(self):
+        registry = ModelRegistry(max_entries=2, max_bytes=10000)
+        registry.put(1, 'Pune', 'price', self.make_entry())
+        registry.put(2, 'Pune', 'price', self.make_entry())
+
+        # Touch product 1 so product 2 becomes the eviction candidate
+        registry.get(1, 'Pune', 'price')
+        registry.put(3, 'Pune', 'price', self.make_entry())
+
+        self.assertIsNotNone(registry.get(1, 'Pune', 'price'))
+        self.assertIsNone(registry.get(2, 'Pune', 'price'))
+        self.assertIsNotNone(registry.get(3, 'Pune', 'price'))
+
+    def test_evicts_when_memory_limit_exceeded(self):
+        registry = ModelRegistry(max_entries=10, max_bytes=250)
+        registry.put(1, 'Pune', 'price', self.make_entry(100))
+        registry.put(2, 'Pune', 'price', self.make_entry(100))
+        registry.put(3, 'Pune', 'price', self.make_entry(100))
+
+        self.assertIsNone(registry.get(1, 'Pune', 'price'))
+        self.assertEqual(registry.stats()['total_bytes'], 200)
+
+    def test_invalidate_drops_matching_entries(self):
+        registry = ModelRegistry(max_entries=10, max_bytes=10000)
+        registry.put(1, 'Pune', 'price', self.make_entry())
+        registry.put(1, 'Pune', 'demand', self.make_entry())
+        registry.put(1, 'Nashik', 'price', self.make_entry())
+
+        registry.invalidate(1, 'Pune', 'price')
+
+        self.assertIsNone(registry.get(1, 'Pune', 'price'))
+        self.assertIsNotNone(registry.get(1, 'Pune', 'demand'))
+        self.assertIsNotNone(registry.get(1, 'Nashik', 'price'))
+
+
+class ForecastEngineTests(SimpleTestCase):
+    def setUp(self):
+        # Weekly pattern on a slow upward trend
+        dates = pd.date_range('2024-01-01', periods=140, freq='D')
+        weekly = np.array([0, 1, 2, 3, 2, 6, 8], dtype=float)
+        self.history = pd.DataFrame({
+            'date': dates,
+            'day_of_week': dates.dayofweek,
+            'month': dates.month,
+            'y': 20 + weekly[dates.dayofweek] + np.arange(140) * 0.01,
+        })
+        future_dates = pd.date_range('2024-05-20', periods=14, freq='D')
+        self.future = pd.DataFrame({
+            'date': future_dates,
+            'day_of_week': future_dates.dayofweek,
+            'month': future_dates.month,
+        })
+        self.expected = 20 + weekly[future_dates.dayofweek] + 1.4
+
+    def test_forest_interval_brackets_point_prediction(self):
+        engine = RandomForestEngine().fit(self.history, ['day_of_week', 'month'], 'y')
+        predicted, low, high = engine.predict(self.future)
+        
+        self.assertTrue((low <= predicted).all())
+        self.assertTrue((predicted <= high).all())
+        self.assertGreater(engine.confidence_score, 0.5)
+
+    def test_every_engine_learns_the_weekly_pattern(self):
+        for name in ('seasonal_naive', 'exp_smoothing', 'ridge', 'random_forest'):
+            with self.subTest(engine=name):
+                engine = get_engine(name).fit(self.history, ['day_of_week', 'month'], 'y')
+                predicted, low, high = engine.predict(self.future)
+                
+                self.assertEqual(engine.name, name)
+                np.testing.assert_allclose(predicted, self.expected, atol=1.0)
+                self.assertTrue((low <= high).all())
+                self.assertGreaterEqual(engine.confidence_score, 0.0)
+                self.assertLessEqual(engine.confidence_score, 1.0)
+        self.assertEqual(set(ENGINES), {'seasonal_naive', 'exp_smoothing', 'ridge', 'random_forest'})
+
+
+class ModelStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.store = ModelStore(root=self.root.name)
+
+        rng = np.random.default_rng(0)
+        self.history = pd.DataFrame({
+            'date': pd.date_range('2024-01-01', periods=120, freq='D'),
+            'x': rng.normal(size=120),
+        })
+        self.history['y'] = 3 * self.history['x'] + rng.normal(size=120)
+        self.engine = RandomForestEngine().fit(self.history, ['x'], 'y')
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_round_trip_memory_maps_forest(self):
+        version = self.store.save(1, 'Pune', 'price/random_forest', self.engine, {'confidence_score': 0.5})
+        entry = self.store.load(1, 'Pune', 'price/random_forest')
+
+        self.assertEqual(entry.metadata['store_version'], version)
+        self.assertIsInstance(entry.model.forest.threshold, np.memmap)
+        for expected, loaded in zip(self.engine.predict(self.history), entry.model.predict(self.history)):
+            np.testing.assert_allclose(expected, loaded)
+
+    def test_invalidate_removes_stamp(self):
+        first = self.store.save(1, 'Pune', 'price/random_forest', self.engine, {})
+        second = self.store.save(1, 'Pune', 'price/random_forest', self.engine, {})
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.store.current_version(1, 'Pune', 'price/random_forest'), second)
+
+        self.store.invalidate(1, 'Pune', 'price')
+        self.assertIsNone(self.store.current_version(1, 'Pune', 'price/random_forest'))
+
+
+# Fitted models stay in memory instead of the on-disk store
+@override_settings(ANALYTICS_MODEL_STORE_DIR='')
+class MarketAnalyticsServiceTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Cabbage', category='VEGETABLES', description='Green cabbage'
+        )
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(
+                product=self.product,
+                date=date(2024, 1, 1) + timedelta(days=i),
+                market_price=18 + i % 7,
+                volume_traded=300 + i,
+                source='Mandi',
+                location='Pune'
+            )
+            for i in range(90)
+        ])
+        feature_store.refresh(self.product.id, 'Pune')
+
+    def make_service(self, engine='ridge'):
+        return MarketAnalyticsService(registry=ModelRegistry(), engine=engine)
+
+    def test_price_range_scores_every_horizon_in_one_call(self):
+        service = self.make_service()
+        
+        with mock.patch.object(RidgeEngine, 'predict', autospec=True, side_effect=RidgeEngine.predict) as predict:
+            predictions = service.predict_price_range(self.product.id, 'Pune', date(2024, 4, 1), 7)
+        
+        self.assertEqual(predict.call_count, 1)
+        self.assertEqual([p['date'] for p in predictions], [date(2024, 4, 1) + timedelta(days=i) for i in range(7)])
+        for prediction in predictions:
+            self.assertLessEqual(prediction['min_price'], prediction['max_price'])
+        
+        # Each day matches what a single-day prediction returns
+        price, confidence = service.predict_price(self.product.id, 'Pune', date(2024, 4, 3))
+        self.assertAlmostEqual(price, predictions[2]['predicted_price'])
+        self.assertEqual(confidence, predictions[2]['confidence_score'])
+
+    def test_demand_model_is_fitted_once_per_order_history(self):
+        farmer = User.objects.create_user(username='farmer', password='testpass123')
+        buyer = User.objects.create_user(username='buyer', password='testpass123')
+        listing = Listing.objects.create(
+            farmer=farmer,
+            product=self.product,
+            quantity=1000,
+            price_per_unit=20,
+            unit='kg',
+            location='Pune',
+            harvest_date=date(2024, 1, 1),
+            available_from=date(2024, 1, 1)
+        )
+        for quantity in (5, 8, 3):
+            Order.objects.create(
+                buyer=buyer, listing=listing, quantity=quantity,
+                total_price=quantity * 20, delivery_address='Pune'
+            )
+        service = self.make_service()
+        
+        with mock.patch.object(
+            MarketAnalyticsService, 'train_demand_model',
+            autospec=True, side_effect=MarketAnalyticsService.train_demand_model
+        ) as train:
+            service.predict_demand_range(self.product.id, 'Pune', date(2024, 4, 1), 7)
+            service.predict_demand_range(self.product.id, 'Pune', date(2024, 4, 8), 7)
+            self.assertEqual(train.call_count, 1)
+            
+            # A new order changes the history version and forces a refit
+            Order.objects.create(
+                buyer=buyer, listing=listing, quantity=4,
+                total_price=80, delivery_address='Pune'
+            )
+            service.predict_demand_range(self.product.id, 'Pune', date(2024, 4, 15), 7)
+            self.assertEqual(train.call_count, 2)
+
+    def test_engines_keep_their_own_stored_forecasts(self):
+        ridge = self.make_service('ridge').forecast_price_range(self.product.id, 'Pune', date(2024, 4, 1), 7)
+        self.make_service('seasonal_naive').forecast_price_range(self.product.id, 'Pune', date(2024, 4, 1), 7)
+        
+        stored = PricePrediction.objects.filter(product=self.product, location='Pune')
+        self.assertEqual(stored.filter(engine='ridge').count(), 7)
+        self.assertEqual(stored.filter(engine='seasonal_naive').count(), 7)
+        
+        # The ridge rows are served back without refitting
+        with mock.patch.object(RidgeEngine, 'fit') as fit:
+            served = self.make_service('ridge').forecast_price_range(self.product.id, 'Pune', date(2024, 4, 1), 7)
+        fit.assert_not_called()
+        self.assertEqual([p['predicted_price'] for p in served], [round(p['predicted_price'], 2) for p in ridge])
+
+
+@override_settings(ANALYTICS_MODEL_STORE_DIR='')
+class BatchForecastTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Carrot', category='VEGETABLES', description='Orange carrots'
+        )
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(
+                product=self.product,
+                date=date(2024, 1, 1) + timedelta(days=i),
+                market_price=25 + i % 4,
+                volume_traded=150 + i,
+                source='Mandi',
+                location=location
+            )
+            for i in range(60)
+            for location in ('Pune', 'Nashik')
+        ])
+        feature_store.refresh(self.product.id, 'Pune')
+        feature_store.refresh(self.product.id, 'Nashik')
+        
+        # Orders on ten days in Pune only
+        farmer = User.objects.create_user(username='farmer', password='testpass123')
+        buyer = User.objects.create_user(username='buyer', password='testpass123')
+        listing = Listing.objects.create(
+            farmer=farmer,
+            product=self.product,
+            quantity=1000,
+            price_per_unit=20,
+            unit='kg',
+            location='Pune',
+            harvest_date=date(2024, 1, 1),
+            available_from=date(2024, 1, 1)
+        )
+        start = datetime(2024, 2, 1, 9, tzinfo=timezone.utc)
+        for i in range(10):
+            order = Order.objects.create(
+                buyer=buyer, listing=listing, quantity=5 + i % 3,
+                total_price=100, delivery_address='Pune'
+            )
+            Order.objects.filter(id=order.id).update(created_at=start + timedelta(days=i))
+
+    def test_active_pairs_cover_recent_prices_and_listings(self):
+        self.assertEqual(
+            active_pairs(since=date(2024, 2, 1)),
+            [(self.product.id, 'Nashik'), (self.product.id, 'Pune')]
+        )
+        # The active listing keeps Pune in the batch after its prices age out
+        self.assertEqual(active_pairs(since=date(2025, 1, 1)), [(self.product.id, 'Pune')])
+
+    def test_forecast_pair_reports_errors_and_resume_skips_finished_pairs(self):
+        start_date = date(2024, 3, 1)
+        
+        pune = forecast_pair(self.product.id, 'Pune', start_date, 7, 14)
+        nashik = forecast_pair(self.product.id, 'Nashik', start_date, 7, 14)
+        
+        self.assertEqual(pune['errors'], {})
+        self.assertEqual(list(nashik['errors']), ['demand'])
+        self.assertEqual(
+            PricePrediction.objects.filter(product=self.product, location='Pune').count(), 7
+        )
+        self.assertEqual(
+            DemandForecast.objects.filter(product=self.product, location='Pune').count(), 14
+        )
+        self.assertEqual(completed_pairs(start_date, 7, 14), {(self.product.id, 'Pune')})
+
+
+class BatchPricePredictionTests(SimpleTestCase):
+    def fake_forecast(self, product_id, location, start_date, days):
+        if location == 'Nowhere':
+            raise ValueError('No price history')
+        return [
+            {'date': start_date + timedelta(days=i), 'predicted_price': float(product_id)}
+            for i in range(days)
+        ]
+
+    def run_batch(self, items):
+        with mock.patch.object(
+            MarketAnalyticsService, 'forecast_price_range', autospec=True,
+            side_effect=lambda service, *args: self.fake_forecast(*args)
+        ) as forecast:
+            results = sorted(forecast_price_batch(items, date(2024, 4, 1), max_workers=2), key=lambda r: r['index'])
+        return results, forecast
+
+    def test_items_sharing_a_pair_share_one_forecast(self):
+        results, forecast = self.run_batch([
+            {'product_id': 1, 'location': 'Pune', 'days': 3},
+            {'product_id': 2, 'location': 'Pune'},
+            {'product_id': '1', 'location': 'Pune', 'days': 10},
+        ])
+        
+        self.assertEqual(forecast.call_count, 2)
+        self.assertEqual(
+            sorted(call.args[1:] for call in forecast.call_args_list),
+            [(1, 'Pune', date(2024, 4, 1), 10), (2, 'Pune', date(2024, 4, 1), 7)]
+        )
+        self.assertEqual([len(result['predictions']) for result in results], [3, 7, 10])
+        self.assertEqual(results[0]['predictions'], results[2]['predictions'][:3])
+
+    def test_failures_are_reported_per_item(self):
+        results, forecast = self.run_batch([
+            {'product_id': 1, 'location': 'Pune', 'days': 2},
+            {'location': 'Pune'},
+            {'product_id': 1, 'location': 'Pune', 'days': 0},
+            {'product_id': 1, 'location': 'Nowhere'},
+            'not an item',
+        ])
+        
+        self.assertEqual(forecast.call_count, 2)
+        self.assertIn('predictions', results[0])
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3, 4])
+        for result in results[1:3] + results[4:]:
+            self.assertTrue(result['error'].startswith('Invalid item'))
+        self.assertEqual(results[3]['error'], 'No price history')
+
+    def test_horizons_are_capped_per_item(self):
+        results, forecast = self.run_batch([
+            {'product_id': 1, 'location': 'Pune', 'days': MAX_FORECAST_DAYS},
+            {'product_id': 1, 'location': 'Pune', 'days': MAX_FORECAST_DAYS + 1},
+        ])
+        
+        self.assertEqual(forecast.call_args.args[4], MAX_FORECAST_DAYS)
+        self.assertEqual(len(results[0]['predictions']), MAX_FORECAST_DAYS)
+        self.assertTrue(results[1]['error'].startswith('Invalid item'))
+
+    def test_view_rejects_a_body_that_is_not_an_object(self):
+        request = APIRequestFactory().post('/price-predictions-batch/', [{'product_id': 1}], format='json')
+        force_authenticate(request, user=User(username='buyer'))
+        
+        response = BatchPricePredictionView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+
+
+class PriceFeatureStoreTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Potato', category='VEGETABLES', description='Table potatoes'
+        )
+        # Bulk writes skip the signals, so nothing is materialized yet
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(
+                product=self.product,
+                date=date(2024, 1, 1) + timedelta(days=i),
+                market_price=15 + i % 5,
+                volume_traded=200 + i,
+                source='Mandi',
+                location='Pune'
+            )
+            for i in range(60)
+        ])
+
+    def features(self):
+        return list(PriceFeature.objects.filter(
+            product=self.product, location='Pune'
+        ).order_by('date').values_list('date', 'price_ma7', 'price_ma30', 'volume_ma7'))
+
+    def test_first_refresh_materializes_full_history(self):
+        written = feature_store.refresh(self.product.id, 'Pune', since=date(2024, 2, 20))
+        
+        self.assertEqual(written, 60)
+        self.assertEqual(len(feature_store.load_frame(self.product.id, 'Pune')), 60 - 29)
+
+    def test_incremental_refresh_matches_full_rebuild(self):
+        feature_store.refresh(self.product.id, 'Pune')
+        HistoricalPrice.objects.filter(product=self.product, date=date(2024, 2, 10)).update(market_price=40)
+        
+        feature_store.refresh(self.product.id, 'Pune', since=date(2024, 2, 10))
+        incremental = self.features()
+        feature_store.refresh(self.product.id, 'Pune')
+        self.assertEqual(incremental, self.features())
+
+
+class PriceIngestionTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Okra', category='VEGETABLES', description='Tender okra'
+        )
+        HistoricalPrice.objects.create(
+            product=self.product,
+            date=date(2024, 1, 1),
+            market_price=30,
+            volume_traded=100,
+            source='Mandi',
+            location='Pune'
+        )
+
+    def prices(self):
+        return list(HistoricalPrice.objects.order_by('date').values_list('date', 'market_price', 'volume_traded'))
+
+    def test_csv_rows_are_written_and_existing_dates_updated(self):
+        feed = io.StringIO(
+            'product,date,market_price,volume_traded,location\n'
+            'okra,2024-01-01,32.5,120,Pune\n'
+            'Okra,2024-01-02,31,90,Pune\n'
+        )
+        report = PriceIngestionService(chunk_size=1).ingest(feed, 'csv')
+        
+        self.assertEqual((report.rows_read, report.rows_written, report.rows_rejected), (2, 2, 0))
+        self.assertEqual(report.pairs_refreshed, 1)
+        self.assertEqual(self.prices(), [
+            (date(2024, 1, 1), Decimal('32.50'), Decimal('120.00')),
+            (date(2024, 1, 2), Decimal('31.00'), Decimal('90.00')),
+        ])
+
+    def test_bad_rows_are_rejected_without_stopping_the_feed(self):
+        lines = [
+            '{"product_id": %d, "date": "2024-01-03", "price": 28, "location": "Pune"}' % self.product.id,
+            '{"product": "Beetroot", "date": "2024-01-03", "price": 28, "location": "Pune"}',
+            '{"product": "okra", "date": "2024-01-03", "price": 28, "volume": "NaN", "location": "Pune"}',
+            '{"product": "okra", "date": "2024-01-03", "price": "Infinity", "location": "Pune"}',
+            '{"product": "okra", "date": "2024-01-03", "price": "1e999999999", "location": "Pune"}',
+            '[1, 2, 3]',
+            '{"product": "okra", "date": "2024-01-03"',
+        ]
+        report = PriceIngestionService().ingest(io.StringIO('\n'.join(lines)), 'ndjson')
+        
+        self.assertEqual((report.rows_read, report.rows_written, report.rows_rejected), (7, 1, 6))
+        self.assertEqual([sample['line'] for sample in report.rejected_samples], [2, 3, 4, 5, 6, 7])
+        self.assertEqual(HistoricalPrice.objects.count(), 2)
+
+    def test_upload_rejects_invalid_chunk_size(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser(username='admin', password='testpass123'))
+        
+        for chunk_size in ('0', 'many'):
+            response = client.post('/api/v1/analytics/ingest-prices/', {
+                'file': SimpleUploadedFile('prices.csv', b'product,date,market_price,location\n'),
+                'chunk_size': chunk_size,
+            })
+            self.assertEqual(response.status_code, 400)
+
+
+class PriceLoaderTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Garlic', category='VEGETABLES', description='White garlic'
+        )
+        # Inserted newest first, the loaders order by date
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(
+                product=self.product,
+                date=date(2024, 1, 1) + timedelta(days=i),
+                market_price='42.50',
+                volume_traded=10 + i,
+                source='Mandi',
+                location='Pune'
+            )
+            for i in reversed(range(40))
+        ])
+
+    def test_price_history_is_a_float_record_array(self):
+        with self.assertNumQueries(1):
+            history = load_price_history(self.product.id, 'Pune')
+        
+        self.assertEqual(history.dtype.names, ('date', 'market_price', 'volume_traded'))
+        self.assertEqual(history['market_price'].dtype, np.float64)
+        self.assertEqual(str(history['date'][0]), '2024-01-01')
+        self.assertTrue((np.diff(history['date'].astype('int64')) > 0).all())
+        self.assertEqual(history['market_price'][0], 42.5)
+        self.assertEqual(len(load_price_history(self.product.id, 'Nashik')), 0)
+
+    def test_price_features_skip_warm_up_rows(self):
+        feature_store.refresh(self.product.id, 'Pune')
+        
+        complete = load_price_features(self.product.id, 'Pune')
+        everything = load_price_features(self.product.id, 'Pune', complete_only=False)
+        self.assertEqual(len(everything), 40)
+        self.assertEqual(len(complete), 40 - 29)
+        self.assertFalse(np.isnan(complete['price_ma30']).any())
+
+
+class DailyDemandLoaderTests(TestCase):
+    def setUp(self):
+        farmer = User.objects.create_user(username='farmer', password='testpass123')
+        buyer = User.objects.create_user(username='buyer', password='testpass123')
+        self.product = Product.objects.create(
+            name='Tomato', category='VEGETABLES', description='Fresh tomatoes'
+        )
+        listing = Listing.objects.create(
+            farmer=farmer,
+            product=self.product,
+            quantity=1000,
+            price_per_unit=20,
+            unit='kg',
+            location='Pune',
+            harvest_date=date(2024, 1, 1),
+            available_from=date(2024, 1, 1)
+        )
+        
+        # 10 orders on each of 5 days
+        start = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+        for i in range(50):
+            order = Order.objects.create(
+                buyer=buyer,
+                listing=listing,
+                quantity=2,
+                total_price=40,
+                delivery_address='Pune'
+            )
+            Order.objects.filter(id=order.id).update(
+                created_at=start + timedelta(days=i // 10, minutes=i)
+            )
+
+    def test_aggregates_in_a_single_query(self):
+        with self.assertNumQueries(1):
+            daily_demand = load_daily_demand(self.product.id, 'Pune')
+        
+        # Only one row per day comes back from the database, not one per order
+        self.assertEqual(len(daily_demand), 5)
+        self.assertEqual(list(daily_demand['quantity']), [20.0] * 5)
+        self.assertEqual(str(daily_demand['date'][0]), '2024-01-01')
+
+    def test_other_locations_are_excluded(self):
+        self.assertEqual(len(load_daily_demand(self.product.id, 'Nashik')), 0)
+
+
+class MarketRollupTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Brinjal', category='VEGETABLES', description='Purple brinjal'
+        )
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(
+                product=self.product,
+                date=date(2024, 1, 1) + timedelta(days=i),
+                market_price=30 + i % 6 + offset,
+                volume_traded=50 + i,
+                source=source,
+                location='Pune'
+            )
+            for i in range(70)
+            for offset, source in ((0, 'Mandi'), (3, 'Platform'))
+        ])
+
+    def rollups(self):
+        return list(MarketRollup.objects.filter(product=self.product, location='Pune').order_by(
+            'period', 'period_start'
+        ).values_list(
+            'period', 'period_start', 'min_price', 'max_price', 'avg_price',
+            'vwap', 'total_volume', 'record_count'
+        ))
+
+    def test_weekly_rollup_aggregates_sources(self):
+        rollup_store.refresh(self.product.id, 'Pune')
+        
+        week = MarketRollup.objects.get(product=self.product, period='WEEK', period_start=date(2024, 1, 1))
+        self.assertEqual(week.record_count, 14)
+        self.assertEqual((week.min_price, week.max_price), (Decimal('30.00'), Decimal('38.00')))
+        self.assertEqual(MarketRollup.objects.filter(period='DAY').count(), 70)
+        self.assertEqual(MarketRollup.objects.filter(period='MONTH').count(), 3)
+
+    def test_incremental_refresh_matches_full_rebuild(self):
+        rollup_store.refresh(self.product.id, 'Pune')
+        
+        # A corrected price mid-week, a day that disappears and a new week
+        HistoricalPrice.objects.filter(date=date(2024, 2, 14), source='Mandi').update(market_price=90)
+        HistoricalPrice.objects.filter(date=date(2024, 2, 20)).delete()
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(
+                product=self.product,
+                date=date(2024, 3, 11) + timedelta(days=i),
+                market_price=40,
+                volume_traded=10,
+                source='Mandi',
+                location='Pune'
+            )
+            for i in range(3)
+        ])
+        rollup_store.refresh(self.product.id, 'Pune', since=date(2024, 2, 14))
+        incremental = self.rollups()
+        
+        MarketRollup.objects.all().delete()
+        rollup_store.refresh(self.product.id, 'Pune')
+        self.assertEqual(incremental, self.rollups())
+
+
+class PriceArchiveTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.archive = PriceArchive(root=self.root.name)
+        self.product = Product.objects.create(
+            name='Onion', category='VEGETABLES', description='Red onions'
+        )
+        
+        # Two sources a day across a year boundary, plus a second market
+        start = date(2023, 11, 1)
+        HistoricalPrice.objects.bulk_create([
+            HistoricalPrice(
+                product=self.product,
+                date=start + timedelta(days=i),
+                market_price=20 + i % 9 + offset,
+                volume_traded=100 + i,
+                source=source,
+                location=location
+            )
+            for i in range(90)
+            for offset, source in ((0, 'Mandi'), (2, 'Platform'))
+            for location in ('Pune', 'Nashik')
+        ])
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def test_refresh_only_rewrites_changed_partitions(self):
+        self.assertEqual(self.archive.refresh(), (2, 0))
+        self.assertEqual(self.archive.refresh(), (0, 0))
+        
+        HistoricalPrice.objects.filter(date=date(2024, 1, 5)).update(market_price=50)
+        self.assertEqual(self.archive.refresh(), (1, 0))
+        self.assertEqual(
+            self.archive.pairs(), [(self.product.id, 'Nashik'), (self.product.id, 'Pune')]
+        )
+
+    def test_frame_matches_feature_store(self):
+        self.archive.refresh()
+        
+        archived = self.archive.load_frame(self.product.id, 'Pune')
+        stored = feature_store.load_frame(self.product.id, 'Pune')
+        self.assertEqual(list(archived['date']), list(stored['date']))
+        np.testing.assert_allclose(
+            archived.drop(columns='date').to_numpy(float),
+            stored.drop(columns='date').to_numpy(float),
+            rtol=1e-6
+        )
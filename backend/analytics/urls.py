@@ -11,4 +11,6 @@ urlpatterns = [
 	path('', include(router.urls)),
 	path('historical-prices/', views.historical_prices),
 	path('generate-report/', views.generate_report),
+	path('ingest-prices/', views.PriceIngestionView.as_view()),
+	path('price-predictions-batch/', views.BatchPricePredictionView.as_view()),
 ]
\ No newline at end of file
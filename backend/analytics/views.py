@@ -1,8 +1,22 @@
-from rest_framework import views, status
+from rest_framework import viewsets, views, status, permissions
+from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from django_filters.rest_framework import DjangoFilterBackend
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.db.models import Min, Max, Sum, F
+from .batch import forecast_price_batch
+from .ingestion import PriceIngestionService
+from .models import PricePrediction, DemandForecast, MarketRollup
 from .services import MarketAnalyticsService
-from .serializers import PricePredictionSerializer, DemandForecastSerializer
-from datetime import datetime, timedelta
+from .serializers import (
+    PricePredictionSerializer, DemandForecastSerializer, MarketRollupSerializer
+)
+from datetime import datetime, date
+import json
+
+# Upper bound on the number of forecasts requested in one batch call
+MAX_BATCH_ITEMS = 200
 
 class PricePredictionView(views.APIView):
     def get(self, request):
@@ -17,20 +31,12 @@ class PricePredictionView(views.APIView):
             )
         
         try:
-            analytics_service = MarketAnalyticsService()
-            predictions = []
-            
-            for day in range(days):
-                prediction_date = datetime.now().date() + timedelta(days=day)
-                predicted_price, confidence = analytics_service.predict_price(
-                    product_id, location, prediction_date
-                )
-                
-                predictions.append({
-                    'date': prediction_date,
-                    'predicted_price': predicted_price,
-                    'confidence_score': confidence
-                })
+            analytics_service = MarketAnalyticsService(
+                engine=request.query_params.get('engine')
+            )
+            predictions = analytics_service.forecast_price_range(
+                product_id, location, datetime.now().date(), days
+            )
             
             return Response(predictions)
             
@@ -53,20 +59,12 @@ class DemandForecastView(views.APIView):
             )
         
         try:
-            analytics_service = MarketAnalyticsService()
-            forecasts = []
-            
-            for day in range(days):
-                forecast_date = datetime.now().date() + timedelta(days=day)
-                predicted_demand, confidence = analytics_service.predict_demand(
-                    product_id, location, forecast_date
-                )
-                
-                forecasts.append({
-                    'date': forecast_date,
-                    'predicted_demand': predicted_demand,
-                    'confidence_score': confidence
-                })
+            analytics_service = MarketAnalyticsService(
+                engine=request.query_params.get('engine')
+            )
+            forecasts = analytics_service.predict_demand_range(
+                product_id, location, datetime.now().date(), days
+            )
             
             return Response(forecasts)
             
@@ -74,4 +72,151 @@ class DemandForecastView(views.APIView):
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
-            ) 
\ No newline at end of file
+            )
+
+class BatchPricePredictionView(views.APIView):
+    def post(self, request):
+        """Forecast many (product_id, location, days) items, streamed as NDJSON"""
+        if not isinstance(request.data, dict):
+            return Response(
+                {'error': 'Expected a JSON object with an items list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        items = request.data.get('items')
+        
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'items must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > MAX_BATCH_ITEMS:
+            return Response(
+                {'error': f'At most {MAX_BATCH_ITEMS} items per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = forecast_price_batch(
+            items, datetime.now().date(), engine=request.data.get('engine')
+        )
+        lines = (json.dumps(result, cls=DjangoJSONEncoder) + '\n' for result in results)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+class PriceIngestionView(views.APIView):
+    permission_classes = [permissions.IsAdminUser]
+    
+    def post(self, request):
+        """Upload a CSV or NDJSON price feed for bulk ingestion"""
+        feed = request.FILES.get('file')
+        fmt = request.data.get('format')
+        
+        if feed is None:
+            return Response(
+                {'error': 'A price feed file is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if fmt and fmt not in PriceIngestionService.FORMATS:
+            return Response(
+                {'error': f'Unsupported format: {fmt}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            chunk_size = int(request.data.get('chunk_size', 5000))
+        except (TypeError, ValueError):
+            chunk_size = 0
+        if chunk_size < 1:
+            return Response(
+                {'error': 'chunk_size must be a positive integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        service = PriceIngestionService(
+            chunk_size=chunk_size,
+            default_source=request.data.get('source', 'Mandi')
+        )
+        report = service.ingest_upload(feed, fmt)
+        
+        return Response(report.as_dict())
+
+class PricePredictionViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = PricePrediction.objects.order_by('predicted_for')
+    serializer_class = PricePredictionSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['product', 'location', 'predicted_for', 'engine']
+
+class DemandForecastViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = DemandForecast.objects.order_by('forecast_for')
+    serializer_class = DemandForecastSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['product', 'location', 'forecast_for', 'engine']
+
+class MarketTrendViewSet(viewsets.ReadOnlyModelViewSet):
+    """Daily, weekly and monthly rollups, served without touching raw prices"""
+    queryset = MarketRollup.objects.order_by('period_start')
+    serializer_class = MarketRollupSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'product': ['exact'],
+        'location': ['exact'],
+        'period': ['exact'],
+        'period_start': ['gte', 'lte'],
+    }
+
+def _rollup_queryset(request, default_period):
+    """Filter rollups by the product, location, period and date range params"""
+    product_id = request.query_params.get('product_id')
+    location = request.query_params.get('location')
+    period = request.query_params.get('period', default_period).upper()
+    
+    if not all([product_id, location]):
+        raise ValueError('Missing required parameters')
+    if period not in dict(MarketRollup.PERIOD_CHOICES):
+        raise ValueError(f'Unknown period: {period}')
+    
+    rollups = MarketRollup.objects.filter(
+        product_id=product_id,
+        location=location,
+        period=period
+    )
+    if request.query_params.get('start'):
+        rollups = rollups.filter(period_start__gte=date.fromisoformat(request.query_params['start']))
+    if request.query_params.get('end'):
+        rollups = rollups.filter(period_start__lte=date.fromisoformat(request.query_params['end']))
+    return rollups.order_by('period_start')
+
+@api_view(['GET'])
+def historical_prices(request):
+    """Price history for a chart, one precomputed row per period"""
+    try:
+        rollups = _rollup_queryset(request, 'DAY')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(MarketRollupSerializer(rollups, many=True).data)
+
+@api_view(['GET'])
+def generate_report(request):
+    """Market report built from monthly rollups"""
+    try:
+        rollups = _rollup_queryset(request, 'MONTH')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    totals = rollups.aggregate(
+        lowest=Min('min_price'),
+        highest=Max('max_price'),
+        volume=Sum('total_volume'),
+        price_volume=Sum(F('vwap') * F('total_volume')),
+        records=Sum('record_count')
+    )
+    summary = {
+        'min_price': totals['lowest'],
+        'max_price': totals['highest'],
+        'total_volume': totals['volume'],
+        'vwap': round(totals['price_volume'] / totals['volume'], 2) if totals['volume'] else None,
+        'record_count': totals['records'],
+    }
+    
+    return Response({
+        'summary': summary,
+        'periods': MarketRollupSerializer(rollups, many=True).data,
+    })
@@ -0,0 +1,13 @@
+"""
+ASGI config for the AgriLink backend.
+
+Serves the live tracking streams without holding a thread per watcher.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+application = get_asgi_application()
@@ -145,8 +145,41 @@ ETHEREUM_PRIVATE_KEY = env('ETHEREUM_PRIVATE_KEY')
 PAYMENT_CONTRACT_ADDRESS = env('PAYMENT_CONTRACT_ADDRESS')
 PAYMENT_CONTRACT_BYTECODE = env('PAYMENT_CONTRACT_BYTECODE')
 
+# Analytics Settings
+ANALYTICS_MODEL_CACHE_MAX_ENTRIES = env.int('ANALYTICS_MODEL_CACHE_MAX_ENTRIES', default=256)
+ANALYTICS_MODEL_CACHE_MAX_MB = env.int('ANALYTICS_MODEL_CACHE_MAX_MB', default=512)
+ANALYTICS_BATCH_WORKERS = env.int('ANALYTICS_BATCH_WORKERS', default=4)
+ANALYTICS_MODEL_STORE_DIR = env('ANALYTICS_MODEL_STORE_DIR', default=str(BASE_DIR / 'model_store'))
+ANALYTICS_PRICE_ARCHIVE_DIR = env('ANALYTICS_PRICE_ARCHIVE_DIR', default=str(BASE_DIR / 'price_archive'))
+
 # Google Maps Settings
 GOOGLE_MAPS_API_KEY = env('GOOGLE_MAPS_API_KEY')
+LOGISTICS_DISTANCE_CACHE_TTL = env.int('LOGISTICS_DISTANCE_CACHE_TTL', default=7 * 24 * 3600)
+LOGISTICS_DISTANCE_PROVIDER = env('LOGISTICS_DISTANCE_PROVIDER', default='google')  # google or haversine
+LOGISTICS_DISTANCE_MATRIX_WORKERS = env.int('LOGISTICS_DISTANCE_MATRIX_WORKERS', default=4)
+LOGISTICS_DISTANCE_MATRIX_RETRIES = env.int('LOGISTICS_DISTANCE_MATRIX_RETRIES', default=3)
+LOGISTICS_SOLVER_TIME_LIMIT_SECONDS = env.int('LOGISTICS_SOLVER_TIME_LIMIT_SECONDS', default=10)
+LOGISTICS_REOPTIMIZE_TIME_LIMIT_MS = env.int('LOGISTICS_REOPTIMIZE_TIME_LIMIT_MS', default=100)
+LOGISTICS_JOB_TIME_BUDGET_SECONDS = env.int('LOGISTICS_JOB_TIME_BUDGET_SECONDS', default=30)
+LOGISTICS_JOB_MAX_TIME_BUDGET_SECONDS = env.int('LOGISTICS_JOB_MAX_TIME_BUDGET_SECONDS', default=300)
+LOGISTICS_OPTIMIZATION_WORKERS = env.int('LOGISTICS_OPTIMIZATION_WORKERS', default=2)
+LOGISTICS_TRACKING_BUFFER_SIZE = env.int('LOGISTICS_TRACKING_BUFFER_SIZE', default=200)
+LOGISTICS_TRACKING_FLUSH_SECONDS = env.float('LOGISTICS_TRACKING_FLUSH_SECONDS', default=5)
+LOGISTICS_TRAJECTORY_TOLERANCE_M = env.float('LOGISTICS_TRAJECTORY_TOLERANCE_M', default=25)
+LOGISTICS_VEHICLE_INDEX_CELL_KM = env.float('LOGISTICS_VEHICLE_INDEX_CELL_KM', default=5)
+LOGISTICS_VEHICLE_INDEX_MAX_AGE_SECONDS = env.int('LOGISTICS_VEHICLE_INDEX_MAX_AGE_SECONDS', default=60)
+LOGISTICS_VEHICLE_SEARCH_RADIUS_KM = env.float('LOGISTICS_VEHICLE_SEARCH_RADIUS_KM', default=50)
+LOGISTICS_ETA_MODEL_PATH = env('LOGISTICS_ETA_MODEL_PATH', default=str(BASE_DIR / 'eta_model' / 'speeds.npz'))
+LOGISTICS_ETA_CELL_KM = env.float('LOGISTICS_ETA_CELL_KM', default=10)
+LOGISTICS_ETA_PRIOR_SECONDS = env.float('LOGISTICS_ETA_PRIOR_SECONDS', default=900)
+LOGISTICS_ETA_STOP_MINUTES = env.float('LOGISTICS_ETA_STOP_MINUTES', default=10)
+LOGISTICS_ETA_ARRIVAL_RADIUS_M = env.float('LOGISTICS_ETA_ARRIVAL_RADIUS_M', default=300)
+# Events are published by the IoT consumer and job workers, not the streaming processes
+LOGISTICS_EVENT_CHANNEL_URL = env('LOGISTICS_EVENT_CHANNEL_URL', default=env('REDIS_URL', default='redis://localhost:6379/0'))
+LOGISTICS_STREAM_QUEUE_SIZE = env.int('LOGISTICS_STREAM_QUEUE_SIZE', default=100)
+LOGISTICS_STREAM_HEARTBEAT_SECONDS = env.int('LOGISTICS_STREAM_HEARTBEAT_SECONDS', default=15)
+LOGISTICS_CIRCUITY_FACTOR = env.float('LOGISTICS_CIRCUITY_FACTOR', default=1.3)
+LOGISTICS_AVERAGE_SPEED_KMH = env.float('LOGISTICS_AVERAGE_SPEED_KMH', default=35)
 
 # IoT Settings
 MQTT_BROKER_HOST = env('MQTT_BROKER_HOST')
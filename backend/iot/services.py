@@ -1,8 +1,10 @@
+import json
 import paho.mqtt.client as mqtt
 from django.conf import settings
 from datetime import datetime
 from .models import IoTDevice, SensorReading
-from logistics.models import DeliveryTracking
+from logistics.spatial import vehicle_index
+from logistics.tracking import tracking_buffer
 
 class IoTService:
     def __init__(self):
@@ -24,6 +26,13 @@ class IoTService:
             60
         )
         self.client.loop_start()
+        tracking_buffer.start()
+    
+    def disconnect(self):
+        """Stop the MQTT loop and write any buffered GPS fixes"""
+        self.client.loop_stop()
+        self.client.disconnect()
+        tracking_buffer.stop()
     
     def on_connect(self, client, userdata, flags, rc):
         """Subscribe to device topics on connect"""
@@ -51,13 +60,20 @@ class IoTService:
                 raw_data=payload
             )
             
-            # Update delivery tracking if location data is available
+            # Keep the vehicle position fresh for nearest vehicle lookups,
+            # the stored position is written with the next buffer flush
             if reading.latitude and reading.longitude:
-                DeliveryTracking.objects.create(
-                    route=device.vehicle.route_set.filter(status='IN_PROGRESS').first(),
-                    location=f"{reading.latitude},{reading.longitude}",
-                    latitude=reading.latitude,
-                    longitude=reading.longitude,
+                tracking_buffer.move_vehicle(device.vehicle_id, reading.latitude, reading.longitude)
+                vehicle_index.move(device.vehicle_id, float(reading.latitude), float(reading.longitude))
+            
+            # Update delivery tracking if location data is available,
+            # fixes are buffered and written in bulk
+            route = device.vehicle.route_set.filter(status='IN_PROGRESS').first()
+            if reading.latitude and reading.longitude and route is not None:
+                tracking_buffer.add(
+                    route.id,
+                    reading.latitude,
+                    reading.longitude,
                     temperature=reading.temperature,
                     humidity=reading.humidity
                 )
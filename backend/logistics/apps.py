@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class LogisticsConfig(AppConfig):
+    name = 'logistics'
+
+    def ready(self):
+        # Register live route event publishers
+        from . import signals  # noqa: F401
@@ -0,0 +1,81 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+
+
+def normalize_location(location):
+    """Collapse whitespace and case so equivalent addresses share cache cells"""
+    return ' '.join(location.split()).casefold()
+
+
+class DistanceCache:
+    """Shared (origin, destination) -> (meters, seconds) cache
+
+    Cells live in a Django cache backend (Redis in production) for
+    ``LOGISTICS_DISTANCE_CACHE_TTL`` seconds. Hit and miss counters are kept
+    in the same backend so the ratio covers every worker process.
+    """
+
+    prefix = 'logistics:distance'
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self._timeout = timeout
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def timeout(self):
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, 'LOGISTICS_DISTANCE_CACHE_TTL', 7 * 24 * 3600)
+
+    def make_key(self, origin, destination):
+        pair = f'{normalize_location(origin)}\x1f{normalize_location(destination)}'
+        return f'{self.prefix}:{hashlib.sha1(pair.encode()).hexdigest()}'
+
+    def get_many(self, pairs):
+        """Cached cells for the given pairs, keyed by (origin, destination)"""
+        keys = {self.make_key(*pair): pair for pair in pairs}
+        found = self.backend.get_many(list(keys))
+        self._count('hits', len(found))
+        self._count('misses', len(keys) - len(found))
+        return {keys[key]: tuple(cell) for key, cell in found.items()}
+
+    def set_many(self, cells):
+        """Store {(origin, destination): (meters, seconds)}"""
+        if cells:
+            self.backend.set_many(
+                {self.make_key(*pair): cell for pair, cell in cells.items()},
+                timeout=self.timeout
+            )
+
+    def _count(self, name, amount):
+        if not amount:
+            return
+        key = f'{self.prefix}:stats:{name}'
+        try:
+            self.backend.incr(key, amount)
+        except ValueError:
+            # First count, add is a no-op if another worker beat us to it
+            self.backend.add(key, 0, timeout=None)
+            self.backend.incr(key, amount)
+
+    def stats(self):
+        counts = self.backend.get_many([f'{self.prefix}:stats:hits', f'{self.prefix}:stats:misses'])
+        hits = counts.get(f'{self.prefix}:stats:hits', 0)
+        misses = counts.get(f'{self.prefix}:stats:misses', 0)
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+        }
+
+    def reset_stats(self):
+        self.backend.delete_many([f'{self.prefix}:stats:hits', f'{self.prefix}:stats:misses'])
+
+
+distance_cache = DistanceCache()
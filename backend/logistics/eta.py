@@ -0,0 +1,308 @@
+import os
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+from .distances import normalize_location
+from .models import DeliveryTracking, GazetteerEntry, Route
+from .providers import COORDINATES_PATTERN, EARTH_RADIUS_M
+from .spatial import KM_PER_DEGREE, distances_km
+
+# Cell keys are row * CELL_STRIDE + column, unique while columns stay below half the stride
+CELL_STRIDE = 1 << 24
+
+# Consecutive fixes further apart than this are not one continuous drive
+MAX_SEGMENT_SECONDS = 15 * 60
+
+# Segment speeds outside this range are parked vehicles or GPS glitches
+MIN_SPEED_KMH = 2
+MAX_SPEED_KMH = 150
+
+
+def default_speed():
+    """Fallback speed in meters per second"""
+    return getattr(settings, 'LOGISTICS_AVERAGE_SPEED_KMH', 35) / 3.6
+
+
+class SpeedTable:
+    """Learned travel speeds by map cell and hour of day
+
+    ``keys`` holds the sorted cell keys and ``speeds`` one row of 24 hourly
+    speeds (meters per second) per key; ``hourly`` is the fleet-wide speed by
+    hour for cells without history. Lookups are a binary search into the
+    keys, so a table covering a whole country is a few hundred kilobytes.
+    """
+
+    def __init__(self, cell_km, keys, speeds, hourly):
+        self.cell_km = float(cell_km)
+        self.cell_deg = self.cell_km / KM_PER_DEGREE
+        self.keys = keys
+        self.speeds = speeds
+        self.hourly = hourly
+
+    @classmethod
+    def empty(cls, cell_km=None):
+        cell_km = cell_km or getattr(settings, 'LOGISTICS_ETA_CELL_KM', 10)
+        return cls(cell_km, np.empty(0, dtype=np.int64), np.empty((0, 24), dtype=np.float32),
+                   np.full(24, default_speed(), dtype=np.float32))
+
+    def cell_keys(self, latitudes, longitudes):
+        rows = np.floor(np.asarray(latitudes, dtype=float) / self.cell_deg).astype(np.int64)
+        cols = np.floor(np.asarray(longitudes, dtype=float) / self.cell_deg).astype(np.int64)
+        return rows * CELL_STRIDE + cols
+
+    def profiles(self, latitudes, longitudes):
+        """Hourly speed rows for each point, the fleet-wide profile for unknown cells"""
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        if len(self.keys) == 0:
+            return np.broadcast_to(self.hourly, (len(latitudes), 24))
+        # Points without coordinates come in as NaN
+        located = np.isfinite(latitudes) & np.isfinite(longitudes)
+        keys = self.cell_keys(np.where(located, latitudes, 0.0), np.where(located, longitudes, 0.0))
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        known = located & (self.keys[positions] == keys)
+        return np.where(known[:, None], self.speeds[positions], self.hourly[None, :])
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.speeds.nbytes + self.hourly.nbytes
+
+    def save(self, path):
+        """Write the table atomically, readers see the old or the new file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staging = path.with_name(f'.{path.stem}.{uuid.uuid4().hex}.npz')
+        np.savez(staging, cell_km=self.cell_km, keys=self.keys, speeds=self.speeds, hourly=self.hourly)
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(float(data['cell_km']), data['keys'], data['speeds'], data['hourly'])
+
+
+def learn_speed_table(since=None, cell_km=None, prior_seconds=None):
+    """Fit a SpeedTable from the DeliveryTracking history
+
+    Every pair of consecutive fixes of a route is a segment, bucketed by the
+    cell of its midpoint and the local hour it started in. A bucket's speed
+    is its total distance over its total time, shrunk towards the hourly
+    fleet-wide speed by ``prior_seconds`` of pseudo-observations so thinly
+    observed cells stay close to the average.
+    """
+    table = SpeedTable.empty(cell_km)
+    prior_seconds = prior_seconds or getattr(settings, 'LOGISTICS_ETA_PRIOR_SECONDS', 900)
+
+    fixes = DeliveryTracking.objects.order_by('route_id', 'timestamp')
+    if since is not None:
+        fixes = fixes.filter(timestamp__gte=since)
+    frame = pd.DataFrame.from_records(
+        fixes.values_list('route_id', 'timestamp', 'latitude', 'longitude').iterator(chunk_size=10000),
+        columns=['route', 'timestamp', 'latitude', 'longitude']
+    )
+    if len(frame) < 2:
+        return table
+
+    routes = frame['route'].to_numpy()
+    timestamps = pd.to_datetime(frame['timestamp'], utc=True)
+    seconds = ((timestamps - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy()
+    local_hours = timestamps.dt.tz_convert(settings.TIME_ZONE).dt.hour.to_numpy()
+    latitudes = frame['latitude'].astype(float).to_numpy()
+    longitudes = frame['longitude'].astype(float).to_numpy()
+
+    # Segment lengths between consecutive fixes of the same route
+    elapsed = np.diff(seconds)
+    lat0, lat1 = np.radians(latitudes[:-1]), np.radians(latitudes[1:])
+    hav = (np.sin((lat1 - lat0) / 2) ** 2
+           + np.cos(lat0) * np.cos(lat1) * np.sin(np.radians(longitudes[1:] - longitudes[:-1]) / 2) ** 2)
+    meters = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(hav, 0.0, 1.0)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed_kmh = meters / elapsed * 3.6
+    valid = ((routes[1:] == routes[:-1]) & (elapsed > 0) & (elapsed <= MAX_SEGMENT_SECONDS)
+             & (speed_kmh >= MIN_SPEED_KMH) & (speed_kmh <= MAX_SPEED_KMH))
+    if not valid.any():
+        return table
+
+    meters, elapsed = meters[valid], elapsed[valid]
+    hours = local_hours[:-1][valid].astype(np.int64)
+    cells = table.cell_keys((latitudes[:-1][valid] + latitudes[1:][valid]) / 2,
+                            (longitudes[:-1][valid] + longitudes[1:][valid]) / 2)
+
+    # Fleet-wide hourly speeds, themselves shrunk towards the configured average
+    hour_meters = np.bincount(hours, weights=meters, minlength=24)
+    hour_seconds = np.bincount(hours, weights=elapsed, minlength=24)
+    hourly = (hour_meters + default_speed() * prior_seconds) / (hour_seconds + prior_seconds)
+
+    keys, inverse = np.unique(cells, return_inverse=True)
+    buckets = inverse * 24 + hours
+    bucket_meters = np.bincount(buckets, weights=meters, minlength=len(keys) * 24).reshape(-1, 24)
+    bucket_seconds = np.bincount(buckets, weights=elapsed, minlength=len(keys) * 24).reshape(-1, 24)
+    speeds = (bucket_meters + hourly[None, :] * prior_seconds) / (bucket_seconds + prior_seconds)
+
+    return SpeedTable(table.cell_km, keys.astype(np.int64), speeds.astype(np.float32), hourly.astype(np.float32))
+
+
+def locate_stops(stops):
+    """Add latitude and longitude to stops whose location can be geocoded
+
+    Locations are read as literal "lat,lng" strings or looked up in the
+    gazetteer; stops that resolve to neither are left without coordinates.
+    """
+    lookup = {}
+    for stop in stops:
+        if 'latitude' in stop:
+            continue
+        match = COORDINATES_PATTERN.match(stop['location'] or '')
+        if match:
+            stop['latitude'], stop['longitude'] = float(match.group(1)), float(match.group(2))
+        else:
+            lookup.setdefault(normalize_location(stop['location'] or ''), []).append(stop)
+    if lookup:
+        for entry in GazetteerEntry.objects.filter(normalized_name__in=list(lookup)):
+            for stop in lookup[entry.normalized_name]:
+                stop['latitude'], stop['longitude'] = entry.latitude, entry.longitude
+    return stops
+
+
+class EtaEngine:
+    """Route and remaining-time ETAs from a learned SpeedTable
+
+    Each leg takes its road distance over the speed of the cell it starts
+    in, at the hour the vehicle is expected to get there, plus a fixed
+    handling time at every delivery stop. The table is trained offline by
+    ``train_eta_model`` and reloaded whenever the file changes.
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._table = None
+
+    @property
+    def path(self):
+        return Path(self._path or settings.LOGISTICS_ETA_MODEL_PATH)
+
+    @property
+    def stop_seconds(self):
+        return getattr(settings, 'LOGISTICS_ETA_STOP_MINUTES', 10) * 60
+
+    def table(self):
+        # Reload when the trainer replaced the file since we read it
+        try:
+            modified = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            modified = None
+        if self._table is None or self._table[0] != modified:
+            table = SpeedTable.load(self.path) if modified is not None else SpeedTable.empty()
+            self._table = (modified, table)
+        return self._table[1]
+
+    def train(self, since=None):
+        table = learn_speed_table(since)
+        table.save(self.path)
+        self._table = None
+        return table
+
+    def schedule(self, stops, departure, first=1, start=None):
+        """Unix arrival times at stops[first:]
+
+        The vehicle leaves ``start`` (a (lat, lng, meters to stops[first])
+        tuple, by default stops[first - 1]) at ``departure``.
+        """
+        departure = departure.timestamp() if isinstance(departure, datetime) else float(departure)
+        if first >= len(stops):
+            return []
+
+        # Leg origins are the previous stop, or the current position for the first leg
+        origins = stops[first - 1:len(stops) - 1]
+        latitudes = [stop.get('latitude', np.nan) for stop in origins]
+        longitudes = [stop.get('longitude', np.nan) for stop in origins]
+        meters = [float(stop['distance']) for stop in origins]
+        if start is not None:
+            latitudes[0], longitudes[0], meters[0] = start
+        profiles = self.table().profiles(latitudes, longitudes).tolist()
+
+        offset = timezone.localtime(datetime.fromtimestamp(departure, dt_timezone.utc)).utcoffset().total_seconds()
+        dwell = self.stop_seconds
+        arrivals = []
+        at = departure
+        for leg_meters, profile in zip(meters, profiles):
+            at += leg_meters / profile[int((at + offset) // 3600 % 24)]
+            arrivals.append(at)
+            at += dwell
+        return arrivals
+
+    def route_seconds(self, stops, departure=None):
+        """Expected seconds from leaving the first stop to finishing at the last"""
+        departure = (departure or timezone.now()).timestamp()
+        arrivals = self.schedule(stops, departure)
+        return arrivals[-1] + self.stop_seconds - departure if arrivals else 0
+
+    def update_route(self, route, latitude, longitude, at):
+        """Advance a route's progress to a GPS fix and refresh its ETAs
+
+        Stops within LOGISTICS_ETA_ARRIVAL_RADIUS_M of the fix, and every
+        stop before them, count as reached. Stops without coordinates count
+        as reached once their last predicted arrival has passed. The result
+        is stored in route.eta_data and returned.
+        """
+        stops = route.route_data or []
+        eta = dict(route.eta_data or {})
+        arrivals = list(eta.get('arrivals') or [None] * len(stops))
+        arrivals += [None] * (len(stops) - len(arrivals))
+        next_stop = max(eta.get('next_stop', 1), 1)
+        now = at.timestamp()
+
+        radius_km = getattr(settings, 'LOGISTICS_ETA_ARRIVAL_RADIUS_M', 300) / 1000
+        remaining = stops[next_stop:]
+        located = np.array([index for index, stop in enumerate(remaining) if 'latitude' in stop], dtype=np.int64)
+        if len(located):
+            km = distances_km(latitude, longitude,
+                              [remaining[i]['latitude'] for i in located],
+                              [remaining[i]['longitude'] for i in located])
+            reached = located[km <= radius_km]
+            if len(reached):
+                for index in range(next_stop, next_stop + int(reached.max()) + 1):
+                    if arrivals[index] is None or arrivals[index] > now:
+                        arrivals[index] = now
+                next_stop += int(reached.max()) + 1
+        while (next_stop < len(stops) and 'latitude' not in stops[next_stop]
+               and arrivals[next_stop] is not None and arrivals[next_stop] <= now):
+            next_stop += 1
+
+        if next_stop < len(stops):
+            target = stops[next_stop]
+            if 'latitude' in target:
+                meters = distances_km(latitude, longitude, [target['latitude']], [target['longitude']])[0] * 1000
+                meters *= getattr(settings, 'LOGISTICS_CIRCUITY_FACTOR', 1.3)
+            else:
+                meters = float(stops[next_stop - 1]['distance'])
+            arrivals[next_stop:] = self.schedule(stops, now, next_stop, start=(latitude, longitude, meters))
+            completion = arrivals[-1] + self.stop_seconds
+        else:
+            completion = now
+
+        route.eta_data = {
+            'next_stop': next_stop,
+            'arrivals': arrivals,
+            'completion': completion,
+            'remaining_seconds': round(completion - now),
+            'updated_at': now,
+        }
+        return route.eta_data
+
+
+eta_engine = EtaEngine()
+
+
+def update_route_eta(route_id, fix):
+    """Refresh a route's live ETA from its latest GPS fix"""
+    route = Route.objects.filter(id=route_id).only('route_data', 'eta_data').first()
+    if route is None or not route.route_data:
+        return None
+    eta_engine.update_route(route, float(fix.latitude), float(fix.longitude), fix.timestamp)
+    route.save(update_fields=['eta_data'])
+    return route.eta_data
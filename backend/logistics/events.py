@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import redis
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Without redis events only reach subscribers of the same process
+    redis = redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+
+class RouteEventBroker:
+    """In-process fan-out of route events to streaming subscribers
+
+    Every subscriber gets a bounded queue on its event loop. Events are
+    published to a Redis channel, and each worker runs a single relay that
+    reads the channel and hands every event to the local queues of that
+    route, so the number of watchers adds neither Redis nor database load.
+    Without a channel URL, events go straight to the local subscribers.
+    A subscriber that falls behind loses its oldest events, not new ones.
+    """
+
+    channel = 'logistics:route-events'
+
+    def __init__(self, url=None, queue_size=None):
+        self._url = url
+        self._queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._client = None
+        self._relay = None
+
+    @property
+    def url(self):
+        if self._url is not None:
+            return self._url
+        return getattr(settings, 'LOGISTICS_EVENT_CHANNEL_URL', '')
+
+    @property
+    def queue_size(self):
+        return self._queue_size or getattr(settings, 'LOGISTICS_STREAM_QUEUE_SIZE', 100)
+
+    @property
+    def remote(self):
+        return bool(self.url) and redis is not None
+
+    def subscriber_count(self, route_id=None):
+        with self._lock:
+            if route_id is not None:
+                return len(self._subscribers.get(route_id, ()))
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, route_id, event, data):
+        """Send an event to every subscriber of the route, in any worker"""
+        message = json.dumps({'route': route_id, 'event': event, 'data': data}, cls=DjangoJSONEncoder)
+        if not self.remote:
+            self.dispatch(message)
+            return
+        try:
+            if self._client is None:
+                self._client = redis.Redis.from_url(self.url)
+            self._client.publish(self.channel, message)
+        except redis.RedisError:
+            # Live updates are best effort, tracking data is already stored
+            logger.exception('Could not publish route event')
+
+    def dispatch(self, message):
+        """Hand a published message to the local subscribers of its route"""
+        payload = json.loads(message)
+        with self._lock:
+            subscribers = list(self._subscribers.get(payload['route'], ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, payload)
+            except RuntimeError:
+                pass  # The subscriber's loop has closed
+
+    @staticmethod
+    def _offer(queue, payload):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(payload)
+
+    async def _run_relay(self):
+        backoff = 1
+        while True:
+            try:
+                client = redis_asyncio.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    backoff = 1
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.dispatch(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Route event relay disconnected, retrying in %ss', backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _ensure_relay(self):
+        # One relay per worker, on the loop that serves the streams
+        if self.remote and (self._relay is None or self._relay.done()):
+            self._relay = asyncio.get_running_loop().create_task(self._run_relay())
+
+    def subscribe(self, route_id):
+        """Start queueing the route's events for the running event loop
+
+        Subscribe before reading the state the events update, so nothing
+        published in between is lost; such events may repeat that state.
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[route_id].add((asyncio.get_running_loop(), queue))
+        self._ensure_relay()
+        return queue
+
+    def unsubscribe(self, route_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(route_id, set())
+            subscribers.difference_update([entry for entry in subscribers if entry[1] is queue])
+            if not subscribers:
+                self._subscribers.pop(route_id, None)
+
+    async def listen(self, route_id, heartbeat=None, queue=None):
+        """Yield the route's events as they arrive, or None every ``heartbeat`` idle seconds
+
+        Reads from ``queue`` when given one from ``subscribe``, and
+        unsubscribes when the iteration ends.
+        """
+        queue = queue or self.subscribe(route_id)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.unsubscribe(route_id, queue)
+
+
+route_events = RouteEventBroker()
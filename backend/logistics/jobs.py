@@ -0,0 +1,177 @@
+import hashlib
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from marketplace.models import Order
+from .events import route_events
+from .models import RouteOptimizationJob
+from .services import RouteOptimizationService
+
+# Extra time a running job gets beyond its budget before it is reclaimed,
+# covering the distance fetch and saving the route
+RECLAIM_GRACE_SECONDS = 60
+
+# Runs of a job before it is failed for good, e.g. a solve that kills its worker
+MAX_ATTEMPTS = 3
+
+# Tries to queue a job that races with duplicates of the same request
+SUBMIT_ATTEMPTS = 3
+
+
+def job_events_key(job_id):
+    """Key of a job's events on the route event broker"""
+    return f'job:{job_id}'
+
+
+def job_event(job):
+    return {
+        'job_id': str(job.id),
+        'status': job.status,
+        'route': job.route_id,
+        'error': job.error or None,
+    }
+
+
+def request_key(vehicle_id, order_ids):
+    """Identity of an optimization request, independent of the order id ordering"""
+    orders = ','.join(str(order_id) for order_id in sorted(set(order_ids)))
+    return hashlib.sha256(f'{vehicle_id}:{orders}'.encode()).hexdigest()
+
+
+def time_budget(requested=None):
+    """Requested solver budget in seconds, defaulted and capped by the settings"""
+    if requested is None:
+        return getattr(settings, 'LOGISTICS_JOB_TIME_BUDGET_SECONDS', 30)
+    return max(1, min(int(requested), getattr(settings, 'LOGISTICS_JOB_MAX_TIME_BUDGET_SECONDS', 300)))
+
+
+def submit_route_job(vehicle, orders, time_budget_seconds=None):
+    """Queue a route optimization, returning (job, created)
+
+    A queued or running job for the same vehicle and order set is returned
+    instead of queueing a duplicate.
+    """
+    order_ids = sorted({order.id for order in orders})
+    key = request_key(vehicle.id, order_ids)
+    active = RouteOptimizationJob.objects.filter(
+        request_key=key, status__in=RouteOptimizationJob.ACTIVE_STATUSES
+    )
+
+    for attempt in range(SUBMIT_ATTEMPTS):
+        job = active.first()
+        if job is not None:
+            return job, False
+        try:
+            # The partial unique constraint settles races between web workers
+            with transaction.atomic():
+                job = RouteOptimizationJob.objects.create(
+                    vehicle=vehicle,
+                    order_ids=order_ids,
+                    request_key=key,
+                    time_budget_seconds=time_budget(time_budget_seconds)
+                )
+            return job, True
+        except IntegrityError:
+            # The conflicting job may have finished since, then queue anew
+            if attempt == SUBMIT_ATTEMPTS - 1:
+                raise
+
+
+def claim_next_job():
+    """Mark the oldest runnable job as RUNNING for this worker, or return None
+
+    Jobs whose worker died past their deadline are picked up again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = RouteOptimizationJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status='QUEUED') | Q(status='RUNNING', deadline_at__lt=now)
+        ).order_by('created_at').first()
+        if job is None:
+            return None
+
+        job.status = 'RUNNING'
+        job.attempts += 1
+        job.started_at = now
+        job.deadline_at = now + timedelta(seconds=job.time_budget_seconds + RECLAIM_GRACE_SECONDS)
+        job.save(update_fields=['status', 'attempts', 'started_at', 'deadline_at'])
+        return job
+
+
+def _holds_claim(job):
+    """Lock the job's row and check no other worker reclaimed it since this claim
+
+    Must run inside a transaction. A job that ran past its deadline may have
+    been claimed again, and then the newer claim owns the outcome.
+    """
+    current = RouteOptimizationJob.objects.select_for_update().filter(
+        pk=job.pk
+    ).values_list('status', 'attempts').first()
+    return current == ('RUNNING', job.attempts)
+
+
+def _finish(job, status, route=None, error=''):
+    job.status = status
+    job.route = route
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'route', 'error', 'finished_at'])
+    data = job_event(job)
+    transaction.on_commit(lambda: route_events.publish(job_events_key(job.id), 'job', data))
+
+
+def _fail(job, error):
+    with transaction.atomic():
+        if _holds_claim(job):
+            _finish(job, 'FAILED', error=error)
+
+
+def run_route_job(job, service=None):
+    """Solve a claimed job within its time budget and store the resulting Route"""
+    if job.attempts > MAX_ATTEMPTS:
+        _fail(job, f'Gave up after {MAX_ATTEMPTS} attempts')
+        return job
+
+    vehicle = job.vehicle
+    orders = list(Order.objects.filter(id__in=job.order_ids).select_related('listing'))
+    if len(orders) != len(job.order_ids):
+        _fail(job, 'Some orders no longer exist')
+        return job
+    if not vehicle.is_available:
+        _fail(job, 'Vehicle is not available')
+        return job
+
+    service = service or RouteOptimizationService()
+    try:
+        optimized_route = service.optimize_route(
+            orders, vehicle, time_limit_seconds=job.time_budget_seconds
+        )
+        if not optimized_route:
+            _fail(job, 'Could not optimize route')
+            return job
+        with transaction.atomic():
+            if _holds_claim(job):
+                route = service.save_route(vehicle, orders, optimized_route)
+                _finish(job, 'SUCCEEDED', route=route)
+    except Exception as e:
+        _fail(job, str(e))
+    return job
+
+
+def run_worker(poll_interval=1.0, once=False):
+    """Claim and run jobs until stopped, or until the queue is empty with ``once``"""
+    service = RouteOptimizationService()
+    processed = 0
+    while True:
+        close_old_connections()
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        run_route_job(job, service)
+        processed += 1
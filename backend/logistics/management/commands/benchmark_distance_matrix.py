@@ -0,0 +1,39 @@
+import statistics
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from logistics.providers import HaversineProvider
+
+
+class Command(BaseCommand):
+    help = 'Time the offline haversine distance matrix on random points across India'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, default=1000)
+        parser.add_argument('--repeats', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        
+        # Roughly the bounding box of the Indian mainland
+        coordinates = {
+            f'stop-{i}': (lat, lng)
+            for i, (lat, lng) in enumerate(zip(
+                rng.uniform(8.0, 32.0, options['stops']),
+                rng.uniform(68.0, 90.0, options['stops'])
+            ))
+        }
+        provider = HaversineProvider(coordinates=coordinates)
+        locations = list(coordinates)
+        
+        samples = []
+        for _ in range(options['repeats']):
+            started = time.perf_counter()
+            provider.travel_matrices(locations)
+            samples.append((time.perf_counter() - started) * 1000)
+        
+        self.stdout.write(
+            f"{options['stops']}x{options['stops']} matrix: "
+            f'median {statistics.median(samples):.2f} ms, min {min(samples):.2f} ms'
+        )
@@ -0,0 +1,49 @@
+import statistics
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from logistics.models import Vehicle
+from logistics.spatial import VehicleIndex
+
+
+class Command(BaseCommand):
+    help = 'Time nearest available vehicle lookups on a random fleet across India'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicles', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--radius-km', type=float, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        types = [code for code, _ in Vehicle.VEHICLE_TYPES]
+        
+        # Roughly the bounding box of the Indian mainland
+        index = VehicleIndex()
+        started = time.perf_counter()
+        for i in range(options['vehicles']):
+            index.update(Vehicle(
+                id=i + 1,
+                vehicle_type=types[i % len(types)],
+                capacity_kg=float(rng.choice([500, 1000, 3000, 9000])),
+                is_available=True,
+                latitude=rng.uniform(8.0, 32.0),
+                longitude=rng.uniform(68.0, 90.0)
+            ))
+        built = (time.perf_counter() - started) * 1000
+        
+        samples = []
+        for latitude, longitude in zip(rng.uniform(8.0, 32.0, options['queries']),
+                                       rng.uniform(68.0, 90.0, options['queries'])):
+            started = time.perf_counter()
+            index.nearest(latitude, longitude, options['k'], vehicle_type='TRUCK',
+                          min_capacity_kg=1000, radius_km=options['radius_km'])
+            samples.append((time.perf_counter() - started) * 1000)
+        
+        self.stdout.write(
+            f"{options['vehicles']} vehicles indexed in {built:.0f} ms, "
+            f"k={options['k']} within {options['radius_km']:g} km: "
+            f'median {statistics.median(samples):.3f} ms, p99 {np.percentile(samples, 99):.3f} ms'
+        )
@@ -0,0 +1,42 @@
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from logistics.distances import normalize_location
+from logistics.models import GazetteerEntry
+
+
+class Command(BaseCommand):
+    help = 'Load place coordinates for the offline distance provider from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with name, latitude, longitude and optional state, circuity_factor columns')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as f:
+                entries = {}
+                for line, row in enumerate(csv.DictReader(f), start=2):
+                    try:
+                        entry = GazetteerEntry(
+                            name=row['name'].strip(),
+                            normalized_name=normalize_location(row['name']),
+                            state=(row.get('state') or '').strip(),
+                            latitude=float(row['latitude']),
+                            longitude=float(row['longitude']),
+                            circuity_factor=float(row['circuity_factor']) if row.get('circuity_factor') else None
+                        )
+                    except (KeyError, ValueError) as e:
+                        raise CommandError(f'Line {line}: {e}')
+                    # Later rows win for names that normalize alike
+                    entries[entry.normalized_name] = entry
+        except OSError as e:
+            raise CommandError(str(e))
+        
+        GazetteerEntry.objects.bulk_create(
+            list(entries.values()),
+            batch_size=options['batch_size'],
+            update_conflicts=True,
+            unique_fields=['normalized_name'],
+            update_fields=['name', 'state', 'latitude', 'longitude', 'circuity_factor']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(entries)} gazetteer entries'))
@@ -0,0 +1,45 @@
+import multiprocessing
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from logistics.jobs import run_worker
+
+
+def _worker(poll_interval, once):
+    # Each process opens its own database connection
+    connections.close_all()
+    run_worker(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of route optimization workers that solve queued jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Solver processes (defaults to LOGISTICS_OPTIMIZATION_WORKERS)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds between queue checks when idle')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or settings.LOGISTICS_OPTIMIZATION_WORKERS
+        self.stdout.write(f'Starting {workers} route optimization workers')
+        
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=_worker, args=(options['poll_interval'], options['once']), daemon=True
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+        
+        self.stdout.write(self.style.SUCCESS('Route optimization workers stopped'))
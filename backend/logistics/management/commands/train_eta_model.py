@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from logistics.eta import eta_engine
+
+
+class Command(BaseCommand):
+    help = 'Learn travel speeds by map cell and hour of day from the delivery tracking history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='History window, 0 for all fixes')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        table = eta_engine.train(since)
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'Learned speeds for {len(table.keys)} cells ({table.nbytes / 1024:.0f} KiB) '
+            f'into {eta_engine.path}'
+        ))
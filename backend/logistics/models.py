@@ -1,4 +1,6 @@
+import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from marketplace.models import Order
 
@@ -18,10 +20,18 @@ class Vehicle(models.Model):
     capacity_kg = models.DecimalField(max_digits=8, decimal_places=2)
     is_available = models.BooleanField(default=True)
     current_location = models.CharField(max_length=200, null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    location_updated_at = models.DateTimeField(null=True, blank=True)  # Time of the last GPS fix
     gps_device_id = models.CharField(max_length=50, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_available', 'latitude', 'longitude']),
+        ]
+
     def __str__(self):
         return f"{self.registration_number} ({self.vehicle_type})"
 
@@ -43,15 +53,66 @@ class Route(models.Model):
     actual_end_time = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     route_data = models.JSONField()  # Stores waypoints and route details
+    eta_data = models.JSONField(default=dict, blank=True)  # Live progress and predicted arrivals
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Route {self.id}: {self.start_location} to {self.end_location}"
 
+class RouteOptimizationJob(models.Model):
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ['QUEUED', 'RUNNING']
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.CASCADE)
+    order_ids = models.JSONField()
+    request_key = models.CharField(max_length=64)  # Hash of vehicle and order set, for de-duplication
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    time_budget_seconds = models.IntegerField()
+    route = models.ForeignKey(Route, on_delete=models.SET_NULL, null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    deadline_at = models.DateTimeField(null=True, blank=True)  # Running jobs past this are reclaimed
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+        constraints = [
+            # At most one queued or running job per vehicle and order set
+            models.UniqueConstraint(
+                fields=['request_key'],
+                condition=models.Q(status__in=['QUEUED', 'RUNNING']),
+                name='unique_active_route_job'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Route job {self.id} ({self.status})"
+
+class GazetteerEntry(models.Model):
+    name = models.CharField(max_length=200)
+    normalized_name = models.CharField(max_length=200, unique=True)  # Lookup key, see normalize_location
+    state = models.CharField(max_length=100, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    circuity_factor = models.FloatField(null=True, blank=True)  # Road / straight-line distance, regional override
+
+    def __str__(self):
+        return f"{self.name} ({self.latitude}, {self.longitude})"
+
 class DeliveryTracking(models.Model):
     route = models.ForeignKey(Route, on_delete=models.CASCADE)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Fix time, buffered fixes are written later
     location = models.CharField(max_length=200)
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
@@ -59,5 +120,20 @@ class DeliveryTracking(models.Model):
     humidity = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     notes = models.TextField(blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['route', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return f"Tracking {self.route_id} at {self.timestamp}"
+
+class RouteTrajectory(models.Model):
+    route = models.OneToOneField(Route, on_delete=models.CASCADE, related_name='trajectory')
+    tolerance_m = models.FloatField()  # Douglas-Peucker tolerance the points were simplified with
+    points = models.JSONField(default=list)  # [[latitude, longitude, unix timestamp], ...]
+    raw_count = models.IntegerField(default=0)  # GPS fixes behind the simplified points
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"Tracking {self.route_id} at {self.timestamp}" 
\ No newline at end of file
+        return f"Trajectory {self.route_id} ({len(self.points)}/{self.raw_count} points)" 
\ No newline at end of file
@@ -0,0 +1,286 @@
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from django.conf import settings
+from .distances import distance_cache, normalize_location
+from .models import GazetteerEntry
+
+try:
+    from googlemaps import exceptions as gmaps_exceptions
+except ImportError:  # Only the google provider needs the client library
+    gmaps_exceptions = None
+
+# Mean Earth radius in meters
+EARTH_RADIUS_M = 6371008.8
+
+# Locations given directly as "latitude,longitude"
+COORDINATES_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def unit_vectors(latitudes, longitudes):
+    """Points on the unit sphere, one row per coordinate"""
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    cos_lat = np.cos(latitudes)
+    return np.column_stack([cos_lat * np.cos(longitudes), cos_lat * np.sin(longitudes), np.sin(latitudes)])
+
+
+def haversine_distances(origin_lat, origin_lng, destination_lat, destination_lng):
+    """Great-circle meters between every origin and every destination
+
+    hav(theta) = (1 - cos theta) / 2 and cos theta is the dot product of the
+    unit vectors, so the whole matrix is one matrix product followed by
+    in-place elementwise passes.
+    """
+    hav = unit_vectors(origin_lat, origin_lng) @ unit_vectors(destination_lat, destination_lng).T
+    np.subtract(1.0, hav, out=hav)
+    np.multiply(hav, 0.5, out=hav)
+    np.clip(hav, 0.0, 1.0, out=hav)
+    np.sqrt(hav, out=hav)
+    np.arcsin(hav, out=hav)
+    hav *= 2 * EARTH_RADIUS_M
+    return hav
+
+
+def assemble_matrices(locations, cells):
+    """Meters and seconds matrices over `locations` from (origin, destination) cells"""
+    size = len(locations)
+    distances = np.zeros((size, size), dtype=np.int64)
+    durations = np.zeros((size, size), dtype=np.int64)
+    for i, origin in enumerate(locations):
+        for j, destination in enumerate(locations):
+            if origin != destination:
+                distances[i, j], durations[i, j] = cells[(origin, destination)]
+    return distances, durations
+
+
+class DistanceProvider:
+    """Common interface of the travel distance sources
+
+    ``fetch_cells`` returns ``{(origin, destination): (meters, seconds)}`` for
+    every origin and destination, ``travel_matrices`` returns the meters and
+    seconds matrices over a list of locations as integer arrays.
+    """
+
+    name = None
+
+    def fetch_cells(self, origins, destinations):
+        raise NotImplementedError
+
+    def travel_matrices(self, locations):
+        unique = list(dict.fromkeys(locations))
+        return assemble_matrices(locations, self.fetch_cells(unique, unique))
+
+
+class GoogleMapsProvider(DistanceProvider):
+    """Driving distances from the Google Maps distance matrix API
+
+    Large matrices are split into tiles within the per-request limits, which
+    are fetched concurrently on a bounded thread pool, retried with
+    exponential backoff on transient failures and stitched back together.
+    """
+
+    name = 'google'
+
+    # Per-request limits of the distance matrix API
+    max_origins = 25
+    max_destinations = 25
+    max_elements = 100
+
+    # API statuses worth retrying, anything else is a caller error
+    retry_statuses = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+
+    def __init__(self, client=None, max_workers=None, max_retries=None, backoff=0.5):
+        if client is None:
+            import googlemaps
+            client = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+        self.gmaps = client
+        self.max_workers = max_workers or getattr(settings, 'LOGISTICS_DISTANCE_MATRIX_WORKERS', 4)
+        self.max_retries = max_retries if max_retries is not None else getattr(
+            settings, 'LOGISTICS_DISTANCE_MATRIX_RETRIES', 3
+        )
+        self.backoff = backoff
+
+    def tiles(self, origins, destinations):
+        """Split origins x destinations into blocks that each fit one request"""
+        if not origins or not destinations:
+            return []
+        destination_step = min(len(destinations), self.max_destinations, self.max_elements)
+        origin_step = max(1, min(self.max_origins, self.max_elements // destination_step))
+        return [
+            (origins[i:i + origin_step], destinations[j:j + destination_step])
+            for i in range(0, len(origins), origin_step)
+            for j in range(0, len(destinations), destination_step)
+        ]
+
+    def _is_transient(self, error):
+        if gmaps_exceptions is None:
+            return False
+        if isinstance(error, gmaps_exceptions.ApiError):
+            return error.status in self.retry_statuses
+        return isinstance(error, (gmaps_exceptions.Timeout, gmaps_exceptions.TransportError))
+
+    def fetch_tile(self, origins, destinations):
+        """One distance matrix request, retried with jittered exponential backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                matrix = self.gmaps.distance_matrix(
+                    origins,
+                    destinations,
+                    mode="driving",
+                    units="metric"
+                )
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not self._is_transient(e):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+        cells = {}
+        for origin, row in zip(origins, matrix['rows']):
+            for destination, element in zip(destinations, row['elements']):
+                if element.get('status', 'OK') != 'OK':
+                    raise ValueError(f'No driving route from {origin} to {destination}')
+                cells[(origin, destination)] = (
+                    element['distance']['value'],
+                    element['duration']['value']
+                )
+        return cells
+
+    def fetch_cells(self, origins, destinations):
+        tiles = self.tiles(list(origins), list(destinations))
+        if not tiles:
+            return {}
+        if len(tiles) == 1:
+            return self.fetch_tile(*tiles[0])
+
+        cells = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tiles))) as executor:
+            for tile_cells in executor.map(lambda tile: self.fetch_tile(*tile), tiles):
+                cells.update(tile_cells)
+        return cells
+
+
+class CachedDistanceProvider(DistanceProvider):
+    """Serves cells from the shared distance cache, asking the wrapped provider for the rest"""
+
+    def __init__(self, provider, cache=None):
+        self.provider = provider
+        self.cache = cache or distance_cache
+        self.name = provider.name
+
+    def fetch_cells(self, origins, destinations):
+        pairs = [(a, b) for a in origins for b in destinations if a != b]
+        cells = self.cache.get_many(pairs)
+
+        # Origins missing the same destinations share one request, so a new
+        # stop costs a row and a column instead of the whole matrix
+        missing = {}
+        for origin, destination in pairs:
+            if (origin, destination) not in cells:
+                missing.setdefault(origin, []).append(destination)
+        requests = {}
+        for origin, wanted in missing.items():
+            # A row missing everything asks for the full row
+            if len(wanted) == len([b for b in destinations if b != origin]):
+                wanted = destinations
+            requests.setdefault(tuple(wanted), []).append(origin)
+
+        for wanted, requested_origins in requests.items():
+            fetched = self.provider.fetch_cells(requested_origins, list(wanted))
+            fetched = {pair: cell for pair, cell in fetched.items() if pair[0] != pair[1]}
+            self.cache.set_many(fetched)
+            cells.update(fetched)
+        return cells
+
+
+class HaversineProvider(DistanceProvider):
+    """Offline distances from gazetteer coordinates
+
+    Locations are geocoded through the GazetteerEntry table, or taken as
+    literal ``"lat,lng"`` strings, and the straight-line haversine distance is
+    scaled by a road circuity factor. Durations assume a constant average
+    speed. ``coordinates`` maps location names to ``(lat, lng)`` and skips
+    the database, which is handy in tests and benchmarks.
+    """
+
+    name = 'haversine'
+
+    def __init__(self, coordinates=None, circuity_factor=None, speed_kmh=None):
+        self.coordinates = {
+            normalize_location(name): (lat, lng, None) for name, (lat, lng) in (coordinates or {}).items()
+        }
+        self.circuity_factor = circuity_factor or getattr(settings, 'LOGISTICS_CIRCUITY_FACTOR', 1.3)
+        self.speed_kmh = speed_kmh or getattr(settings, 'LOGISTICS_AVERAGE_SPEED_KMH', 35)
+
+    def geocode(self, locations):
+        """Latitudes, longitudes and circuity factors of the locations"""
+        resolved = {}
+        lookup = set()
+        for location in set(locations):
+            key = normalize_location(location)
+            match = COORDINATES_PATTERN.match(location)
+            if key in self.coordinates:
+                resolved[location] = self.coordinates[key]
+            elif match:
+                resolved[location] = (float(match.group(1)), float(match.group(2)), None)
+            else:
+                lookup.add(key)
+
+        if lookup:
+            # One query for every name the caller did not resolve
+            entries = {
+                entry.normalized_name: (entry.latitude, entry.longitude, entry.circuity_factor)
+                for entry in GazetteerEntry.objects.filter(normalized_name__in=lookup)
+            }
+            unknown = sorted(location for location in set(locations)
+                             if location not in resolved and normalize_location(location) not in entries)
+            if unknown:
+                raise ValueError(f'Locations missing from the gazetteer: {", ".join(unknown)}')
+            for location in set(locations) - set(resolved):
+                resolved[location] = entries[normalize_location(location)]
+
+        points = np.array([
+            (lat, lng, circuity or self.circuity_factor)
+            for lat, lng, circuity in (resolved[location] for location in locations)
+        ], dtype=float).reshape(-1, 3)
+        return points[:, 0], points[:, 1], points[:, 2]
+
+    def _matrices(self, origins, destinations):
+        origin_lat, origin_lng, origin_circuity = self.geocode(origins)
+        if destinations is origins:
+            destination_lat, destination_lng, destination_circuity = origin_lat, origin_lng, origin_circuity
+        else:
+            destination_lat, destination_lng, destination_circuity = self.geocode(destinations)
+
+        # Road distance is the great-circle distance times the mean circuity of both ends
+        meters = haversine_distances(origin_lat, origin_lng, destination_lat, destination_lng)
+        meters *= (origin_circuity[:, None] + destination_circuity[None, :]) / 2
+        seconds = meters / (self.speed_kmh / 3.6)
+        return np.rint(meters).astype(np.int64), np.rint(seconds).astype(np.int64)
+
+    def travel_matrices(self, locations):
+        return self._matrices(locations, locations)
+
+    def fetch_cells(self, origins, destinations):
+        meters, seconds = self._matrices(origins, destinations)
+        return {
+            (origin, destination): (int(meters[i, j]), int(seconds[i, j]))
+            for i, origin in enumerate(origins)
+            for j, destination in enumerate(destinations)
+        }
+
+
+PROVIDERS = {
+    GoogleMapsProvider.name: lambda: CachedDistanceProvider(GoogleMapsProvider()),
+    HaversineProvider.name: HaversineProvider,
+}
+
+
+def get_distance_provider(name=None):
+    """Instantiate a distance provider by name, defaulting to LOGISTICS_DISTANCE_PROVIDER"""
+    name = name or getattr(settings, 'LOGISTICS_DISTANCE_PROVIDER', GoogleMapsProvider.name)
+    if name not in PROVIDERS:
+        raise ValueError(f'Unknown distance provider: {name}')
+    return PROVIDERS[name]()
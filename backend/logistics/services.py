@@ -1,33 +1,39 @@
+import math
+import numpy as np
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
-import googlemaps
 from django.conf import settings
 from .models import Vehicle, Route
+from .eta import eta_engine, locate_stops
+from .providers import get_distance_provider
 from marketplace.models import Order
 
+# Conversion of listing units to kilograms, unknown units count as kg
+UNIT_TO_KG = {
+    'g': 0.001, 'gram': 0.001, 'grams': 0.001,
+    'kg': 1, 'kgs': 1, 'kilogram': 1, 'kilograms': 1,
+    'quintal': 100, 'quintals': 100, 'qtl': 100,
+    'ton': 1000, 'tons': 1000, 'tonne': 1000, 'tonnes': 1000, 't': 1000,
+}
+
+def order_weight_kg(order):
+    """Weight of an order in kilograms, from its quantity and listing unit"""
+    unit = order.listing.unit.strip().lower()
+    return float(order.quantity) * UNIT_TO_KG.get(unit, 1)
+
 class RouteOptimizationService:
-    def __init__(self):
-        self.gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+    def __init__(self, provider=None):
+        self.provider = provider or get_distance_provider()
+    
+    def get_travel_matrices(self, locations):
+        """Distance (meters) and duration (seconds) matrices from the distance provider"""
+        return self.provider.travel_matrices(locations)
     
     def get_distance_matrix(self, locations):
-        """Get distance matrix from Google Maps API"""
-        matrix = self.gmaps.distance_matrix(
-            locations,
-            locations,
-            mode="driving",
-            units="metric"
-        )
-        
-        distances = []
-        for row in matrix['rows']:
-            distance_row = []
-            for element in row['elements']:
-                distance_row.append(element['distance']['value'])
-            distances.append(distance_row)
-        
-        return distances
+        """Get distance matrix in meters"""
+        return self.get_travel_matrices(locations)[0].tolist()
     
-    def optimize_route(self, orders, vehicle):
+    def optimize_route(self, orders, vehicle, time_limit_seconds=None):
         """Optimize delivery route for given orders"""
         # Extract locations from orders
         locations = [order.listing.location for order in orders]
@@ -40,12 +46,8 @@ class RouteOptimizationService:
         manager = pywrapcp.RoutingIndexManager(len(locations), 1, 0)
         routing = pywrapcp.RoutingModel(manager)
         
-        def distance_callback(from_index, to_index):
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return distance_matrix[from_node][to_node]
-        
-        transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+        # The solver reads arc costs from the matrix without calling back into Python
+        transit_callback_index = routing.RegisterTransitMatrix(distance_matrix)
         routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
         
         # Add Distance constraint
@@ -63,25 +65,224 @@ class RouteOptimizationService:
         search_parameters.first_solution_strategy = (
             routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
         )
+        if time_limit_seconds:
+            search_parameters.time_limit.FromSeconds(int(time_limit_seconds))
         
         # Solve the problem
         solution = routing.SolveWithParameters(search_parameters)
         
         if solution:
-            return self._extract_route(manager, routing, solution, locations)
+            return self._extract_route(
+                manager, routing, solution, locations, orders=[None] + list(orders)
+            )
         return None
     
-    def _extract_route(self, manager, routing, solution, locations):
+    def save_route(self, vehicle, orders, optimized_route):
+        """Store an optimized single-vehicle route"""
+        route = Route.objects.create(
+            vehicle=vehicle,
+            start_location=vehicle.current_location,
+            end_location=optimized_route[-1]['location'],
+            estimated_distance_km=sum(r['distance'] for r in optimized_route) / 1000,
+            estimated_duration_mins=self.estimate_duration_mins(optimized_route),
+            route_data=optimized_route
+        )
+        route.orders.set(orders)
+        return route
+    
+    def replace_stops(self, route, stops):
+        """Give a route a new plan, the caller saves it"""
+        route.end_location = stops[-1]['location']
+        route.estimated_distance_km = sum(stop['distance'] for stop in stops) / 1000
+        route.estimated_duration_mins = self.estimate_duration_mins(stops)
+        route.route_data = stops
+        # Live ETAs index into the old stops, the next GPS fix starts them afresh
+        route.eta_data = {}
+        return route
+    
+    def estimate_duration_mins(self, stops):
+        """Minutes to serve the stops at the learned travel speeds
+        
+        Stops are geocoded in place so live ETAs can tell when they are reached.
+        """
+        locate_stops(stops)
+        return round(eta_engine.route_seconds(stops) / 60)
+    
+    def optimize_fleet(self, orders, vehicles):
+        """Assign orders to vehicles and sequence every vehicle's stops in one solve
+        
+        Each vehicle starts and ends at its current location and carries at
+        most its capacity_kg. Orders that no vehicle can take are dropped at a
+        penalty. Returns a dict with ``routes``, a list of (vehicle, orders,
+        stops) for the vehicles that were used, and the ``unassigned`` orders.
+        """
+        orders = list(orders)
+        vehicles = [vehicle for vehicle in vehicles if vehicle.current_location]
+        if not orders or not vehicles:
+            return {'routes': [], 'unassigned': orders}
+        
+        # Nodes are the vehicle starts followed by one node per order
+        locations = [vehicle.current_location for vehicle in vehicles]
+        locations += [order.listing.location for order in orders]
+        distances, durations = self.get_travel_matrices(locations)
+        demands = [0] * len(vehicles) + [math.ceil(order_weight_kg(order)) for order in orders]
+        
+        starts = list(range(len(vehicles)))
+        manager = pywrapcp.RoutingIndexManager(len(locations), len(vehicles), starts, starts)
+        routing = pywrapcp.RoutingModel(manager)
+        
+        transit_index = routing.RegisterTransitMatrix(distances.tolist())
+        routing.SetArcCostEvaluatorOfAllVehicles(transit_index)
+        
+        demand_index = routing.RegisterUnaryTransitVector(demands)
+        routing.AddDimensionWithVehicleCapacity(
+            demand_index,
+            0,  # no slack
+            [int(vehicle.capacity_kg) for vehicle in vehicles],
+            True,  # start cumul to zero
+            'Capacity'
+        )
+        
+        # Serving an order always beats dropping it when some vehicle can
+        penalty = int(distances.max()) * 10 + 1
+        for node in range(len(vehicles), len(locations)):
+            routing.AddDisjunction([manager.NodeToIndex(node)], penalty)
+        
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.first_solution_strategy = (
+            routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+        )
+        search_parameters.time_limit.FromSeconds(
+            getattr(settings, 'LOGISTICS_SOLVER_TIME_LIMIT_SECONDS', 10)
+        )
+        
+        solution = routing.SolveWithParameters(search_parameters)
+        if not solution:
+            return None
+        
+        routes = []
+        assigned = set()
+        orders_by_id = {order.id: order for order in orders}
+        for vehicle_id, vehicle in enumerate(vehicles):
+            # Vehicles going straight from start to end stay unused
+            if routing.IsEnd(solution.Value(routing.NextVar(routing.Start(vehicle_id)))):
+                continue
+            stops = self._extract_route(
+                manager, routing, solution, locations, vehicle_id, durations,
+                orders=[None] * len(vehicles) + orders
+            )
+            route_orders = [orders_by_id[stop['order_id']] for stop in stops[1:]]
+            assigned.update(order.id for order in route_orders)
+            routes.append((vehicle, route_orders, stops))
+        
+        return {
+            'routes': routes,
+            'unassigned': [order for order in orders if order.id not in assigned],
+        }
+    
+    def reoptimize_route(self, route, add_orders=(), remove_orders=(), time_limit_ms=None):
+        """Re-sequence a stored route after orders join or leave it
+        
+        The stops kept from route_data stay in their order, new stops are
+        placed by cheapest insertion and the result seeds a guided local search
+        capped at ``time_limit_ms``. Distances come from the provider, so the
+        unchanged pairs are cache hits. Returns the new stops, an empty list
+        when no orders are left, or None when the solver finds no route.
+        """
+        current = {order.id: order for order in route.orders.select_related('listing')}
+        current.update((order.id, order) for order in add_orders)
+        for order in remove_orders:
+            current.pop(order.id, None)
+        if not current:
+            return []
+        
+        # Stored stops after the start carry the order they serve
+        previous = [stop.get('order_id') for stop in (route.route_data or [])[1:]]
+        kept = [order_id for order_id in previous if order_id in current]
+        added = [order_id for order_id in current if order_id not in kept]
+        orders = [current[order_id] for order_id in kept + added]
+        
+        locations = [route.start_location] + [order.listing.location for order in orders]
+        distances, durations = self.get_travel_matrices(locations)
+        
+        # Cheapest insertion of each new stop into the kept sequence
+        sequence = list(range(1, len(kept) + 1))
+        for node in range(len(kept) + 1, len(locations)):
+            tour = np.array([0] + sequence + [0])
+            before, after = tour[:-1], tour[1:]
+            detour = distances[before, node] + distances[node, after] - distances[before, after]
+            sequence.insert(int(np.argmin(detour)), node)
+        
+        demands = [0] + [math.ceil(order_weight_kg(order)) for order in orders]
+        if sum(demands) > route.vehicle.capacity_kg:
+            raise ValueError(f'Orders exceed the capacity of {route.vehicle}')
+        
+        if time_limit_ms is None:
+            time_limit_ms = getattr(settings, 'LOGISTICS_REOPTIMIZE_TIME_LIMIT_MS', 100)
+        if time_limit_ms <= 0:
+            # No search budget, serve the insertion result as is
+            tour = [0] + sequence
+            stops = []
+            for node, next_node in zip(tour, tour[1:] + [0]):
+                stop = {
+                    'location': locations[node],
+                    'distance': int(distances[node, next_node]),
+                    'duration': int(durations[node, next_node]),
+                }
+                if node:
+                    stop['order_id'] = orders[node - 1].id
+                stops.append(stop)
+            return stops
+        
+        manager = pywrapcp.RoutingIndexManager(len(locations), 1, 0)
+        routing = pywrapcp.RoutingModel(manager)
+        transit_index = routing.RegisterTransitMatrix(distances.tolist())
+        routing.SetArcCostEvaluatorOfAllVehicles(transit_index)
+        routing.AddDimensionWithVehicleCapacity(
+            routing.RegisterUnaryTransitVector(demands),
+            0,  # no slack
+            [int(route.vehicle.capacity_kg)],
+            True,  # start cumul to zero
+            'Capacity'
+        )
+        
+        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+        search_parameters.local_search_metaheuristic = (
+            routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+        )
+        search_parameters.time_limit.FromMilliseconds(time_limit_ms)
+        routing.CloseModelWithParameters(search_parameters)
+        
+        # Warm start from the previous sequence instead of a fresh first solution
+        solution = routing.ReadAssignmentFromRoutes([sequence], True)
+        if solution is not None:
+            solution = routing.SolveFromAssignmentWithParameters(solution, search_parameters)
+        if not solution:
+            return None
+        
+        return self._extract_route(
+            manager, routing, solution, locations, 0, durations, orders=[None] + orders
+        )
+    
+    def _extract_route(self, manager, routing, solution, locations, vehicle_id=0,
+                       durations=None, orders=None):
         """Extract the optimized route from solution"""
         route = []
-        index = routing.Start(0)
+        index = routing.Start(vehicle_id)
         
         while not routing.IsEnd(index):
             node_index = manager.IndexToNode(index)
-            route.append({
+            next_index = solution.Value(routing.NextVar(index))
+            next_node = manager.IndexToNode(next_index)
+            stop = {
                 'location': locations[node_index],
-                'distance': solution.Value(routing.GetArcCostForVehicle(index, routing.NextVar(index), 0))
-            })
-            index = solution.Value(routing.NextVar(index))
+                'distance': routing.GetArcCostForVehicle(index, next_index, vehicle_id),
+            }
+            if durations is not None:
+                stop['duration'] = int(durations[node_index][next_node])
+            if orders is not None and orders[node_index] is not None:
+                stop['order_id'] = orders[node_index].id
+            route.append(stop)
+            index = next_index
         
-        return route 
\ No newline at end of file
+        return route
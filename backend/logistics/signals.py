@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from .events import route_events
+from .models import Route
+
+
+@receiver(post_init, sender=Route)
+def remember_route_status(sender, instance, **kwargs):
+    """Keep the loaded status to tell real status changes apart on save"""
+    # Read the attribute directly, a deferred status would cost a query
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Route)
+def publish_route_status(sender, instance, created, **kwargs):
+    """Push status changes to the route's live watchers once committed"""
+    current = instance.__dict__.get('status')
+    if created or current is None or current == instance._loaded_status:
+        return
+    instance._loaded_status = instance.status
+    data = {
+        'status': instance.status,
+        'actual_start_time': instance.actual_start_time,
+        'actual_end_time': instance.actual_end_time,
+    }
+    transaction.on_commit(lambda: route_events.publish(instance.id, 'status', data))
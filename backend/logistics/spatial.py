@@ -0,0 +1,279 @@
+import heapq
+import math
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from .models import Vehicle
+from .providers import EARTH_RADIUS_M
+
+# Kilometers per degree of latitude
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180 / 1000
+
+
+def distances_km(latitude, longitude, latitudes, longitudes):
+    """Haversine kilometers from one point to arrays of points"""
+    lat1, lng1 = math.radians(latitude), math.radians(longitude)
+    lat2, lng2 = np.radians(latitudes), np.radians(longitudes)
+    hav = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M / 1000 * np.arcsin(np.sqrt(np.clip(hav, 0.0, 1.0)))
+
+
+def search_radius_km(radius_km=None):
+    """Radius of a search, LOGISTICS_VEHICLE_SEARCH_RADIUS_KM is both the default and the cap"""
+    limit = getattr(settings, 'LOGISTICS_VEHICLE_SEARCH_RADIUS_KM', 50)
+    if radius_km is None:
+        return limit
+    radius_km = float(radius_km)
+    if not math.isfinite(radius_km) or radius_km < 0:
+        raise ValueError('radius_km must be a non-negative number')
+    return min(radius_km, limit)
+
+
+def check_coordinates(latitude, longitude):
+    if not (math.isfinite(latitude) and math.isfinite(longitude)
+            and -90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Coordinates must be a valid latitude and longitude')
+
+
+def nearest_vehicles_from_db(latitude, longitude, k=5, vehicle_type=None, min_capacity_kg=None,
+                             radius_km=None, transporter_id=None):
+    """Nearest available vehicles as (vehicle_id, km), answered by the database
+
+    A bounding box around the radius narrows the rows on the coordinate
+    index, exact distances are computed on what is left.
+    """
+    check_coordinates(latitude, longitude)
+    radius_km = search_radius_km(radius_km)
+    lat_delta = radius_km / KM_PER_DEGREE
+    lng_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(min(abs(latitude) + lat_delta, 89.0))), 1e-6))
+
+    vehicles = Vehicle.objects.filter(
+        is_available=True,
+        latitude__range=(latitude - lat_delta, latitude + lat_delta),
+        longitude__range=(longitude - lng_delta, longitude + lng_delta)
+    )
+    if vehicle_type:
+        vehicles = vehicles.filter(vehicle_type=vehicle_type)
+    if min_capacity_kg is not None:
+        vehicles = vehicles.filter(capacity_kg__gte=min_capacity_kg)
+    if transporter_id is not None:
+        vehicles = vehicles.filter(transporter_id=transporter_id)
+
+    rows = np.array(list(vehicles.values_list('id', 'latitude', 'longitude')), dtype=float).reshape(-1, 3)
+    km = distances_km(latitude, longitude, rows[:, 1], rows[:, 2])
+    within = np.flatnonzero(km <= radius_km)
+    nearest = within[np.argsort(km[within], kind='stable')[:k]]
+    return [(int(rows[i, 0]), float(km[i])) for i in nearest]
+
+
+class VehicleIndex:
+    """In-memory grid over the positions of available vehicles
+
+    The map is cut into square cells of ``cell_km`` (a fixed-size geohash).
+    A query walks rings of cells outwards from the query point and stops once
+    the next ring cannot hold anything closer than the k-th match or lies
+    beyond the radius, so only the neighbourhood is ever looked at.
+
+    Vehicle attributes are kept in flat arrays addressed by slot, and cells
+    hold sets of slots, so GPS updates move a vehicle between cells in O(1).
+    The index covers what this process has seen and is rebuilt from the
+    database once older than ``max_age`` seconds.
+    """
+
+    def __init__(self, cell_km=None, max_age=None):
+        self.cell_km = cell_km or getattr(settings, 'LOGISTICS_VEHICLE_INDEX_CELL_KM', 5)
+        self.max_age = max_age or getattr(settings, 'LOGISTICS_VEHICLE_INDEX_MAX_AGE_SECONDS', 60)
+        self.cell_deg = self.cell_km / KM_PER_DEGREE
+        self._lock = threading.RLock()
+        self._rebuilding = threading.Lock()
+        self.built_at = None
+        self._reset(0)
+
+    def _reset(self, size):
+        size = max(size, 64)
+        self.ids = np.zeros(size, dtype=np.int64)
+        self.latitudes = np.zeros(size)
+        self.longitudes = np.zeros(size)
+        self.capacities = np.zeros(size)
+        self.transporters = np.zeros(size, dtype=np.int64)
+        self.types = np.empty(size, dtype=object)
+        self.slots = {}
+        self.free = list(range(size - 1, -1, -1))
+        self.cells = {}
+        self.cell_of = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.cell_deg)), int(math.floor(longitude / self.cell_deg))
+
+    def _grow(self):
+        size = len(self.ids)
+        for name in ('ids', 'latitudes', 'longitudes', 'capacities', 'transporters', 'types'):
+            array = getattr(self, name)
+            grown = np.empty(size * 2, dtype=array.dtype)
+            grown[:size] = array
+            setattr(self, name, grown)
+        self.free.extend(range(size * 2 - 1, size - 1, -1))
+
+    def _discard(self, vehicle_id):
+        slot = self.slots.pop(vehicle_id, None)
+        if slot is None:
+            return
+        cell = self.cell_of.pop(slot)
+        members = self.cells[cell]
+        members.discard(slot)
+        if not members:
+            del self.cells[cell]
+        self.free.append(slot)
+
+    def _insert(self, vehicle_id, latitude, longitude, vehicle_type, capacity_kg, transporter_id):
+        if not self.free:
+            self._grow()
+        slot = self.free.pop()
+        self.ids[slot] = vehicle_id
+        self.latitudes[slot] = latitude
+        self.longitudes[slot] = longitude
+        self.capacities[slot] = capacity_kg
+        self.transporters[slot] = -1 if transporter_id is None else transporter_id
+        self.types[slot] = vehicle_type
+        cell = self.cell(latitude, longitude)
+        self.cells.setdefault(cell, set()).add(slot)
+        self.cell_of[slot] = cell
+        self.slots[vehicle_id] = slot
+
+    def update(self, vehicle):
+        """Add, move or drop a vehicle after it was saved"""
+        with self._lock:
+            self._discard(vehicle.id)
+            if vehicle.is_available and vehicle.latitude is not None and vehicle.longitude is not None:
+                self._insert(vehicle.id, vehicle.latitude, vehicle.longitude,
+                             vehicle.vehicle_type, float(vehicle.capacity_kg), vehicle.transporter_id)
+
+    def move(self, vehicle_id, latitude, longitude):
+        """Record a GPS fix for an indexed vehicle"""
+        with self._lock:
+            slot = self.slots.get(vehicle_id)
+            if slot is None:
+                return
+            self.latitudes[slot] = latitude
+            self.longitudes[slot] = longitude
+            cell = self.cell(latitude, longitude)
+            if cell != self.cell_of[slot]:
+                members = self.cells[self.cell_of[slot]]
+                members.discard(slot)
+                if not members:
+                    del self.cells[self.cell_of[slot]]
+                self.cells.setdefault(cell, set()).add(slot)
+                self.cell_of[slot] = cell
+
+    def remove(self, vehicle_id):
+        with self._lock:
+            self._discard(vehicle_id)
+
+    def build(self):
+        """Load every available vehicle with coordinates from the database"""
+        rows = Vehicle.objects.filter(
+            is_available=True, latitude__isnull=False, longitude__isnull=False
+        ).values_list('id', 'latitude', 'longitude', 'vehicle_type', 'capacity_kg', 'transporter_id')
+        rows = list(rows.iterator(chunk_size=5000))
+        with self._lock:
+            self._reset(len(rows))
+            for vehicle_id, latitude, longitude, vehicle_type, capacity_kg, transporter_id in rows:
+                self._insert(vehicle_id, latitude, longitude, vehicle_type, float(capacity_kg), transporter_id)
+            self.built_at = time.monotonic()
+        return len(rows)
+
+    def is_stale(self):
+        return self.built_at is None or time.monotonic() - self.built_at > self.max_age
+
+    def rebuild_in_background(self):
+        """Rebuild from a thread, at most one rebuild at a time"""
+        if not self._rebuilding.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.build()
+            finally:
+                connection.close()
+                self._rebuilding.release()
+        threading.Thread(target=run, daemon=True, name='vehicle-index').start()
+
+    def _ring(self, row, col, ring):
+        if ring == 0:
+            yield row, col
+            return
+        for j in range(col - ring, col + ring + 1):
+            yield row - ring, j
+            yield row + ring, j
+        for i in range(row - ring + 1, row + ring):
+            yield i, col - ring
+            yield i, col + ring
+
+    def nearest(self, latitude, longitude, k=5, vehicle_type=None, min_capacity_kg=None,
+                radius_km=None, transporter_id=None):
+        """Nearest indexed vehicles as (vehicle_id, km), closest first"""
+        check_coordinates(latitude, longitude)
+        radius_km = search_radius_km(radius_km)
+        row, col = self.cell(latitude, longitude)
+        best = []  # Max-heap of (-km, vehicle_id) holding the k closest so far
+
+        # Rings needed to cover the radius where longitude cells are narrowest
+        edge_shrink = math.cos(math.radians(min(abs(latitude) + radius_km / KM_PER_DEGREE + self.cell_deg, 89.0)))
+        max_ring = math.ceil(radius_km / (self.cell_km * edge_shrink)) + 1
+
+        with self._lock:
+            ring = 0
+            while ring <= max_ring:
+                # Everything in this ring is at least ring - 1 cells away in
+                # latitude or longitude; longitude cells shrink towards the poles
+                shrink = math.cos(math.radians(min(abs(latitude) + (ring + 1) * self.cell_deg, 89.0)))
+                floor_km = max(ring - 1, 0) * self.cell_km * shrink
+                if floor_km > radius_km or (len(best) == k and floor_km > -best[0][0]):
+                    break
+
+                slots = [slot for cell in self._ring(row, col, ring) for slot in self.cells.get(cell, ())]
+                ring += 1
+                if not slots:
+                    continue
+
+                slots = np.fromiter(slots, dtype=np.int64, count=len(slots))
+                if vehicle_type:
+                    slots = slots[self.types[slots] == vehicle_type]
+                if min_capacity_kg is not None:
+                    slots = slots[self.capacities[slots] >= float(min_capacity_kg)]
+                if transporter_id is not None:
+                    slots = slots[self.transporters[slots] == transporter_id]
+                km = distances_km(latitude, longitude, self.latitudes[slots], self.longitudes[slots])
+                for slot, distance in zip(slots.tolist(), km.tolist()):
+                    if distance > radius_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, int(self.ids[slot])))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, int(self.ids[slot])))
+
+        return sorted(((vehicle_id, -distance) for distance, vehicle_id in best), key=lambda match: match[1])
+
+
+vehicle_index = VehicleIndex()
+
+
+def find_nearest_vehicles(latitude, longitude, k=5, vehicle_type=None, min_capacity_kg=None,
+                          radius_km=None, transporter_id=None):
+    """Nearest available vehicles as (vehicle_id, km)
+
+    Served from the in-memory index while it is fresh, otherwise from the
+    database while the index is rebuilt in the background. Raises
+    ValueError for invalid coordinates or radius.
+    """
+    if vehicle_index.is_stale():
+        vehicle_index.rebuild_in_background()
+        return nearest_vehicles_from_db(latitude, longitude, k, vehicle_type, min_capacity_kg,
+                                        radius_km, transporter_id)
+    return vehicle_index.nearest(latitude, longitude, k, vehicle_type, min_capacity_kg,
+                                 radius_km, transporter_id)
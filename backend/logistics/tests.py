@@ -0,0 +1,713 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from googlemaps import exceptions as gmaps_exceptions
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from marketplace.models import Listing, Order, Product
+from .distances import DistanceCache
+from .eta import EtaEngine, SpeedTable
+from .events import RouteEventBroker
+from .jobs import MAX_ATTEMPTS, claim_next_job, run_route_job, run_worker, submit_route_job
+from .models import DeliveryTracking, Route, RouteOptimizationJob, RouteTrajectory, Vehicle
+from .providers import (
+    CachedDistanceProvider, GoogleMapsProvider, HaversineProvider, haversine_distances
+)
+from .services import RouteOptimizationService
+from .spatial import VehicleIndex, distances_km
+from .tracking import TrackingBuffer, douglas_peucker, simplify
+
+User = get_user_model()
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class HaversineProviderTests(SimpleTestCase):
+    def setUp(self):
+        self.provider = HaversineProvider(
+            coordinates={'Pune': (18.5204, 73.8567), 'Mumbai': (19.0760, 72.8777)},
+            circuity_factor=1.5,
+            speed_kmh=36
+        )
+
+    def test_great_circle_distance(self):
+        meters = haversine_distances(
+            np.array([18.5204]), np.array([73.8567]), np.array([19.0760]), np.array([72.8777])
+        )
+        self.assertAlmostEqual(meters[0, 0] / 1000, 119.9, delta=0.5)
+
+    def test_matrices_apply_circuity_and_speed(self):
+        distances, durations = self.provider.travel_matrices(['Pune', 'Mumbai', 'pune '])
+        
+        self.assertEqual(distances[0, 0], 0)
+        self.assertEqual(distances[0, 2], 0)
+        self.assertEqual(distances[0, 1], distances[1, 0])
+        self.assertAlmostEqual(distances[0, 1] / 1000, 119.9 * 1.5, delta=1)
+        # 36 km/h is 10 m/s
+        self.assertAlmostEqual(durations[0, 1], distances[0, 1] / 10, delta=1)
+
+    def test_literal_coordinates_need_no_gazetteer(self):
+        distances, _ = self.provider.travel_matrices(['Pune', '18.5204, 73.8567'])
+        self.assertEqual(distances[0, 1], 0)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CachedDistanceProviderTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = DistanceCache()
+        self.cache.backend.clear()
+        self.inner = MagicMock(name='provider')
+        self.inner.fetch_cells.side_effect = lambda origins, destinations: {
+            (a, b): (len(a) * 1000 + len(b), 60) for a in origins for b in destinations
+        }
+        self.provider = CachedDistanceProvider(self.inner, self.cache)
+
+    def test_only_missing_cells_are_fetched(self):
+        self.provider.travel_matrices(['A', 'BB', 'CCC'])
+        self.assertEqual(self.inner.fetch_cells.call_count, 1)
+        
+        self.inner.fetch_cells.reset_mock()
+        distances, _ = self.provider.travel_matrices(['A', 'BB', 'CCC', 'DDDD'])
+        
+        requested = sum(
+            len(call.args[0]) * len(call.args[1]) for call in self.inner.fetch_cells.call_args_list
+        )
+        self.assertLessEqual(requested, 7)
+        self.assertEqual(distances[3, 0], 4001)
+        self.assertEqual(self.cache.stats()['hits'], 6)
+
+
+class GoogleMapsProviderTests(SimpleTestCase):
+    def setUp(self):
+        self.requests = []
+        self.client = MagicMock(name='gmaps')
+        self.client.distance_matrix.side_effect = self.distance_matrix
+        self.provider = GoogleMapsProvider(client=self.client, max_workers=4, max_retries=2, backoff=0)
+
+    def distance_matrix(self, origins, destinations, **kwargs):
+        self.requests.append((len(origins), len(destinations)))
+        return {'rows': [
+            {'elements': [
+                {'status': 'OK', 'distance': {'value': a * 1000 + b}, 'duration': {'value': 60}}
+                for b in destinations
+            ]}
+            for a in origins
+        ]}
+
+    def test_large_matrices_are_tiled_within_limits(self):
+        stops = list(range(120))
+        cells = self.provider.fetch_cells(stops, stops)
+        
+        self.assertEqual(len(cells), 120 * 120)
+        self.assertEqual(cells[(119, 7)], (119007, 60))
+        for origins, destinations in self.requests:
+            self.assertLessEqual(origins, GoogleMapsProvider.max_origins)
+            self.assertLessEqual(destinations, GoogleMapsProvider.max_destinations)
+            self.assertLessEqual(origins * destinations, GoogleMapsProvider.max_elements)
+
+    def test_transient_errors_are_retried(self):
+        self.client.distance_matrix.side_effect = [
+            gmaps_exceptions.Timeout(),
+            gmaps_exceptions.ApiError('OVER_QUERY_LIMIT'),
+            self.distance_matrix([1], [2]),
+        ]
+        self.assertEqual(self.provider.fetch_cells([1], [2]), {(1, 2): (1002, 60)})
+
+    def test_request_errors_are_not_retried(self):
+        self.client.distance_matrix.side_effect = gmaps_exceptions.ApiError('INVALID_REQUEST')
+        with self.assertRaises(gmaps_exceptions.ApiError):
+            self.provider.fetch_cells([1], [2])
+        self.assertEqual(self.client.distance_matrix.call_count, 1)
+
+    def test_empty_matrices_make_no_requests(self):
+        self.assertEqual(self.provider.tiles([1, 2], []), [])
+        self.assertEqual(self.provider.fetch_cells([], [1, 2]), {})
+        self.client.distance_matrix.assert_not_called()
+
+
+class FleetOptimizationTests(SimpleTestCase):
+    def setUp(self):
+        # Two depots far apart, each with farms nearby
+        self.service = RouteOptimizationService(provider=HaversineProvider(coordinates={
+            'Pune': (18.52, 73.86), 'Nagpur': (21.15, 79.09),
+            'Hadapsar': (18.50, 73.93), 'Chakan': (18.76, 73.86),
+            'Kamptee': (21.22, 79.20), 'Hingna': (21.07, 78.96),
+        }))
+        self.vehicles = [
+            Vehicle(id=1, capacity_kg=1000, current_location='Pune'),
+            Vehicle(id=2, capacity_kg=1000, current_location='Nagpur'),
+        ]
+
+    def make_order(self, order_id, location, quantity, unit='kg'):
+        return Order(id=order_id, quantity=quantity, listing=Listing(location=location, unit=unit))
+
+    def test_orders_go_to_the_nearest_vehicle(self):
+        orders = [
+            self.make_order(1, 'Hadapsar', 300),
+            self.make_order(2, 'Kamptee', 300),
+            self.make_order(3, 'Chakan', 3, unit='quintal'),
+            self.make_order(4, 'Hingna', 300),
+        ]
+        plan = self.service.optimize_fleet(orders, self.vehicles)
+        
+        assignment = {vehicle.id: sorted(o.id for o in route_orders) for vehicle, route_orders, _ in plan['routes']}
+        self.assertEqual(assignment, {1: [1, 3], 2: [2, 4]})
+        self.assertEqual(plan['unassigned'], [])
+
+    def test_capacity_is_enforced(self):
+        orders = [
+            self.make_order(1, 'Hadapsar', 0.6, unit='tons'),
+            self.make_order(2, 'Chakan', 600),
+        ]
+        plan = self.service.optimize_fleet(orders, self.vehicles)
+        
+        # The Pune truck cannot take both, so one order travels from Nagpur
+        self.assertEqual(len(plan['routes']), 2)
+        for vehicle, route_orders, stops in plan['routes']:
+            self.assertEqual(len(route_orders), 1)
+            self.assertEqual(stops[0]['location'], vehicle.current_location)
+
+    def test_oversized_orders_are_unassigned(self):
+        plan = self.service.optimize_fleet([self.make_order(1, 'Hadapsar', 5, unit='tons')], self.vehicles)
+        self.assertEqual(plan['routes'], [])
+        self.assertEqual([order.id for order in plan['unassigned']], [1])
+
+
+class RouteReoptimizationTests(SimpleTestCase):
+    def setUp(self):
+        # Farms strung out east of the depot along one road
+        self.service = RouteOptimizationService(provider=HaversineProvider(coordinates={
+            'Pune': (18.52, 73.86), 'Wagholi': (18.52, 73.90),
+            'Lonikand': (18.52, 73.95), 'Shikrapur': (18.52, 74.00),
+        }))
+        self.vehicle = Vehicle(id=1, capacity_kg=1000, current_location='Pune')
+        self.orders = {
+            1: Order(id=1, quantity=100, listing=Listing(location='Wagholi', unit='kg')),
+            2: Order(id=2, quantity=100, listing=Listing(location='Lonikand', unit='kg')),
+            3: Order(id=3, quantity=100, listing=Listing(location='Shikrapur', unit='kg')),
+        }
+
+    def make_route(self, order_ids):
+        route = MagicMock(start_location='Pune', vehicle=self.vehicle)
+        route.route_data = [{'location': 'Pune'}] + [
+            {'location': self.orders[order_id].listing.location, 'order_id': order_id}
+            for order_id in order_ids
+        ]
+        route.orders.select_related.return_value = [self.orders[order_id] for order_id in order_ids]
+        return route
+
+    def order_ids(self, stops):
+        return [stop.get('order_id') for stop in stops]
+
+    def test_optimized_stops_carry_their_order(self):
+        stops = self.service.optimize_route([self.orders[3], self.orders[1]], self.vehicle)
+        self.assertEqual(self.order_ids(stops), [None, 1, 3])
+
+    def test_new_stop_is_inserted_where_it_adds_the_least_distance(self):
+        route = self.make_route([3, 1])
+        stops = self.service.reoptimize_route(route, add_orders=[self.orders[2]], time_limit_ms=0)
+        
+        self.assertEqual(self.order_ids(stops), [None, 3, 2, 1])
+        self.assertEqual([stop['location'] for stop in stops], ['Pune', 'Shikrapur', 'Lonikand', 'Wagholi'])
+        self.assertGreater(stops[-1]['distance'], 0)  # The leg back to the depot
+
+    def test_warm_start_keeps_the_previous_order(self):
+        # The reverse tour is just as short, a fresh solve would visit Wagholi first
+        route = self.make_route([3, 2, 1])
+        stops = self.service.reoptimize_route(route, time_limit_ms=200)
+        self.assertEqual(self.order_ids(stops), [None, 3, 2, 1])
+        
+        stops = self.service.reoptimize_route(route, remove_orders=[self.orders[2]], time_limit_ms=200)
+        self.assertEqual(self.order_ids(stops), [None, 3, 1])
+
+    def test_removing_every_order_leaves_no_stops(self):
+        route = self.make_route([1])
+        self.assertEqual(self.service.reoptimize_route(route, remove_orders=[self.orders[1]]), [])
+
+    @override_settings(LOGISTICS_ETA_MODEL_PATH='/nonexistent/speeds.npz')
+    def test_new_plan_drops_the_live_eta(self):
+        route = Route(
+            start_location='18.52,73.86', end_location='18.52,74.0', estimated_distance_km=30,
+            estimated_duration_mins=60, route_data=[],
+            eta_data={'next_stop': 3, 'arrivals': [None, 1.0, 2.0, 3.0], 'remaining_seconds': 600}
+        )
+        stops = [
+            {'location': '18.52,73.86', 'distance': 4000},
+            {'location': '18.52,73.9', 'distance': 4000, 'order_id': 1},
+        ]
+        self.service.replace_stops(route, stops)
+        
+        self.assertEqual(route.eta_data, {})
+        self.assertEqual(route.route_data, stops)
+        self.assertEqual(route.end_location, '18.52,73.9')
+        self.assertEqual(route.estimated_distance_km, 8)
+        self.assertGreater(route.estimated_duration_mins, 0)
+
+
+class StubRouteService:
+    """Visits the orders as given and saves the route without a solver"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def optimize_route(self, orders, vehicle, time_limit_seconds=None):
+        self.calls += 1
+        return [{'location': vehicle.current_location, 'distance': 1000}] + [
+            {'location': order.listing.location, 'distance': 1000, 'order_id': order.id}
+            for order in orders
+        ]
+
+    def save_route(self, vehicle, orders, stops):
+        route = Route.objects.create(
+            vehicle=vehicle,
+            start_location=vehicle.current_location,
+            end_location=vehicle.current_location,
+            estimated_distance_km=len(stops),
+            estimated_duration_mins=10,
+            route_data=stops
+        )
+        route.orders.set(orders)
+        return route
+
+
+class RouteJobTests(TestCase):
+    def setUp(self):
+        transporter = User.objects.create_user(username='transporter', password='testpass123')
+        farmer = User.objects.create_user(username='farmer', password='testpass123')
+        buyer = User.objects.create_user(username='buyer', password='testpass123')
+        self.vehicle = Vehicle.objects.create(
+            transporter=transporter, vehicle_type='TRUCK', registration_number='MH12AB1234',
+            capacity_kg=1000, current_location='Pune'
+        )
+        listing = Listing.objects.create(
+            farmer=farmer,
+            product=Product.objects.create(name='Onion', category='VEGETABLES', description='Red onions'),
+            quantity=1000,
+            price_per_unit=20,
+            unit='kg',
+            location='Chakan',
+            harvest_date=date(2024, 1, 1),
+            available_from=date(2024, 1, 1)
+        )
+        self.orders = [
+            Order.objects.create(buyer=buyer, listing=listing, quantity=50, total_price=1000, delivery_address='Pune')
+            for _ in range(3)
+        ]
+
+    def make_job(self, orders, minutes_ago=0):
+        job, _ = submit_route_job(self.vehicle, orders)
+        RouteOptimizationJob.objects.filter(pk=job.pk).update(
+            created_at=timezone.now() - timedelta(minutes=minutes_ago)
+        )
+        return job
+
+    def test_duplicate_requests_share_an_active_job(self):
+        job, created = submit_route_job(self.vehicle, self.orders)
+        again, created_again = submit_route_job(self.vehicle, list(reversed(self.orders)))
+        
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, job.pk)
+        self.assertTrue(submit_route_job(self.vehicle, self.orders[:2])[1])
+        
+        # A finished job no longer blocks the same request
+        RouteOptimizationJob.objects.filter(pk=job.pk).update(status='SUCCEEDED')
+        self.assertTrue(submit_route_job(self.vehicle, self.orders)[1])
+
+    def test_submit_retries_when_the_conflicting_job_is_gone(self):
+        create = RouteOptimizationJob.objects.create
+        races = []
+        
+        def lose_the_first_race(**fields):
+            if not races:
+                # The duplicate that won finished before it could be read
+                races.append(fields['request_key'])
+                raise IntegrityError('unique_active_route_job')
+            return create(**fields)
+        
+        with patch.object(RouteOptimizationJob.objects, 'create', side_effect=lose_the_first_race):
+            job, created = submit_route_job(self.vehicle, self.orders)
+        
+        self.assertTrue(created)
+        self.assertEqual(len(races), 1)
+        self.assertEqual(RouteOptimizationJob.objects.get().pk, job.pk)
+
+    def test_oldest_queued_job_is_claimed_first(self):
+        newer = self.make_job(self.orders[:1], minutes_ago=1)
+        older = self.make_job(self.orders[1:2], minutes_ago=5)
+        
+        claimed = claim_next_job()
+        self.assertEqual(claimed.pk, older.pk)
+        self.assertEqual((claimed.status, claimed.attempts), ('RUNNING', 1))
+        self.assertEqual(claim_next_job().pk, newer.pk)
+        self.assertIsNone(claim_next_job())
+
+    def test_running_job_is_reclaimed_after_its_deadline(self):
+        job = self.make_job(self.orders)
+        claim_next_job()
+        self.assertIsNone(claim_next_job())
+        
+        RouteOptimizationJob.objects.filter(pk=job.pk).update(deadline_at=timezone.now() - timedelta(seconds=1))
+        reclaimed = claim_next_job()
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+
+    def test_worker_saves_the_route(self):
+        job = self.make_job(self.orders)
+        service = StubRouteService()
+        
+        with patch('logistics.jobs.RouteOptimizationService', return_value=service):
+            self.assertEqual(run_worker(once=True), 1)
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'SUCCEEDED')
+        self.assertEqual(sorted(job.route.orders.values_list('id', flat=True)), [order.id for order in self.orders])
+
+    def test_finished_jobs_are_announced_to_their_watchers(self):
+        job = self.make_job(self.orders)
+        
+        with patch('logistics.jobs.route_events') as events, self.captureOnCommitCallbacks(execute=True):
+            run_route_job(claim_next_job(), StubRouteService())
+        
+        job.refresh_from_db()
+        events.publish.assert_called_once_with(f'job:{job.id}', 'job', {
+            'job_id': str(job.id), 'status': 'SUCCEEDED', 'route': job.route_id, 'error': None,
+        })
+
+    def test_job_fails_after_max_attempts(self):
+        job = self.make_job(self.orders)
+        RouteOptimizationJob.objects.filter(pk=job.pk).update(
+            status='RUNNING', attempts=MAX_ATTEMPTS, deadline_at=timezone.now() - timedelta(seconds=1)
+        )
+        service = StubRouteService()
+        
+        with patch('logistics.jobs.RouteOptimizationService', return_value=service):
+            run_worker(once=True)
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIn('attempts', job.error)
+        self.assertEqual(service.calls, 0)
+
+    def test_reclaimed_job_is_not_saved_by_the_previous_worker(self):
+        self.make_job(self.orders)
+        stale = claim_next_job()
+        
+        # Another worker picks the job up after the deadline
+        RouteOptimizationJob.objects.filter(pk=stale.pk).update(attempts=2)
+        run_route_job(stale, StubRouteService())
+        
+        self.assertFalse(Route.objects.exists())
+        current = RouteOptimizationJob.objects.get(pk=stale.pk)
+        self.assertEqual((current.status, current.attempts, current.route), ('RUNNING', 2, None))
+
+
+class TrajectoryCompressionTests(SimpleTestCase):
+    def test_straight_line_keeps_only_endpoints(self):
+        latitudes = np.linspace(18.50, 18.60, 50)
+        longitudes = np.linspace(73.80, 73.90, 50)
+        self.assertEqual(douglas_peucker(latitudes, longitudes, 25).tolist(), [0, 49])
+
+    def test_corners_are_kept(self):
+        # East along a street, then north, with GPS jitter well under the tolerance
+        points = [[18.5, 73.8 + i * 0.001, i] for i in range(10)]
+        points += [[18.5 + i * 0.001, 73.809, 10 + i] for i in range(1, 10)]
+        points[3][0] += 0.00005
+        kept = simplify(points, 25)
+        self.assertEqual([point[2] for point in kept], [0, 9, 19])
+
+    def test_buffer_flushes_when_full(self):
+        buffer = TrackingBuffer(max_size=3, max_delay=60)
+        with patch.object(TrackingBuffer, 'flush') as flush:
+            buffer.add(1, 18.5, 73.8)
+            buffer.add(1, 18.6, 73.9)
+            flush.assert_not_called()
+            buffer.add(1, 18.7, 74.0)
+            flush.assert_called_once_with()
+
+    def test_buffer_waits_for_the_delay(self):
+        buffer = TrackingBuffer(max_size=10, max_delay=60)
+        buffer.add(1, 18.5, 73.8)
+        self.assertEqual(buffer.flush(force=False), 0)
+        self.assertEqual(len(buffer._pending), 1)
+
+
+@override_settings(LOGISTICS_ETA_MODEL_PATH='/nonexistent/speeds.npz', LOGISTICS_EVENT_CHANNEL_URL='')
+class TrackingFlushTests(TestCase):
+    def setUp(self):
+        transporter = User.objects.create_user(username='transporter', password='testpass123')
+        self.vehicle = Vehicle.objects.create(
+            transporter=transporter, vehicle_type='TRUCK', registration_number='MH12CD5678',
+            capacity_kg=1000, current_location='18.5,73.8'
+        )
+        self.route = Route.objects.create(
+            vehicle=self.vehicle,
+            start_location='18.5,73.8',
+            end_location='18.5,73.8',
+            estimated_distance_km=20,
+            estimated_duration_mins=60,
+            status='IN_PROGRESS',
+            route_data=[
+                {'location': '18.5,73.8', 'latitude': 18.5, 'longitude': 73.8, 'distance': 10000},
+                {'location': '18.5,73.9', 'latitude': 18.5, 'longitude': 73.9, 'distance': 10000},
+            ]
+        )
+        self.buffer = TrackingBuffer(max_size=100, max_delay=60)
+        self.start = datetime(2024, 5, 1, 8, tzinfo=dt_timezone.utc)
+
+    def add_fixes(self, minutes):
+        # Heading east along one street, one fix a minute
+        for minute in minutes:
+            self.buffer.add(
+                self.route.id, 18.5, 73.8 + minute * 0.001,
+                timestamp=self.start + timedelta(minutes=minute), temperature=4.0
+            )
+
+    def trajectory(self):
+        return RouteTrajectory.objects.get(route=self.route)
+
+    def test_flush_writes_fixes_and_extends_the_trajectory(self):
+        self.add_fixes(range(10))
+        self.assertEqual(self.buffer.flush(), 10)
+        
+        self.assertEqual(DeliveryTracking.objects.filter(route=self.route).count(), 10)
+        self.assertEqual(self.trajectory().raw_count, 10)
+        self.assertEqual(len(self.trajectory().points), 2)  # A straight line keeps its ends
+        
+        self.add_fixes(range(10, 20))
+        self.assertEqual(self.buffer.flush(), 10)
+        
+        trajectory = self.trajectory()
+        self.assertEqual(trajectory.raw_count, 20)
+        # Extended from the previous end point rather than rebuilt
+        self.assertEqual([point[2] for point in trajectory.points],
+                         [(self.start + timedelta(minutes=minute)).timestamp() for minute in (0, 9, 19)])
+        self.route.refresh_from_db()
+        self.assertEqual(self.route.eta_data['updated_at'], trajectory.points[-1][2])
+
+    def test_late_fixes_rebuild_the_trajectory_in_time_order(self):
+        self.add_fixes(range(5, 10))
+        self.buffer.flush()
+        
+        # A backlog from before the stored trajectory, heading north
+        for minute in range(5):
+            self.buffer.add(self.route.id, 18.45 + minute * 0.01, 73.8, timestamp=self.start + timedelta(minutes=minute))
+        self.buffer.flush()
+        
+        trajectory = self.trajectory()
+        timestamps = [point[2] for point in trajectory.points]
+        self.assertEqual(trajectory.raw_count, 10)
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(timestamps[0], self.start.timestamp())
+
+    def test_only_the_latest_vehicle_position_is_written(self):
+        self.buffer.move_vehicle(self.vehicle.id, 18.51, 73.81, self.start + timedelta(minutes=2))
+        self.buffer.move_vehicle(self.vehicle.id, 18.50, 73.80, self.start)
+        self.assertFalse(Vehicle.objects.filter(latitude__isnull=False).exists())
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.vehicle.refresh_from_db()
+        self.assertEqual((self.vehicle.latitude, self.vehicle.longitude), (18.51, 73.81))
+        self.assertEqual(self.vehicle.location_updated_at, self.start + timedelta(minutes=2))
+
+    def test_a_failing_route_does_not_drop_the_other_routes_fixes(self):
+        other = Route.objects.create(
+            vehicle=self.vehicle, start_location='18.5,73.8', end_location='18.5,73.8',
+            estimated_distance_km=20, estimated_duration_mins=60, route_data=[]
+        )
+        self.add_fixes(range(3))
+        self.buffer.add(other.id, 18.5, 73.8, timestamp=self.start)
+        bulk_create = DeliveryTracking.objects.bulk_create
+        
+        def fail_for_other(fixes):
+            if fixes[0].route_id == other.id:
+                raise IntegrityError('route is gone')
+            return bulk_create(fixes)
+        
+        with patch.object(DeliveryTracking.objects, 'bulk_create', side_effect=fail_for_other):
+            self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(DeliveryTracking.objects.filter(route=self.route).count(), 3)
+        self.assertEqual(self.trajectory().raw_count, 3)
+
+    def test_unwritten_vehicle_positions_are_kept_for_the_next_flush(self):
+        self.buffer.move_vehicle(self.vehicle.id, 18.51, 73.81, self.start)
+        with patch.object(Vehicle.objects, 'bulk_update', side_effect=OperationalError('db is down')):
+            self.buffer.flush()
+        
+        self.buffer.flush()
+        self.vehicle.refresh_from_db()
+        self.assertEqual((self.vehicle.latitude, self.vehicle.longitude), (18.51, 73.81))
+
+
+class VehicleIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.index = VehicleIndex(cell_km=5, max_age=60)
+        self.vehicles = [
+            Vehicle(id=i + 1, vehicle_type=['TRUCK', 'PICKUP'][i % 2], capacity_kg=[500, 2000][i % 3 == 0],
+                    is_available=True, latitude=lat, longitude=lng)
+            for i, (lat, lng) in enumerate(zip(rng.uniform(18.0, 19.0, 2000), rng.uniform(73.0, 74.0, 2000)))
+        ]
+        for vehicle in self.vehicles:
+            self.index.update(vehicle)
+
+    def brute_force(self, latitude, longitude, k, vehicle_type=None, min_capacity_kg=0, radius_km=50):
+        candidates = [v for v in self.vehicles if v.is_available
+                      and (vehicle_type is None or v.vehicle_type == vehicle_type)
+                      and v.capacity_kg >= min_capacity_kg]
+        km = distances_km(latitude, longitude, [v.latitude for v in candidates], [v.longitude for v in candidates])
+        return sorted((d, v.id) for v, d in zip(candidates, km) if d <= radius_km)[:k]
+
+    def test_matches_brute_force(self):
+        for latitude, longitude in [(18.52, 73.86), (18.01, 73.99), (19.3, 72.8)]:
+            expected = self.brute_force(latitude, longitude, 5, 'TRUCK', 1000, radius_km=30)
+            found = self.index.nearest(latitude, longitude, 5, 'TRUCK', 1000, radius_km=30)
+            self.assertEqual([vehicle_id for vehicle_id, _ in found], [vehicle_id for _, vehicle_id in expected])
+
+    def test_moves_and_availability_are_applied(self):
+        vehicle = self.vehicles[0]
+        self.index.move(vehicle.id, 12.97, 77.59)
+        self.assertEqual(self.index.nearest(12.97, 77.59, 3)[0][0], vehicle.id)
+        
+        vehicle.is_available = False
+        self.index.update(vehicle)
+        self.assertEqual(self.index.nearest(12.97, 77.59, 3), [])
+        self.assertEqual(len(self.index), len(self.vehicles) - 1)
+
+    def test_invalid_queries_are_rejected(self):
+        for latitude, longitude, radius_km in [
+            (float('nan'), 73.8, None), (18.5, float('inf'), None), (95.0, 73.8, None),
+            (18.5, 73.8, float('nan')), (18.5, 73.8, -1),
+        ]:
+            with self.assertRaises(ValueError):
+                self.index.nearest(latitude, longitude, radius_km=radius_km)
+
+    @override_settings(LOGISTICS_VEHICLE_SEARCH_RADIUS_KM=50)
+    def test_radius_is_capped_by_the_setting(self):
+        index = VehicleIndex(cell_km=5, max_age=60)
+        index.update(Vehicle(id=1, vehicle_type='TRUCK', capacity_kg=500, is_available=True,
+                             latitude=18.5, longitude=74.5))
+        
+        # No matching type, so every ring up to the radius is walked
+        self.assertEqual(index.nearest(18.5, 73.8, 5, vehicle_type='X', radius_km=20000), [])
+        self.assertEqual(index.nearest(18.5, 73.8, 5, radius_km=20000), [])
+        self.assertEqual([match[0] for match in index.nearest(18.5, 74.1)], [1])
+
+    def test_search_can_be_limited_to_one_transporter(self):
+        index = VehicleIndex(cell_km=5, max_age=60)
+        for vehicle_id, transporter_id, longitude in [(1, 7, 73.81), (2, 8, 73.80), (3, 7, 73.85)]:
+            index.update(Vehicle(id=vehicle_id, transporter_id=transporter_id, vehicle_type='TRUCK',
+                                 capacity_kg=500, is_available=True, latitude=18.5, longitude=longitude))
+        
+        self.assertEqual([match[0] for match in index.nearest(18.5, 73.8, 5, transporter_id=7)], [1, 3])
+        self.assertEqual([match[0] for match in index.nearest(18.5, 73.8, 5)], [2, 1, 3])
+
+
+@override_settings(LOGISTICS_ETA_STOP_MINUTES=10, LOGISTICS_ETA_ARRIVAL_RADIUS_M=300, TIME_ZONE='UTC')
+class EtaEngineTests(SimpleTestCase):
+    def setUp(self):
+        # 10 m/s everywhere, except 5 m/s in the cell around Pune from 08:00 to 09:00
+        table = SpeedTable.empty(cell_km=10)
+        table.hourly = np.full(24, 10.0, dtype=np.float32)
+        pune = table.cell_keys([18.52], [73.86])
+        speeds = np.full((1, 24), 10.0, dtype=np.float32)
+        speeds[0, 8] = 5.0
+        table.keys, table.speeds = pune, speeds
+        self.engine = EtaEngine(path='/nonexistent/speeds.npz')
+        self.engine._table = (None, table)
+        self.stops = [
+            {'location': 'Pune', 'latitude': 18.52, 'longitude': 73.86, 'distance': 18000},
+            {'location': 'Chakan', 'latitude': 18.76, 'longitude': 73.86, 'distance': 36000},
+            {'location': 'Shirur', 'latitude': 18.83, 'longitude': 74.37, 'distance': 60000},
+        ]
+
+    def test_speed_depends_on_cell_and_hour(self):
+        profiles = self.engine.table().profiles([18.52, 18.83, np.nan], [73.86, 74.37, np.nan])
+        self.assertEqual(profiles[:, 8].tolist(), [5.0, 10.0, 10.0])
+        self.assertEqual(profiles[:, 12].tolist(), [10.0, 10.0, 10.0])
+
+    def test_route_duration(self):
+        noon = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        morning = datetime(2024, 1, 1, 8, tzinfo=dt_timezone.utc)
+        # Two legs at 10 m/s and two 10 minute stops
+        self.assertEqual(self.engine.route_seconds(self.stops, noon), 1800 + 3600 + 1200)
+        # Leaving Pune in the slow hour doubles the first leg
+        self.assertEqual(self.engine.route_seconds(self.stops, morning), 3600 + 3600 + 1200)
+
+    def test_live_progress(self):
+        route = Route(route_data=self.stops, eta_data={})
+        at = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        eta = self.engine.update_route(route, 18.60, 73.86, at)
+        self.assertEqual(eta['next_stop'], 1)
+        self.assertGreater(eta['arrivals'][1], at.timestamp())
+        
+        # A fix at Chakan marks it reached and leaves one leg plus its handling time
+        at = datetime(2024, 1, 1, 12, 30, tzinfo=dt_timezone.utc)
+        eta = self.engine.update_route(route, 18.7605, 73.8601, at)
+        self.assertEqual(eta['next_stop'], 2)
+        self.assertEqual(eta['arrivals'][1], at.timestamp())
+        self.assertGreater(eta['remaining_seconds'], 3600 + 600)
+
+
+class RouteEventBrokerTests(SimpleTestCase):
+    def setUp(self):
+        self.broker = RouteEventBroker(url='', queue_size=2)
+
+    def test_events_reach_only_the_route_subscribers(self):
+        async def watch():
+            first, other = self.broker.listen(1, heartbeat=1), self.broker.listen(2, heartbeat=0.05)
+            pending = asyncio.ensure_future(first.__anext__())
+            await asyncio.sleep(0)
+            self.assertEqual(await other.__anext__(), None)  # Heartbeat, nothing for route 2
+            
+            self.broker.publish(1, 'status', {'status': 'IN_PROGRESS'})
+            event = await pending
+            await first.aclose()
+            await other.aclose()
+            return event
+        
+        event = asyncio.run(watch())
+        self.assertEqual(event, {'route': 1, 'event': 'status', 'data': {'status': 'IN_PROGRESS'}})
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    def test_slow_subscribers_drop_the_oldest_events(self):
+        async def watch():
+            events = self.broker.listen(1)
+            pending = asyncio.ensure_future(events.__anext__())
+            await asyncio.sleep(0)
+            for number in range(4):
+                self.broker.publish(1, 'tracking', {'number': number})
+            # Deliveries scheduled by publish all run before the reader wakes up
+            await asyncio.sleep(0)
+            received = [await pending, await events.__anext__()]
+            await events.aclose()
+            return [event['data']['number'] for event in received]
+        
+        self.assertEqual(asyncio.run(watch()), [2, 3])
+
+    def test_events_published_after_subscribing_are_kept_for_the_listener(self):
+        async def watch():
+            queue = self.broker.subscribe(1)
+            # Published while the snapshot is being read, before listening starts
+            self.broker.publish(1, 'status', {'status': 'COMPLETED'})
+            await asyncio.sleep(0)
+            events = self.broker.listen(1, heartbeat=1, queue=queue)
+            event = await events.__anext__()
+            self.assertEqual(self.broker.subscriber_count(1), 1)
+            await events.aclose()
+            return event
+        
+        self.assertEqual(asyncio.run(watch())['data'], {'status': 'COMPLETED'})
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    def test_unsubscribe_without_listening(self):
+        async def subscribe_and_leave():
+            queue = self.broker.subscribe(1)
+            self.broker.unsubscribe(1, queue)
+        
+        asyncio.run(subscribe_and_leave())
+        self.assertEqual(self.broker.subscriber_count(), 0)
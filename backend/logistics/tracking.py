@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .eta import update_route_eta
+from .events import route_events
+from .models import DeliveryTracking, RouteTrajectory, Vehicle
+from .providers import EARTH_RADIUS_M
+
+logger = logging.getLogger(__name__)
+
+
+def tolerance_m():
+    return getattr(settings, 'LOGISTICS_TRAJECTORY_TOLERANCE_M', 25.0)
+
+
+def douglas_peucker(latitudes, longitudes, tolerance):
+    """Indices of the points kept by Douglas-Peucker simplification
+
+    Coordinates are projected onto a local plane in meters, which is accurate
+    at the scale of one trip. The first and last points are always kept.
+    """
+    count = len(latitudes)
+    if count <= 2:
+        return np.arange(count)
+
+    lat0 = np.radians(np.mean(latitudes))
+    x = np.radians(longitudes) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(latitudes) * EARTH_RADIUS_M
+
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        # Distance of every inner point to the start-end segment
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            distances = np.hypot(px, py)
+        else:
+            t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0)
+            distances = np.hypot(px - t * dx, py - t * dy)
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def simplify(points, tolerance):
+    """Simplify [[lat, lng, ts], ...] points"""
+    if len(points) <= 2:
+        return [list(point) for point in points]
+    array = np.asarray(points, dtype=float)
+    return [points[i] for i in douglas_peucker(array[:, 0], array[:, 1], tolerance)]
+
+
+def _trajectory_points(fixes):
+    return [
+        [float(fix.latitude), float(fix.longitude), fix.timestamp.timestamp()]
+        for fix in fixes
+    ]
+
+
+def rebuild_trajectory(route_id, tolerance=None):
+    """Recompute a route's trajectory from all of its raw fixes"""
+    tolerance = tolerance or tolerance_m()
+    fixes = DeliveryTracking.objects.filter(route_id=route_id).order_by('timestamp').only(
+        'latitude', 'longitude', 'timestamp'
+    )
+    points = _trajectory_points(fixes)
+    trajectory, _ = RouteTrajectory.objects.update_or_create(
+        route_id=route_id,
+        defaults={
+            'tolerance_m': tolerance,
+            'points': simplify(points, tolerance),
+            'raw_count': len(points),
+        }
+    )
+    return trajectory
+
+
+def extend_trajectory(route_id, fixes, tolerance=None):
+    """Append newly written fixes to a route's simplified trajectory
+
+    Only the new fixes are simplified, anchored at the last kept point, so
+    the cost of a flush does not grow with the length of the trip. Fixes
+    older than the end of the trajectory, e.g. from a device that reconnects
+    with a backlog, are merged by a rebuild instead.
+    """
+    tolerance = tolerance or tolerance_m()
+    new_points = _trajectory_points(sorted(fixes, key=lambda fix: fix.timestamp))
+    with transaction.atomic():
+        trajectory = RouteTrajectory.objects.select_for_update().filter(route_id=route_id).first()
+        if (trajectory is None or trajectory.tolerance_m != tolerance
+                or not trajectory.points or new_points[0][2] < trajectory.points[-1][2]):
+            # First flush of the route, a new tolerance or late fixes, start from every raw fix
+            return rebuild_trajectory(route_id, tolerance)
+
+        anchor = trajectory.points[-1:]
+        trajectory.points = trajectory.points[:-1] + simplify(anchor + new_points, tolerance)
+        trajectory.raw_count += len(new_points)
+        trajectory.save()
+    return trajectory
+
+
+class TrackingBuffer:
+    """Collects GPS fixes and writes them in bulk
+
+    Fixes are flushed once ``max_size`` are waiting or the oldest has waited
+    ``max_delay`` seconds, checked on every add and by a background thread.
+    Each flush also extends the routes' simplified trajectories, refreshes
+    their live ETAs from the latest fix and pushes the new points to the
+    routes' live watchers. Vehicle positions are buffered alongside, and
+    only the latest one of each vehicle is written.
+    """
+
+    def __init__(self, max_size=None, max_delay=None):
+        self.max_size = max_size or getattr(settings, 'LOGISTICS_TRACKING_BUFFER_SIZE', 200)
+        self.max_delay = max_delay or getattr(settings, 'LOGISTICS_TRACKING_FLUSH_SECONDS', 5)
+        self._pending = []
+        self._positions = {}  # vehicle_id -> (latitude, longitude, timestamp)
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def add(self, route_id, latitude, longitude, timestamp=None, **fields):
+        fix = DeliveryTracking(
+            route_id=route_id,
+            location=f"{latitude},{longitude}",
+            latitude=latitude,
+            longitude=longitude,
+            timestamp=timestamp or datetime.now(dt_timezone.utc),
+            **fields
+        )
+        with self._lock:
+            self._pending.append(fix)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = len(self._pending) >= self.max_size
+        if due:
+            self.flush()
+
+    def move_vehicle(self, vehicle_id, latitude, longitude, timestamp=None):
+        """Record a vehicle's position, written with the next flush"""
+        timestamp = timestamp or datetime.now(dt_timezone.utc)
+        with self._lock:
+            previous = self._positions.get(vehicle_id)
+            if previous is None or previous[2] <= timestamp:
+                self._positions[vehicle_id] = (latitude, longitude, timestamp)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _take(self, force):
+        with self._lock:
+            if not self._pending and not self._positions:
+                return [], {}
+            if not force and time.monotonic() - self._oldest < self.max_delay:
+                return [], {}
+            pending, self._pending, self._oldest = self._pending, [], None
+            positions, self._positions = self._positions, {}
+            return pending, positions
+
+    def _restore_positions(self, positions):
+        # Put back positions that could not be written, unless a newer one arrived
+        with self._lock:
+            for vehicle_id, position in positions.items():
+                newer = self._positions.get(vehicle_id)
+                if newer is None or newer[2] < position[2]:
+                    self._positions[vehicle_id] = position
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+    def _write_positions(self, positions):
+        try:
+            Vehicle.objects.bulk_update([
+                Vehicle(id=vehicle_id, latitude=latitude, longitude=longitude, location_updated_at=timestamp)
+                for vehicle_id, (latitude, longitude, timestamp) in positions.items()
+            ], ['latitude', 'longitude', 'location_updated_at'])
+        except Exception:
+            logger.exception('Could not write %s vehicle positions', len(positions))
+            self._restore_positions(positions)
+
+    def flush(self, force=True):
+        """Write the buffered fixes and positions, returning how many fixes were written"""
+        fixes, positions = self._take(force)
+        if positions:
+            self._write_positions(positions)
+        if not fixes:
+            return 0
+
+        by_route = {}
+        for fix in fixes:
+            by_route.setdefault(fix.route_id, []).append(fix)
+        written = 0
+        for route_id, route_fixes in by_route.items():
+            route_fixes.sort(key=lambda fix: fix.timestamp)
+            # Each route is written on its own so a bad route id only drops its own fixes
+            try:
+                with transaction.atomic():
+                    DeliveryTracking.objects.bulk_create(route_fixes)
+            except Exception:
+                logger.exception('Could not store %s fixes of route %s', len(route_fixes), route_id)
+                continue
+            written += len(route_fixes)
+
+            try:
+                with transaction.atomic():
+                    extend_trajectory(route_id, route_fixes)
+                    eta = update_route_eta(route_id, route_fixes[-1])
+            except Exception:
+                # The raw fixes are stored, a later rebuild recovers the trajectory
+                logger.exception('Could not update trajectory of route %s', route_id)
+                continue
+            route_events.publish(route_id, 'tracking', {
+                'points': _trajectory_points(route_fixes),
+                'temperature': route_fixes[-1].temperature,
+                'humidity': route_fixes[-1].humidity,
+                'eta': eta,
+            })
+        return written
+
+    def _run(self):
+        while not self._stopped.wait(self.max_delay / 2):
+            close_old_connections()
+            try:
+                self.flush(force=False)
+            except Exception:
+                # Keep flushing on the timer after an unexpected error
+                logger.exception('Tracking buffer flush failed')
+
+    def start(self):
+        """Flush overdue fixes from a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='tracking-buffer')
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+tracking_buffer = TrackingBuffer()
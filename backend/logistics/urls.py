@@ -11,6 +11,14 @@ router.register(r'tracking', views.TrackingViewSet)
 urlpatterns = [
 	path('', include(router.urls)),
 	path('optimize-route/', views.optimize_route),
+	path('optimize-fleet/', views.FleetOptimizationView.as_view()),
+	path('route-jobs/<uuid:job_id>/', views.RouteOptimizationJobView.as_view()),
+	path('route-jobs/<uuid:job_id>/events/', views.route_job_events_stream),
+	path('routes/<int:route_id>/reoptimize/', views.RouteReoptimizationView.as_view()),
+	path('routes/<int:route_id>/eta/', views.RouteEtaView.as_view()),
+	path('routes/<int:route_id>/events/', views.route_events_stream),
 	path('track-delivery/<str:tracking_id>/', views.track_delivery),
 	path('vehicle-status/<int:vehicle_id>/', views.vehicle_status),
+	path('nearest-vehicles/', views.NearestVehiclesView.as_view()),
+	path('distance-cache-stats/', views.DistanceCacheStatsView.as_view()),
 ]
\ No newline at end of file
@@ -1,14 +1,34 @@
-from rest_framework import viewsets, views, status
+import json
+from rest_framework import viewsets, views, status, permissions, exceptions
 from rest_framework.decorators import action
+from rest_framework.request import Request
 from rest_framework.response import Response
-from .models import Vehicle, Route, DeliveryTracking
+from rest_framework.settings import api_settings
+from asgiref.sync import sync_to_async
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from marketplace.models import Order
+from .models import Vehicle, Route, DeliveryTracking, RouteOptimizationJob, RouteTrajectory
 from .serializers import (
     VehicleSerializer, RouteSerializer, 
     DeliveryTrackingSerializer, RouteOptimizationRequestSerializer
 )
+from .distances import distance_cache
+from .eta import eta_engine
+from .events import route_events
+from .jobs import job_event, job_events_key, submit_route_job
 from .services import RouteOptimizationService
+from .spatial import find_nearest_vehicles, vehicle_index
 from .permissions import IsTransporter
 
+# Most vehicles a nearest vehicle lookup returns
+MAX_NEAREST_VEHICLES = 50
+
 class VehicleViewSet(viewsets.ModelViewSet):
     serializer_class = VehicleSerializer
     permission_classes = [IsTransporter]
@@ -17,7 +37,87 @@ class VehicleViewSet(viewsets.ModelViewSet):
         return Vehicle.objects.filter(transporter=self.request.user)
     
     def perform_create(self, serializer):
-        serializer.save(transporter=self.request.user)
+        vehicle = serializer.save(transporter=self.request.user)
+        vehicle_index.update(vehicle)
+    
+    def perform_update(self, serializer):
+        vehicle_index.update(serializer.save())
+    
+    def perform_destroy(self, instance):
+        vehicle_index.remove(instance.id)
+        instance.delete()
+
+class NearestVehiclesView(views.APIView):
+    permission_classes = [IsTransporter]
+    
+    def get(self, request):
+        """Nearest available vehicles of the transporter's fleet to a point
+        
+        Results carry registration numbers and live positions, so other
+        users' fleets are never searched.
+        """
+        params = request.query_params
+        try:
+            latitude = float(params['lat'])
+            longitude = float(params['lng'])
+            k = max(1, min(int(params.get('k', 5)), MAX_NEAREST_VEHICLES))
+            min_capacity_kg = float(params['min_capacity_kg']) if params.get('min_capacity_kg') else None
+            radius_km = float(params['radius_km']) if params.get('radius_km') else None
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'lat and lng are required, k, min_capacity_kg and radius_km must be numbers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            matches = find_nearest_vehicles(
+                latitude, longitude, k,
+                vehicle_type=params.get('type') or None,
+                min_capacity_kg=min_capacity_kg,
+                radius_km=radius_km,
+                transporter_id=request.user.id
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        vehicles = Vehicle.objects.in_bulk([vehicle_id for vehicle_id, _ in matches])
+        
+        return Response([
+            {
+                'id': vehicle_id,
+                'registration_number': vehicles[vehicle_id].registration_number,
+                'vehicle_type': vehicles[vehicle_id].vehicle_type,
+                'capacity_kg': vehicles[vehicle_id].capacity_kg,
+                'latitude': vehicles[vehicle_id].latitude,
+                'longitude': vehicles[vehicle_id].longitude,
+                'distance_km': round(distance, 3),
+            }
+            for vehicle_id, distance in matches
+            if vehicle_id in vehicles
+        ])
+
+def _int_ids(value):
+    """Ids from a JSON list of integers or integer strings, None when malformed"""
+    if not isinstance(value, list):
+        return None
+    ids = []
+    for item in value:
+        if isinstance(item, bool) or not isinstance(item, (int, str)):
+            return None
+        try:
+            ids.append(int(item))
+        except ValueError:
+            return None
+    return ids
+
+def _job_payload(job):
+    return {
+        'job_id': str(job.id),
+        'status': job.status,
+        'route': RouteSerializer(job.route).data if job.route else None,
+        'error': job.error or None,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
 
 class RouteOptimizationView(views.APIView):
     def post(self, request):
@@ -33,21 +133,29 @@ class RouteOptimizationView(views.APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            # Large solves go to the job queue, the client follows the job for the route
+            if str(request.data.get('async', '')).lower() in ('1', 'true'):
+                try:
+                    job, created = submit_route_job(
+                        vehicle, orders, request.data.get('time_budget_seconds')
+                    )
+                except (TypeError, ValueError):
+                    return Response(
+                        {'error': 'time_budget_seconds must be an integer'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                return Response(
+                    dict(_job_payload(job), deduplicated=not created),
+                    status=status.HTTP_202_ACCEPTED
+                )
+            
             # Optimize route
             optimization_service = RouteOptimizationService()
             optimized_route = optimization_service.optimize_route(orders, vehicle)
             
             if optimized_route:
                 # Create route record
-                route = Route.objects.create(
-                    vehicle=vehicle,
-                    start_location=vehicle.current_location,
-                    end_location=optimized_route[-1]['location'],
-                    estimated_distance_km=sum(r['distance'] for r in optimized_route) / 1000,
-                    estimated_duration_mins=len(optimized_route) * 30,  # Rough estimate
-                    route_data=optimized_route
-                )
-                route.orders.set(orders)
+                route = optimization_service.save_route(vehicle, orders, optimized_route)
                 
                 return Response(RouteSerializer(route).data)
             
@@ -58,6 +166,300 @@ class RouteOptimizationView(views.APIView):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class RouteOptimizationJobView(views.APIView):
+    permission_classes = [IsTransporter]
+    
+    def get(self, request, job_id):
+        """Current job status and route, the job's event stream announces when it finishes"""
+        job = RouteOptimizationJob.objects.select_related('route').filter(
+            id=job_id, vehicle__transporter=request.user
+        ).first()
+        if job is None:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response(_job_payload(job))
+
+class FleetOptimizationView(views.APIView):
+    permission_classes = [IsTransporter]
+    
+    def post(self, request):
+        """Plan routes for a set of orders across all of the transporter's available vehicles"""
+        order_ids = _int_ids(request.data.get('order_ids'))
+        if not order_ids:
+            return Response(
+                {'error': 'order_ids must be a non-empty list of integer ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        orders = list(Order.objects.filter(
+            id__in=order_ids,
+            status__in=['PENDING', 'CONFIRMED']
+        ).select_related('listing'))
+        missing = sorted(set(order_ids) - {order.id for order in orders})
+        if missing:
+            return Response(
+                {'error': f'Orders not found or not pending: {missing}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        vehicles = Vehicle.objects.filter(transporter=request.user, is_available=True)
+        vehicle_ids = _int_ids(request.data.get('vehicle_ids') or [])
+        if vehicle_ids is None:
+            return Response(
+                {'error': 'vehicle_ids must be a list of integer ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if vehicle_ids:
+            vehicles = vehicles.filter(id__in=vehicle_ids)
+        vehicles = [vehicle for vehicle in vehicles if vehicle.current_location]
+        if not vehicles:
+            return Response(
+                {'error': 'No available vehicles with a known location'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        service = RouteOptimizationService()
+        plan = service.optimize_fleet(orders, vehicles)
+        if plan is None:
+            return Response(
+                {'error': 'Could not optimize routes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # One route per vehicle that received orders, each returning to
+        # where the vehicle started, which the stop distances already include
+        routes = []
+        with transaction.atomic():
+            for vehicle, route_orders, stops in plan['routes']:
+                route = Route.objects.create(
+                    vehicle=vehicle,
+                    start_location=vehicle.current_location,
+                    end_location=vehicle.current_location,
+                    estimated_distance_km=sum(stop['distance'] for stop in stops) / 1000,
+                    estimated_duration_mins=service.estimate_duration_mins(stops),
+                    route_data=stops
+                )
+                route.orders.set(route_orders)
+                routes.append(route)
+        
+        return Response({
+            'routes': RouteSerializer(routes, many=True).data,
+            'unassigned_order_ids': [order.id for order in plan['unassigned']],
+        })
+
+class RouteReoptimizationView(views.APIView):
+    permission_classes = [IsTransporter]
+    
+    def post(self, request, route_id):
+        """Add or cancel orders on a pending route and re-sequence it from its current plan"""
+        try:
+            route = Route.objects.select_related('vehicle').get(
+                id=route_id, vehicle__transporter=request.user
+            )
+        except Route.DoesNotExist:
+            return Response({'error': 'Route not found'}, status=status.HTTP_404_NOT_FOUND)
+        if route.status != 'PENDING':
+            return Response(
+                {'error': 'Only pending routes can be re-optimized'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        add_ids = _int_ids(request.data.get('add_order_ids') or [])
+        remove_ids = _int_ids(request.data.get('remove_order_ids') or [])
+        if add_ids is None or remove_ids is None:
+            return Response(
+                {'error': 'add_order_ids and remove_order_ids must be lists of integer ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        add_orders = list(Order.objects.filter(
+            id__in=add_ids, status__in=['PENDING', 'CONFIRMED']
+        ).select_related('listing'))
+        if len(add_orders) != len(set(add_ids)):
+            return Response(
+                {'error': 'Some orders to add were not found or are not pending'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        remove_orders = list(route.orders.filter(id__in=remove_ids))
+        
+        service = RouteOptimizationService()
+        try:
+            stops = service.reoptimize_route(route, add_orders, remove_orders)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if stops is None:
+            return Response(
+                {'error': 'Could not optimize route'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        with transaction.atomic():
+            if stops:
+                service.replace_stops(route, stops)
+            else:
+                # Every order was cancelled
+                route.status = 'CANCELLED'
+            route.save()
+            route.orders.set([stop['order_id'] for stop in stops if 'order_id' in stop])
+        
+        return Response(RouteSerializer(route).data)
+
+class RouteEtaView(views.APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, route_id):
+        """Predicted arrival at every stop, live once the vehicle reports GPS fixes"""
+        route = Route.objects.filter(
+            Q(vehicle__transporter=request.user) | Q(orders__buyer=request.user),
+            id=route_id
+        ).distinct().first()
+        if route is None:
+            return Response({'error': 'Route not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        stops = route.route_data or []
+        eta = route.eta_data or {}
+        if eta:
+            arrivals = eta['arrivals']
+            completion = eta['completion']
+        else:
+            # No fix yet, plan from the start time or from now
+            departure = route.actual_start_time or timezone.now()
+            arrivals = [departure.timestamp()] + eta_engine.schedule(stops, departure)
+            completion = departure.timestamp() + eta_engine.route_seconds(stops, departure)
+        
+        def as_datetime(value):
+            return datetime.fromtimestamp(value, dt_timezone.utc) if value is not None else None
+        
+        return Response({
+            'route': route.id,
+            'status': route.status,
+            'next_stop': eta.get('next_stop'),
+            'stops': [
+                {
+                    'location': stop['location'],
+                    'order_id': stop.get('order_id'),
+                    'eta': as_datetime(arrival),
+                }
+                for stop, arrival in zip(stops[1:], arrivals[1:])
+            ],
+            'completion': as_datetime(completion),
+            'remaining_seconds': eta.get('remaining_seconds'),
+            'updated_at': as_datetime(eta.get('updated_at')),
+        })
+
+def _authenticate(request):
+    """User from the API authenticators, for views outside DRF"""
+    drf_request = Request(request, authenticators=[
+        authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        user = drf_request.user
+    except exceptions.AuthenticationFailed:
+        return None
+    return user if user and user.is_authenticated else None
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+async def route_events_stream(request, route_id):
+    """Server-sent events with the new tracking points and status changes of a route
+    
+    Opens with a snapshot of the route, then relays what the route event
+    broker receives, so watchers cost no database queries after connecting.
+    Serve under ASGI so each watcher holds a queue instead of a thread.
+    """
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    # Subscribe before reading the snapshot so no event falls in between
+    queue = route_events.subscribe(route_id)
+    try:
+        route = await Route.objects.filter(
+            Q(vehicle__transporter=user) | Q(orders__buyer=user),
+            id=route_id
+        ).distinct().afirst()
+        points = None
+        if route is not None:
+            points = await RouteTrajectory.objects.filter(route_id=route.id).values_list('points', flat=True).afirst()
+    except BaseException:
+        route_events.unsubscribe(route_id, queue)
+        raise
+    if route is None:
+        route_events.unsubscribe(route_id, queue)
+        return JsonResponse({'error': 'Route not found'}, status=status.HTTP_404_NOT_FOUND)
+    snapshot = {
+        'status': route.status,
+        'points': points or [],
+        'eta': route.eta_data or None,
+    }
+    heartbeat = getattr(settings, 'LOGISTICS_STREAM_HEARTBEAT_SECONDS', 15)
+    
+    async def stream():
+        yield 'retry: 5000\n\n'
+        yield _sse('snapshot', snapshot)
+        async for event in route_events.listen(route.id, heartbeat, queue):
+            if event is None:
+                # Comment line keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+            else:
+                yield _sse(event['event'], event['data'])
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+async def route_job_events_stream(request, job_id):
+    """Server-sent events with the state of a route optimization job until it finishes
+    
+    Opens with the job's current state and closes after the event that
+    reports it finished, which carries the id of the resulting route.
+    """
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+    
+    # Subscribe before reading the job so its completion cannot be missed
+    key = job_events_key(job_id)
+    queue = route_events.subscribe(key)
+    try:
+        job = await RouteOptimizationJob.objects.filter(
+            id=job_id, vehicle__transporter=user
+        ).afirst()
+    except BaseException:
+        route_events.unsubscribe(key, queue)
+        raise
+    if job is None:
+        route_events.unsubscribe(key, queue)
+        return JsonResponse({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    heartbeat = getattr(settings, 'LOGISTICS_STREAM_HEARTBEAT_SECONDS', 15)
+    
+    async def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            yield _sse('job', job_event(job))
+            if job.status in RouteOptimizationJob.ACTIVE_STATUSES:
+                async for event in route_events.listen(key, heartbeat, queue):
+                    if event is None:
+                        yield ': keep-alive\n\n'
+                    else:
+                        yield _sse(event['event'], event['data'])
+                        break
+        finally:
+            route_events.unsubscribe(key, queue)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class DistanceCacheStatsView(views.APIView):
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        """Hit ratio of the shared distance cache across all workers"""
+        return Response(distance_cache.stats())
+
 class DeliveryTrackingViewSet(viewsets.ModelViewSet):
     serializer_class = DeliveryTrackingSerializer
     permission_classes = [IsTransporter]
@@ -65,4 +467,37 @@ class DeliveryTrackingViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return DeliveryTracking.objects.filter(
             route__vehicle__transporter=self.request.user
-        ) 
\ No newline at end of file
+        )
+    
+    def list(self, request, *args, **kwargs):
+        """Simplified trajectories per route, raw fixes only with ?raw=true"""
+        if request.query_params.get('raw', '').lower() in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+        
+        trajectories = RouteTrajectory.objects.filter(
+            route__vehicle__transporter=request.user
+        ).order_by('-updated_at')
+        route_id = request.query_params.get('route')
+        if route_id:
+            try:
+                trajectories = trajectories.filter(route_id=int(route_id))
+            except ValueError:
+                return Response(
+                    {'error': 'route must be an integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        page = self.paginate_queryset(trajectories)
+        data = [
+            {
+                'route': trajectory.route_id,
+                'tolerance_m': trajectory.tolerance_m,
+                'raw_count': trajectory.raw_count,
+                'points': trajectory.points,
+                'updated_at': trajectory.updated_at,
+            }
+            for trajectory in (trajectories if page is None else page)
+        ]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data) 
\ No newline at end of file
@@ -62,5 +62,10 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['listing', 'created_at']),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.listing.product.name}" 
\ No newline at end of file